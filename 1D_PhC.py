@@ -1,7 +1,9 @@
 import gdsfactory as gf
 from gdsfactory.component import Component
-from gdsfactory.components.circle import circle
 from gdsfactory.components.taper import taper as taper_fn
+from param_sweep import run_sweep
+from phc_lattice import add_holes, chain_centres, triangular_lattice_centres
+from viewer import show, viewer
 
 # https://www.nature.com/articles/s41467-024-50667-5
 # https://static-content.springer.com/esm/art%3A10.1038%2Fs41467-024-50667-5/MediaObjects/41467_2024_50667_MOESM1_ESM.pdf
@@ -18,7 +20,7 @@ def nanobeam_cavity_positive_geometry(
     support_gap=5.0,  # um
     layer=(1, 0),
 ) -> Component:
-    c = gf.Component("nanobeam_positive_fixed")
+    c = gf.Component()
 
     # Convert to microns
     a_list = [a] * mirror_N + [a * f for f in taper_factors[::-1] + taper_factors] + [a] * mirror_N
@@ -31,7 +33,6 @@ def nanobeam_cavity_positive_geometry(
     # Total lengths
     beam_length = sum(a_list_um)
     x_start = 0
-    x = x_start
 
     # --- Create beam with holes subtraction ---
     holes = gf.Component()
@@ -39,12 +40,8 @@ def nanobeam_cavity_positive_geometry(
     # --- Nanobeam rectangle ---
     beam = gf.components.straight(length=beam_length, width=w_um, layer=layer)
 
-    # --- Air holes ---
-    for ai in a_list_um:
-        hole = circle(radius=r_um, layer=layer)
-        hole_ref = holes.add_ref(hole)
-        hole_ref.move((x + ai / 2, 0))
-        x += ai
+    # --- Air holes, one per period ---
+    add_holes(holes, chain_centres(a_list_um, x0=x_start), r_um, layer=layer)
 
     beam_final = gf.boolean(A=beam, B=holes, operation="A-B", layer=layer)
     beam_ref = c.add_ref(beam_final)
@@ -86,48 +83,56 @@ def add_2D_phc_cavity(
     layer=(1, 0),
 ):
     """Adds a 2D photonic crystal with a line-defect cavity."""
-    for i in range(-nx, nx + 1):
-        for j in range(-ny, ny + 1):
-            # Triangular lattice coordinates
-            x = i * a
-            y = j * a * (3**0.5) / 2
+    centres = triangular_lattice_centres(a, nx, ny, shifts=shifts)
+    add_holes(component, centres, r, layer=layer, offset=(x_offset, y_offset))
 
-            # Skip the center row (line defect)
-            if j == 0:
-                continue
 
-            # Apply horizontal shifts for the central 4 cavity columns
-            shift = 0
-            abs_i = abs(i)
-            if abs_i in [1, 2, 3, 4]:
-                shift = shifts[abs_i - 1] * (1 if i > 0 else -1)
-                x += shift
-
-            # Place the air hole
-            hole = circle(radius=r, layer=layer)
-            hole_ref = component.add_ref(hole)
-            hole_ref.move((x+x_offset, y+y_offset))
+def nanobeam_sweep(grid, gds_path, **kwargs):
+    """
+    Builds nanobeam_cavity_positive_geometry for every combination in `grid` on all
+    cores and writes them as a labelled matrix plus a CSV index (see param_sweep.run_sweep).
 
+    Args:
+        grid (dict): Parameter name -> list of values, e.g. {"a": [245, 255], "r": [60, 65]}.
+        gds_path (str): Output GDS; the CSV is written next to it.
+        **kwargs: Passed on to run_sweep (columns, spacing, processes, ...).
+    """
+    return run_sweep(__file__, "nanobeam_cavity_positive_geometry", grid, gds_path, name="nanobeam_sweep", **kwargs)
 
 
 if __name__ == "__main__":
-    c = nanobeam_cavity_positive_geometry()
-    # --- Add 2D PhC cavity above 1D ---
-    y_offset = 5  # microns above the beam
-    phc2d = gf.Component("phc2d")
-    add_2D_phc_cavity(phc2d, layer=(1, 0))
-
-    # Create bounding box for 2D region
-    phc_bbox = gf.components.rectangle(size=(8, 3), layer=(1, 0))
-    phc_bbox_ref = gf.Component("phc2d_bbox")
-    phc_bbox_ref.add_ref(phc_bbox).move((1, 3.5))
-
-    # c.add_ref(phc2d)
-    # Subtract 2D PhC holes from the box
-    phc2d_final = gf.boolean(A=phc_bbox_ref, B=phc2d, operation="A-B", layer=(1, 0))
-
-    # Add it to the main component
-    c.add_ref(phc2d_final)
-
-    c.show()
-    c.write_gds(r"Q:\QT-Nano_Fabrication\6 - Project Workplan & Layouts\GDS_Layouts\Shai GDS Layout\MDM\11-05-25\nanobeam_final.gds")
+    mode = "single"  # "single": the nanobeam with the 2D cavity below, "sweep": nanobeam_sweep over the grid below
+
+    if mode == "sweep":
+        grid = {
+            "a": [245, 250, 255, 260, 265],
+            "r": [60, 65, 70, 75],
+            "w": [350, 370, 390, 410, 430],
+            "mirror_N": [10],
+        }
+        sweep = nanobeam_sweep(grid, r"Q:\QT-Nano_Fabrication\6 - Project Workplan & Layouts\GDS_Layouts\Shai GDS Layout\MDM\11-05-25\nanobeam_sweep.gds")
+        show(sweep)
+    else:
+        c = nanobeam_cavity_positive_geometry()
+        # --- Add 2D PhC cavity above 1D ---
+        y_offset = 5  # microns above the beam
+        phc2d = gf.Component("phc2d")
+        add_2D_phc_cavity(phc2d, layer=(1, 0))
+
+        # Create bounding box for 2D region
+        phc_bbox = gf.components.rectangle(size=(8, 3), layer=(1, 0))
+        phc_bbox_ref = gf.Component("phc2d_bbox")
+        phc_bbox_ref.add_ref(phc_bbox).move((1, 3.5))
+
+        # c.add_ref(phc2d)
+        # Subtract 2D PhC holes from the box
+        phc2d_final = gf.boolean(A=phc_bbox_ref, B=phc2d, operation="A-B", layer=(1, 0))
+
+        # Add it to the main component
+        c.add_ref(phc2d_final)
+
+        show(c)
+        c.write_gds(r"Q:\QT-Nano_Fabrication\6 - Project Workplan & Layouts\GDS_Layouts\Shai GDS Layout\MDM\11-05-25\nanobeam_final.gds")
+
+    viewer.flush()
+    viewer.print_stats()
@@ -9,6 +9,12 @@ import os
 from kfactory.kf_types import layer
 from shapely.ops import orient
 
+from boolean_ops import boolean_cache, cached_boolean, clearance_trench, lazy, merge_layer_tiled, merge_layers, mirror_union, offset_path, union_all, unite_lattice
+from gds_export import save_rotated_variants, write_oas
+from gds_library import dilated_gds, gds_cache, import_gds_cached, import_ported
+from supports import add_supports_along_path, cross_support
+from viewer import show, viewer
+
 
 def merge_references(base, refs, layer):
     """Boolean OR of a base geometry with a list of references, handling nested lists."""
@@ -28,11 +34,8 @@ def merge_references(base, refs, layer):
 
     flatten(refs)  # Flatten input list
 
-    # Perform boolean OR operation on all valid references
-    for ref in flattened_refs:
-        merged = gf.boolean(A=merged, B=ref, operation="or", layer=layer)
-
-    return merged
+    # Merge base and all valid references in a single region operation
+    return union_all([merged] + flattened_refs, layer=layer)
 
 def create_spring_comb(c, cross_section, start_pos):
     """
@@ -209,18 +212,7 @@ def create_dc_design_comb(resonator="fish", coupler_l=0.42,clearance_width=50):
 
     # --- Load fish or alternative resonator geometry ---
     gds_path = Path("QT14_v1.gds") if resonator == "fish" else Path("QT10.gds")
-    fish_component = gf.import_gds(gds_path)
-    fish_component.add_port(
-        name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer_main
-    )
-
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width - 0.002,0),
-        width=0.5,
-        orientation=0,
-        layer=layer_main,
-    )
+    fish_component = import_ported(gds_path, layer=layer_main)
 
     # Cross-section for S-bend
     x_sbend = gf.CrossSection(
@@ -375,13 +367,8 @@ def create_dc_design_comb(resonator="fish", coupler_l=0.42,clearance_width=50):
 
     # Merge all references
 
-    # Create mirrored waveguide (bot_waveguide)
-    bot_waveguide_ref = gf.Component().add_ref(top_waveguide).mirror_y()
-    # Shift if necessary: .dmovey(dy*0) does nothing, but keep it for clarity:
-    bot_waveguide_ref.dmovey(dy * 0)
-
-    # Combine top + bottom waveguides
-    combined_dc = gf.boolean(A=top_waveguide, B=bot_waveguide_ref, operation="or", layer=layer_main)
+    # Combine top + mirrored bottom (bot_waveguide) waveguides, merging only along y=0
+    combined_dc = mirror_union(top_waveguide, axis="x", layer=layer_main)
 
     #########################
 
@@ -418,11 +405,8 @@ def create_dc_design_comb(resonator="fish", coupler_l=0.42,clearance_width=50):
     s3 = thick_dc.add_ref(final_straight)
     s3.connect(port="in", other=b2.ports["out"])
 
-    # Create bottom mirrored version
-    thick_dc_ref_bot = gf.Component().add_ref(thick_dc).mirror_y()
-
-    # Combine top and bottom thick DC into one component
-    combined_thick_dc = gf.boolean(A=thick_dc, B=thick_dc_ref_bot, operation="or", layer=layer_main)
+    # Combine top and mirrored bottom thick DC into one component
+    combined_thick_dc = mirror_union(thick_dc, axis="x", layer=layer_main)
 
     #########################
 
@@ -475,18 +459,7 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
 
     # --- Load fish or alternative resonator geometry ---
     gds_path = Path("Selected Resonators to FAB\QT14_v1.gds") if resonator == "fish" else Path("Selected Resonators to FAB\QT10.gds")
-    fish_component = gf.import_gds(gds_path)
-    fish_component.add_port(
-        name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer_main
-    )
-
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width - 0.05,0),
-        width=0.5,
-        orientation=0,
-        layer=layer_main,
-    )
+    fish_component = import_ported(gds_path, layer=layer_main)
 
 
     # Cross-section for S-bend
@@ -572,21 +545,11 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     refs.append(vertical_supports)
 
     # --- Construct top waveguide geometry with boolean OR ---
-    top_waveguide = gf.boolean(
-        A=taper_small_in_ref, B=taper1_ref, operation="or", layer=layer_main
-    )
+    # (lazy: the boolean chain below is evaluated once, when dc_positive is built)
+    top_waveguide = lazy(refs, layer_main)
 
-    top_waveguide = merge_references(top_waveguide, refs, layer_main)
-
-    # Merge all references
-
-    # Create mirrored waveguide (bot_waveguide)
-    bot_waveguide_ref = gf.Component().add_ref(top_waveguide).mirror_y()
-    # Shift if necessary: .dmovey(dy*0) does nothing, but keep it for clarity:
-    bot_waveguide_ref.dmovey(dy * 0)
-
-    # Combine top + bottom waveguides
-    combined_dc = gf.boolean(A=top_waveguide, B=bot_waveguide_ref, operation="or", layer=layer_main)
+    # Combine top + mirrored bottom (bot_waveguide) waveguides, merging only along y=0
+    combined_dc = top_waveguide.symmetric("x")
 
     ######## Thick DC #######
 
@@ -623,11 +586,8 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     s3 = thick_dc.add_ref(final_straight)
     s3.connect(port="in", other=b2.ports["out"])
 
-    # Create bottom mirrored version
-    thick_dc_ref_bot = gf.Component().add_ref(thick_dc).mirror_y()
-
-    # Combine top and bottom thick DC into one component
-    combined_thick_dc = gf.boolean(A=thick_dc, B=thick_dc_ref_bot, operation="or", layer=layer_main)
+    # Combine top and mirrored bottom thick DC
+    combined_thick_dc = lazy(thick_dc, layer_main).symmetric("x")
 
     #########################
 
@@ -635,7 +595,7 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     bounding_rect = gf.components.straight(length=7.3,width=dy * 2.5 + 0.6,layer=layer_main)
     bounding_rect_ref = c.add_ref(bounding_rect).dmovex(25.5)
     bounding_ext = c.add_ref(gf.components.straight(length=clearance_width,width=50,layer=layer_main)).dmovex(-21.6-clearance_width)
-    bounding_rect_ref = gf.boolean(A=bounding_rect_ref, B=bounding_ext, operation="or", layer=layer_main)
+    bounding_rect_ref = lazy(bounding_rect_ref, layer_main) | bounding_ext
     # pad_h = 150
     # pad_l = 150
     # ext1 = c.add_ref(gf.components.straight(length=pad_x_offset+10, width=6, layer=layer_main)).dmovex(30)
@@ -644,9 +604,9 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     #     ext1 = gf.boolean(A=ext1, B=ext2, operation="or", layer=layer_main)
     # bounding_rect_ref = gf.boolean(A=bounding_rect_ref, B=ext1, operation="or", layer=layer_main)
 
-    bounding_rect_ref = c.add_ref(gf.boolean(A=bounding_rect_ref, B=combined_thick_dc, operation="or", layer=layer_main))
+    bounding_rect_ref = bounding_rect_ref | combined_thick_dc
 
-    dc_positive = gf.boolean(A=bounding_rect_ref, B=combined_dc, operation="A-B", layer=layer_main)
+    dc_positive = (bounding_rect_ref - combined_dc).to_component(cache=boolean_cache)
 
 
     result_c= gf.Component()
@@ -897,23 +857,7 @@ def add_fish_components( c, gds_file, length_mmi, taper_length, taper_separation
         list: A list of references to the added fish components.
     """
     # Import the fish component from the GDS file
-    fish_component = gf.import_gds(Path(gds_file))
-
-    # Add ports to the imported fish component
-    fish_component.add_port(
-        name="o1",
-        center=(0, 0),  # Define the input port position (update as needed)
-        width=0.5,  # Update the width as required
-        orientation=180,  # Facing left
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width, 0),  # Define the output port position
-        width=0.5,  # Update the width as required
-        orientation=0,  # Facing right
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
+    fish_component = import_ported(gds_file)
 
     # Add the fish components to the parent component
     fish_ref_1 = c.add_ref(fish_component)
@@ -1211,11 +1155,12 @@ def logo( name=None):
     Mid_CR2 = c.add_ref(gf.components.circle(radius=1.35, layer=(1, 0))).dmovex(3).dmovey(-3)
     Mid_CR3 = c.add_ref(gf.components.circle(radius=1.75, layer=(1, 0))).dmovex(3).dmovey(-3)
     Mid_CR4 = c.add_ref(gf.components.circle(radius=2, layer=(1, 0))).dmovex(3).dmovey(-3)
-    CR = c.add_ref(gf.boolean(A=Big_CR, B=Mid_CR4, operation="A-B", layer=(1, 0)))
+    # Boolean chain is built lazily and evaluated once at the end
+    CR = lazy(Big_CR) - lazy(Mid_CR4)
 
-    right_bottom_small_cir = c.add_ref(gf.boolean(A=Big_CR, B=Mid_CR1, operation="and", layer=(1, 0)))
-    right_bottom_shape = gf.boolean(A=Mid_CR3, B=Mid_CR2, operation="A-B", layer=(1, 0))
-    right_bottom_shape = gf.boolean(A=right_bottom_shape, B=right_bottom_small_cir, operation="or", layer=(1, 0))
+    right_bottom_small_cir = lazy(Big_CR) & lazy(Mid_CR1)
+    right_bottom_shape = lazy(Mid_CR3) - lazy(Mid_CR2)
+    right_bottom_shape = right_bottom_shape | right_bottom_small_cir
 
     PT = c.add_ref(gf.path.extrude(
         gf.Path([(0.0000, 4.0000), (0.0000, 2.5000), (-1.4000, 1.1000), (-1.4000, -1.1000), (0.0000, -2.5000), (0.0000, -4.0000)]), layer=(1, 0),
@@ -1227,20 +1172,20 @@ def logo( name=None):
     sbend2.connect(port="in", other=sbend1.ports["out"])
     sbend3 = c.add_ref(gf.components.bend_s(size=(1.15, .5), cross_section=x))
     sbend3.connect(port="in", other=sbend2.ports["out"])
-    sbend3_cut = c.add_ref(gf.boolean(A=sbend3, B=ToCut, operation="A-B", layer=(1, 0)))
+    sbend3_cut = lazy(sbend3) - lazy(ToCut)
 
-    mrg = gf.boolean(A=sbend3_cut, B=sbend2, operation="or", layer=(1, 0))
+    mrg = sbend3_cut | sbend2
 
-    mrg = gf.boolean(A=mrg, B=sbend1, operation="or", layer=(1, 0))
+    mrg = mrg | sbend1
 
-    mrg = gf.boolean(A=mrg, B=PT, operation="or", layer=(1, 0))
+    mrg = mrg | PT
 
-    center_logo = gf.boolean(A=CR, B=mrg, operation="A-B", layer=(1, 0))
-    mrg1 = gf.boolean(A=center_logo, B=right_bottom_shape, operation="or", layer=(1, 0))
-    qt_logo = gf.boolean(A=mrg1, B=Small_CR, operation="or", layer=(1, 0))
+    center_logo = CR - mrg
+    mrg1 = center_logo | right_bottom_shape
+    qt_logo = mrg1 | Small_CR
 
     s1 = gf.Component().add_ref(gf.components.straight(length=0.3, width=1.5, layer=(1, 0))).dmovex(2.85).dmovey(-5)
-    qt_logo = gf.boolean(A=qt_logo, B=s1, operation="A-B", layer=(1, 0))
+    qt_logo = (qt_logo - s1).to_component()
 
     if not name==None:
         qt_logo.name = name
@@ -1251,7 +1196,7 @@ def debug(self):
     c = gf.Component("TOP")
     straight_c = gf.components.straight(4.5)
     straight_ref = c.add_ref(straight_c)
-    c.show()
+    show(c)
 
 def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
     """
@@ -1268,31 +1213,15 @@ def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(
     """
     # Early return if only one instance is needed
     if rows == 1 and cols == 1:
-        if name:
-            component.name = name
-        return component
-
-    # Create a new component to store the unified array
-    c = gf.Component()
-
-    # Place the first instance to initialize merged geometry
-    merged_device = c.add_ref(component)
-
-    # Loop through the array and place each instance, uniting it with merged_device
-    for row in range(rows):
-        for col in range(cols):
-            # Skip the first instance since it's already added as merged_device
-            if row == 0 and col == 0:
-                continue
+        if not name:
+            return component
+        # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+        single = gf.Component(name)
+        single.add_ports(single.add_ref(component).ports)
+        return single
 
-            # Calculate the position for the next component
-            x_pos = col * spacing[0]
-            y_pos = row * spacing[1]
-
-            # Place and unite each instance with the merged_device
-            next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
-
-            merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+    # Unite the whole lattice in one batched region operation
+    merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
     # Name the final merged component
     if name:
@@ -1441,8 +1370,7 @@ def add_bulls_eye( c, n_bulls_eye, offset_x):
     a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
     gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-    b = gf.import_gds(gds_file)
-    b.name = "GDS_Import"
+    b = import_gds_cached(gds_file)
 
     c.add_ref(unite_array(b, cols=n_bulls_eye, rows=1, spacing=(12.5, 12.5), name="Bulls-eye")).dmovey(-20).dmovex(offset_x + 32)
 
@@ -1488,13 +1416,9 @@ def get_remove_polygon_points(self):
 def subtract_custom_polygon( mmi, polygon_points):
     custom_polygon_component = gf.Component()
     custom_polygon_component.add_polygon(polygon_points, layer=(1, 0))
-    mmi = gf.boolean(A=mmi, B=custom_polygon_component, operation="A-B", layer=(1, 0))
-
-    mirrored_polygon_component = gf.Component()
-    mirrored_polygon_component.add_polygon(
-        [(x, -y) for x, y in polygon_points], layer=(1, 0)
-    )
-    mmi = gf.boolean(A=mmi, B=mirrored_polygon_component, operation="A-B", layer=(1, 0))
+    # the cut is symmetric about y=0: mirror the polygon by transform, subtract once
+    symmetric_polygon = mirror_union(custom_polygon_component, axis="x", layer=(1, 0))
+    mmi = gf.boolean(A=mmi, B=symmetric_polygon, operation="A-B", layer=(1, 0))
     return mmi
 
 def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper_width1: float = 0.08,
@@ -1510,6 +1434,7 @@ def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper
         layer (tuple): The GDS layer for the taper. Default is (1, 0).
         y_spacing (float): Vertical spacing adjustment for the tapers. Default is 0.
         arc_radius (float): Radius for the 180-degree arc when component_type is 'smw'. Default is 5.
+        dil (float): Bias in nm applied to the resonator (negative erodes), generated on demand. Default is 0.
 
     Returns:
         gf.Component: The created component with tapers and either fish or an arc.
@@ -1527,10 +1452,7 @@ def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper
         ).dmovey(-1.5 + y_spacing)
 
         # Add fish components and connect them to the second short tapers
-        if dil == 0:
-            fish_refs = add_fish_components(component, 'Selected Resonators to FAB\QT10.gds', 20, 10, 5)
-        else:
-            fish_refs = add_fish_components(component, f'Selected Resonators to FAB\QT10_dil{dil}.gds', 20, 10, 5)
+        fish_refs = add_fish_components(component, dilated_gds('Selected Resonators to FAB\QT10.gds', dil), 20, 10, 5)
 
         fish_refs[0].connect(port="o1", other=tpr1.ports["o2"], allow_width_mismatch=True)
         fish_refs[1].connect(port="o1", other=tpr2.ports["o2"], allow_width_mismatch=True)
@@ -1545,10 +1467,7 @@ def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper
         ).dmovey(-1.5 + y_spacing)
 
         # Add fish components and connect them to the second short tapers
-        if dil == 0:
-            fish_refs = add_fish_components(component, 'Selected Resonators to FAB\QT14.gds', 20, 10, 5)
-        else:
-            fish_refs = add_fish_components(component, f'Selected Resonators to FAB\QT14_dil{dil}.gds', 20, 10, 5)
+        fish_refs = add_fish_components(component, dilated_gds('Selected Resonators to FAB\QT14.gds', dil), 20, 10, 5)
 
 
         fish_refs[0].connect(port="o1", other=tpr1.ports["o2"], allow_width_mismatch=True)
@@ -1575,7 +1494,7 @@ def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper
 
     # Subtract merged component from bbox
     c = gf.Component()
-    bbox_subtracted = gf.boolean(A=bbox, B=merged_component, operation="A-B", layer=layer)
+    bbox_subtracted = cached_boolean(A=bbox, B=merged_component, operation="A-B", layer=layer)
 
     if dil != 0:
         text1 = c.add_ref(gf.components.text(text=str(dil), size=5)).dmovex(20).dmovey(-4+y_spacing).flatten()
@@ -1592,7 +1511,7 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
                           taper_length: float = 10, taper_width1: float = 0.08,clearance_width=50):
     """
     Creates a long waveguide with defined start and end points using straights and arcs,
-    adding supports and subtracting the waveguide (with tapers & supports) from a wider path.
+    adding supports and cutting an offset-based clearance trench around it.
 
     Args:
         start (tuple): Starting coordinates of the waveguide (x, y).
@@ -1608,7 +1527,7 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
         taper_width1 (float): Starting width of the taper. Default is 0.08 µm.
 
     Returns:
-        gf.Component: The generated waveguide component with supports and subtracted wider path.
+        gf.Component: The clearance trench around the waveguide with supports.
     """
     component = gf.Component()
 
@@ -1648,109 +1567,30 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
     taper_end = waveguide_with_supports.add_ref(taper)
     taper_end.move((start[0], start[1]+vertical_straight_length+arc_radius*2))
 
-    # Function to add support structures inside waveguide_with_supports
-    def add_supports_along_straight(x_start, y_start, length, is_vertical=False):
-        num_supports = int(round((length-2) / support_spacing,0))  # Calculate number of supports
-        # Create support component
-        support = gf.components.taper(length=support_length, width1=width, width2=support_width, layer=layer)
-        for i in range(1, num_supports + 2 ):
-            if is_vertical:
-                support_x = x_start  # X remains the same
-                support_y = y_start + i * (support_spacing -2.6) # Increment Y for vertical section
-                # support_y = round(y_start + i * support_spacing, -1)  # Snap Y to nearest 10 µm
-            else:
-                support_x = x_start + i * support_spacing  # Increment X for horizontal section
-                support_y = y_start  # Y remains the same
-
-            if is_vertical:
-                # Flip Up-Down correctly
-                waveguide_with_supports.add_ref(support).drotate(0).move((support_x, support_y + support_length))
-                waveguide_with_supports.add_ref(support).drotate(180).move((support_x, support_y + support_length))
-                # Flip Left-Right correctly
-                waveguide_with_supports.add_ref(support).drotate(90).move((support_x, support_y))
-                waveguide_with_supports.add_ref(support).drotate(270).move((support_x, support_y+support_length*2))
-            else:
-                # Correct horizontal placement
-                waveguide_with_supports.add_ref(support).drotate(90).move((support_x, support_y + width))  # Up
-                waveguide_with_supports.add_ref(support).drotate(270).move((support_x, support_y - width))  # Down
-                waveguide_with_supports.add_ref(support).move((support_x - support_length, support_y))  # Left
-                waveguide_with_supports.add_ref(support).drotate(180).move((support_x + support_length, support_y))  # Right
-
-    # Function to add support structures along arc
-    def add_supports_along_arc(center_x, center_y, radius, start_angle,end_angle , dx,dy):
-        # Calculate arc length
-        arc_length = np.abs(end_angle - start_angle) * np.pi * radius / 180
-        
-        # Create support components
-        support2 = gf.components.taper(length=support_length, width1=width, width2=support_width, layer=layer)
-
-        # Add support at the middle of the arc
-        angle = np.radians(start_angle + 45)
-        # Calculate position on arc with precise shifts
-        # For 225° (45° from 180°), we need both x and y shifts
-        support_x = center_x + radius * np.cos(angle)
-        support_y = center_y + radius * np.sin(angle) 
-        # Calculate rotation angle for the support
-        # The support should be perpendicular to the tangent of the arc
-        # For a circular arc, the tangent is perpendicular to the radius vector
-        # We subtract 90 degrees to match the horizontal support pattern
-        rotation_angle = np.degrees(angle)
-        
-        # Create bent support for this specific angle
-        bent_support1 = create_bent_taper(taper_length=0, taper_width1=support_width, taper_width2=0.2, 
-                                       bend_radius=radius*0.6, bend_angle=10, enable_sbend=False)
-        
-        # Add four supports around the point
-        # Order matches the horizontal pattern: right taper expands then contracts
-        # Adjust positions to account for support length and bend radius
-        waveguide_with_supports.add_ref(bent_support1).drotate(rotation_angle + 180).move((support_x, support_y))  # Right
-        waveguide_with_supports.add_ref(bent_support1).mirror_y().drotate(rotation_angle).move((support_x, support_y))  # Left
-        waveguide_with_supports.add_ref(support2).drotate(rotation_angle + 90).move((support_x+dx, support_y-dy))  # Up
-        waveguide_with_supports.add_ref(support2).drotate(rotation_angle + 270).move((support_x-dx, support_y+dy))  # Down
-
-    # Add supports in first horizontal section
-    add_supports_along_straight(start[0] -10, start[1], first_straight_length, is_vertical=False)
-
-    # Add supports in first arc
-    first_arc_center_x = start[0] + first_straight_length + taper_length + arc_radius+14.67
-    first_arc_center_y = start[1] + arc_radius
-    add_supports_along_arc(first_arc_center_x, first_arc_center_y, arc_radius, 180, 270,0.2,0.2)
-    waveguide_with_supports.show()
-    # Add supports in vertical section
-    upward_section_start_x = start[0] + first_straight_length + arc_radius + taper_length
-    upward_section_start_y = start[1] + arc_radius / 2 - 2
-    add_supports_along_straight(upward_section_start_x, upward_section_start_y, vertical_straight_length, is_vertical=True)
-
-    # Add supports in second arc
-    second_arc_center_x = start[0] + first_straight_length + taper_length + arc_radius-35.03
-    second_arc_center_y = start[1] + vertical_straight_length + arc_radius+49.7
-    add_supports_along_arc(second_arc_center_x, second_arc_center_y, arc_radius, 270, 360,0.2,-0.2)
-    # add_supports_along_arc(second_arc_center_x, second_arc_center_y, arc_radius, 315, 360)  # Add second support at 3/4 of arc
-    # waveguide_with_supports.show()
-    # Add supports in last horizontal section
-    last_section_start_x = start[0]-10
-    last_section_start_y = upward_section_start_y + vertical_straight_length + arc_radius * 3 / 2 + 2
-    add_supports_along_straight(last_section_start_x, last_section_start_y, last_straight_length, is_vertical=False)
-
-    # Generate the **wider path** that will be used for subtraction
-    wider_width = support_length * 2
-    # Extend the wider path by adding a 10 µm straight section at the beginning and end
-    wider_path = gf.Path()
-    wider_path.append(gf.path.straight(length=taper_length+clearance_width))
-    wider_path.append(path)  # Original path
-    wider_path.append(gf.path.straight(length=taper_length+clearance_width))
-
-    wider_waveguide = gf.path.extrude(wider_path, layer=layer, width=wider_width)
-    wider_waveguide_ref = component.add_ref(wider_waveguide)
-    wider_waveguide_ref.move((start[0]-clearance_width, start[1]))
-
-    clearance_rect = gf.Component().add_ref(gf.components.straight(length=clearance_width,width=20)).move((start[0]-clearance_width, start[1]))
-    wider_waveguide_ref = gf.boolean(A=wider_waveguide_ref, B=clearance_rect, operation='or')
-    clearance_rect = gf.Component().add_ref(gf.components.straight(length=clearance_width, width=20)).move((start[0] - clearance_width, end[1]))
-    wider_waveguide_ref = gf.boolean(A=wider_waveguide_ref,B=clearance_rect,operation='or')
-
-    # Subtract the entire waveguide (with tapers and supports) from the wider waveguide
-    cutout_component = gf.boolean(A=wider_waveguide_ref, B=waveguide_with_supports, operation="A-B", layer=layer)
+    # Supports: one merged cross-support cell referenced every support_spacing um of path
+    # length along the waveguide core, straights and arcs alike, turned to the local direction.
+    # The legs along the core are straight, so on an arc their far ends sit
+    # support_length**2 / (2 * arc_radius) off the core centre line (~0.13 um at 35 um).
+    support = cross_support(width=width, support_width=support_width, support_length=support_length, layer=layer)
+    add_supports_along_path(waveguide_with_supports, path.points, support_spacing, support,
+                            margin=support_length, offset=(start[0] + taper_length, start[1]))
+    show(waveguide_with_supports)
+
+    # Clearance trench: buffer the waveguide core so the trench reaches support_length from
+    # the centre line everywhere, arcs included. The tapers change width, so their centre
+    # lines are buffered instead of their outlines. The supports are not buffered: they
+    # cross the trench and anchor the waveguide.
+    taper_axes = offset_path([taper_start.ports["o1"].dcenter, taper_start.ports["o2"].dcenter], support_length)
+    taper_axes |= offset_path([taper_end.ports["o1"].dcenter, taper_end.ports["o2"].dcenter], support_length)
+    trench = clearance_trench(
+        [(waveguide_ref, support_length - width / 2), (taper_axes, 0)],
+        device=waveguide_with_supports,
+        layer=layer,
+    )
+
+    clearance_rect_start = gf.Component().add_ref(gf.components.straight(length=clearance_width, width=20)).move((start[0] - clearance_width, start[1]))
+    clearance_rect_end = gf.Component().add_ref(gf.components.straight(length=clearance_width, width=20)).move((start[0] - clearance_width, end[1]))
+    cutout_component = (lazy(trench, layer) | clearance_rect_start | clearance_rect_end).to_component()
     component.add_ref(cutout_component)
 
     return cutout_component
@@ -1895,13 +1735,15 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     # c.show()
     return c
 
-def merge_layer(component, layer=(1, 0)):
+def merge_layer(component, layer=(1, 0), tile_size=None, threads=None):
     """
     Merges overlapping or adjacent shapes in the specified layer.
 
     Args:
         component (gf.Component): The input photonic component.
         layer (tuple): The GDS layer to merge (default: (1, 0)).
+        tile_size (float): If set, merge in tile_size x tile_size um tiles on worker threads.
+        threads (int): Number of worker threads for the tiled merge (default: all cores).
 
     Returns:
         gf.Component: A new component with merged shapes.
@@ -1917,7 +1759,10 @@ def merge_layer(component, layer=(1, 0)):
         return merged_component  # Return the original component
 
     # Merge adjacent or overlapping polygons
-    merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
+    if tile_size:
+        merged_shapes = merge_layer_tiled(layer_shapes, layer=layer, tile_size=tile_size, threads=threads)
+    else:
+        merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
 
     # Create a new component to store the merged result
     merged_component = gf.Component()
@@ -1944,7 +1789,7 @@ def create_fillet(radius = 0.15):
 def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers):
     # Coupon mode: create coupon design (without electrodes).
     design_component = create_design(clearance_width=clearance_width,to_debug=to_debug,layers=layers)
-    c = merge_layer(design_component, layer=layers["fine_ebl_layer"])
+    c = merge_layer(design_component, layer=layers["fine_ebl_layer"], tile_size=500)
     # coarse_component=merge_layer(design_component, layer=layers["coarse_ebl_layer"])
     # c.add_ref(coarse_component).flatten()
     if not to_debug:
@@ -1957,23 +1802,17 @@ def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers)
         gds_output_file = os.path.join(base_directory, f"Left MDM-{today_date}.gds")
         c.write_gds(gds_output_file)
         print(f"GDS saved to {gds_output_file}")
+        write_oas(c, os.path.splitext(gds_output_file)[0] + ".oas")
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name} MDM-{today_date}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
     if not to_debug:
-        save_rotated(c, 90, "Bottom")
-        save_rotated(c, 180, "Right")
-        save_rotated(c, 270, "Top")
+        variants = [(angle, name, os.path.join(base_directory, f"{name} MDM-{today_date}.gds"))
+                    for angle, name in ((90, "Bottom"), (180, "Right"), (270, "Top"))]
+        save_rotated_variants(c, variants, base_gds=gds_output_file)
 
-    c.show()
+    boolean_cache.print_stats()
+    gds_cache.print_stats()
+    show(c)
 
 def run_labels_mode(base_directory, today_date,layers=None):
     # Die dose_labels mode: create and save the full die dose_labels.
@@ -2041,7 +1880,7 @@ def run_labels_mode(base_directory, today_date,layers=None):
         labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
         label_component.write_gds(labels_gds_file)
         print(f"GDS saved to {labels_gds_file}")
-        label_component.show()
+        show(label_component)
 
     save_label_gds("QT-MDM3.4",layers=layers)
     save_label_gds("QT-MDM3.5",layers=layers)
@@ -2294,18 +2133,17 @@ def add_electrodes_to_coupon(coupon = gf.Component(), layers = None):
     c.add_ref(gf.components.straight(length=150, width=pad_h, layer=e_layer)).move((xp, yp))
     c.add_ref(gf.components.text(text=label_text, size=label_size, position=(xp + label_offset_x, yp +label_offset_y), layer=pad_labels_layer))
 
-    merged_layer = merge_layer(c, e_layer)
-    merged_labels = merge_layer(c, pad_labels_layer)
+    # Merge electrodes and pad labels in a single walk of the hierarchy
+    merged_layers = merge_layers(c, [e_layer, pad_labels_layer], tile_size=500)
 
-    merged_layer.add_ref(coupon)
-    merged_layer.add_ref(merged_labels)
+    merged_layers.add_ref(coupon)
 
-    return merged_layer
+    return merged_layers
 
 def run_electrodes_mode(coupon_gds_path, base_directory, today_date,layers):
     # Load the coupon design from the existing GDS file.
-    # Here we use gdsfactory's import function.
-    coupon = gf.import_gds(coupon_gds_path)
+    # The import is cached and only re-read when the file changes.
+    coupon = import_gds_cached(coupon_gds_path)
 
     # Add the electrodes to the coupon design.
     coupon_with_electrodes = add_electrodes_to_coupon(coupon,layers)
@@ -2314,21 +2152,13 @@ def run_electrodes_mode(coupon_gds_path, base_directory, today_date,layers):
     electrodes_gds_file = os.path.join(base_directory, f"Left_Electrodes_{today_date}.gds")
     coupon_with_electrodes.write_gds(electrodes_gds_file)
     print(f"Updated coupon with electrodes saved to {electrodes_gds_file}")
-    coupon_with_electrodes.show()
+    write_oas(coupon_with_electrodes, os.path.splitext(electrodes_gds_file)[0] + ".oas")
+    show(coupon_with_electrodes)
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name} MDM-{today_date}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
-    save_rotated(coupon_with_electrodes, 90, "Bottom_Electrodes")
-    save_rotated(coupon_with_electrodes, 180, "Right_Electrodes")
-    save_rotated(coupon_with_electrodes, 270, "Top_Electrodes")
+    variants = [(angle, name, os.path.join(base_directory, f"{name} MDM-{today_date}.gds"))
+                for angle, name in ((90, "Bottom_Electrodes"), (180, "Right_Electrodes"), (270, "Top_Electrodes"))]
+    save_rotated_variants(coupon_with_electrodes, variants, base_gds=electrodes_gds_file)
 
 def main():
     layers = {
@@ -2355,7 +2185,8 @@ def main():
     # mode = "labels"
     # mode = "electrodes"
 
-    coupon_gds_path = r"C:\PyLayout\PyLayout\build\gds\MDM3C_run_coupon_mode.oas"
+    # The OASIS run_coupon_mode writes (the build/gds copy only exists when show() is not "off")
+    coupon_gds_path = os.path.join(base_directory, f"Left MDM-{today_date}.oas")
 
     if mode == "coupon":
         run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers)
@@ -2368,3 +2199,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
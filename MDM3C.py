@@ -9,6 +9,12 @@ import os
 from kfactory.kf_types import layer
 from shapely.ops import orient
 
+from boolean_ops import merge_layer_tiled, merge_layers, mirror_union, union_all, unite_lattice
+from gds_export import save_rotated_variants, write_oas
+from gds_library import gds_cache, import_gds_cached, import_ported
+from supports import add_supports_along_path, cross_support
+from viewer import show, viewer
+
 
 # # ------------------------------------------
 # # KLayout Macro: Save Layout as High-Res PNG
@@ -167,11 +173,8 @@ def merge_references(base, refs, layer):
 
     flatten(refs)  # Flatten input list
 
-    # Perform boolean OR operation on all valid references
-    for ref in flattened_refs:
-        merged = gf.boolean(A=merged, B=ref, operation="or", layer=layer)
-
-    return merged
+    # Merge base and all valid references in a single region operation
+    return union_all([merged] + flattened_refs, layer=layer)
 
 def create_spring_comb(c, cross_section, start_pos):
     """
@@ -348,18 +351,7 @@ def create_dc_design_comb(resonator="fish", coupler_l=0.42,clearance_width=50):
 
     # --- Load fish or alternative resonator geometry ---
     gds_path = Path("QT14_v1.gds") if resonator == "fish" else Path("QT10.gds")
-    fish_component = gf.import_gds(gds_path)
-    fish_component.add_port(
-        name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer_main
-    )
-
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width - 0.002,0),
-        width=0.5,
-        orientation=0,
-        layer=layer_main,
-    )
+    fish_component = import_ported(gds_path, layer=layer_main)
 
     # Cross-section for S-bend
     x_sbend = gf.CrossSection(
@@ -514,13 +506,8 @@ def create_dc_design_comb(resonator="fish", coupler_l=0.42,clearance_width=50):
 
     # Merge all references
 
-    # Create mirrored waveguide (bot_waveguide)
-    bot_waveguide_ref = gf.Component().add_ref(top_waveguide).mirror_y()
-    # Shift if necessary: .dmovey(dy*0) does nothing, but keep it for clarity:
-    bot_waveguide_ref.dmovey(dy * 0)
-
-    # Combine top + bottom waveguides
-    combined_dc = gf.boolean(A=top_waveguide, B=bot_waveguide_ref, operation="or", layer=layer_main)
+    # Combine top + mirrored bottom (bot_waveguide) waveguides, merging only along y=0
+    combined_dc = mirror_union(top_waveguide, axis="x", layer=layer_main)
 
     #########################
 
@@ -557,11 +544,8 @@ def create_dc_design_comb(resonator="fish", coupler_l=0.42,clearance_width=50):
     s3 = thick_dc.add_ref(final_straight)
     s3.connect(port="in", other=b2.ports["out"])
 
-    # Create bottom mirrored version
-    thick_dc_ref_bot = gf.Component().add_ref(thick_dc).mirror_y()
-
-    # Combine top and bottom thick DC into one component
-    combined_thick_dc = gf.boolean(A=thick_dc, B=thick_dc_ref_bot, operation="or", layer=layer_main)
+    # Combine top and mirrored bottom thick DC into one component
+    combined_thick_dc = mirror_union(thick_dc, axis="x", layer=layer_main)
 
     #########################
 
@@ -614,18 +598,7 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
 
     # --- Load fish or alternative resonator geometry ---
     gds_path = Path("QT14_v1.gds") if resonator == "fish" else Path("QT10.gds")
-    fish_component = gf.import_gds(gds_path)
-    fish_component.add_port(
-        name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer_main
-    )
-
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width - 0.05,0),
-        width=0.5,
-        orientation=0,
-        layer=layer_main,
-    )
+    fish_component = import_ported(gds_path, layer=layer_main)
 
 
     # Cross-section for S-bend
@@ -719,13 +692,8 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
 
     # Merge all references
 
-    # Create mirrored waveguide (bot_waveguide)
-    bot_waveguide_ref = gf.Component().add_ref(top_waveguide).mirror_y()
-    # Shift if necessary: .dmovey(dy*0) does nothing, but keep it for clarity:
-    bot_waveguide_ref.dmovey(dy * 0)
-
-    # Combine top + bottom waveguides
-    combined_dc = gf.boolean(A=top_waveguide, B=bot_waveguide_ref, operation="or", layer=layer_main)
+    # Combine top + mirrored bottom (bot_waveguide) waveguides, merging only along y=0
+    combined_dc = mirror_union(top_waveguide, axis="x", layer=layer_main)
 
     ######## Thick DC #######
 
@@ -762,11 +730,8 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     s3 = thick_dc.add_ref(final_straight)
     s3.connect(port="in", other=b2.ports["out"])
 
-    # Create bottom mirrored version
-    thick_dc_ref_bot = gf.Component().add_ref(thick_dc).mirror_y()
-
-    # Combine top and bottom thick DC into one component
-    combined_thick_dc = gf.boolean(A=thick_dc, B=thick_dc_ref_bot, operation="or", layer=layer_main)
+    # Combine top and mirrored bottom thick DC into one component
+    combined_thick_dc = mirror_union(thick_dc, axis="x", layer=layer_main)
 
     #########################
 
@@ -1037,23 +1002,7 @@ def add_fish_components( c, gds_file, length_mmi, taper_length, taper_separation
         list: A list of references to the added fish components.
     """
     # Import the fish component from the GDS file
-    fish_component = gf.import_gds(Path(gds_file))
-
-    # Add ports to the imported fish component
-    fish_component.add_port(
-        name="o1",
-        center=(0, 0),  # Define the input port position (update as needed)
-        width=0.5,  # Update the width as required
-        orientation=180,  # Facing left
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width, 0),  # Define the output port position
-        width=0.5,  # Update the width as required
-        orientation=0,  # Facing right
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
+    fish_component = import_ported(gds_file)
 
     # Add the fish components to the parent component
     fish_ref_1 = c.add_ref(fish_component)
@@ -1391,7 +1340,7 @@ def debug(self):
     c = gf.Component("TOP")
     straight_c = gf.components.straight(4.5)
     straight_ref = c.add_ref(straight_c)
-    c.show()
+    show(c)
 
 def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
     """
@@ -1408,31 +1357,15 @@ def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(
     """
     # Early return if only one instance is needed
     if rows == 1 and cols == 1:
-        if name:
-            component.name = name
-        return component
-
-    # Create a new component to store the unified array
-    c = gf.Component()
-
-    # Place the first instance to initialize merged geometry
-    merged_device = c.add_ref(component)
+        if not name:
+            return component
+        # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+        single = gf.Component(name)
+        single.add_ports(single.add_ref(component).ports)
+        return single
 
-    # Loop through the array and place each instance, uniting it with merged_device
-    for row in range(rows):
-        for col in range(cols):
-            # Skip the first instance since it’s already added as merged_device
-            if row == 0 and col == 0:
-                continue
-
-            # Calculate the position for the next component
-            x_pos = col * spacing[0]
-            y_pos = row * spacing[1]
-
-            # Place and unite each instance with the merged_device
-            next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
-
-            merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+    # Unite the whole lattice in one batched region operation
+    merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
     # Name the final merged component
     if name:
@@ -1581,8 +1514,7 @@ def add_bulls_eye( c, n_bulls_eye, offset_x):
     a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
     gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-    b = gf.import_gds(gds_file)
-    b.name = "GDS_Import"
+    b = import_gds_cached(gds_file)
 
     c.add_ref(unite_array(b, cols=n_bulls_eye, rows=1, spacing=(12.5, 12.5), name="Bulls-eye")).dmovey(-20).dmovex(offset_x + 32)
 
@@ -1628,13 +1560,9 @@ def get_remove_polygon_points(self):
 def subtract_custom_polygon( mmi, polygon_points):
     custom_polygon_component = gf.Component()
     custom_polygon_component.add_polygon(polygon_points, layer=(1, 0))
-    mmi = gf.boolean(A=mmi, B=custom_polygon_component, operation="A-B", layer=(1, 0))
-
-    mirrored_polygon_component = gf.Component()
-    mirrored_polygon_component.add_polygon(
-        [(x, -y) for x, y in polygon_points], layer=(1, 0)
-    )
-    mmi = gf.boolean(A=mmi, B=mirrored_polygon_component, operation="A-B", layer=(1, 0))
+    # the cut is symmetric about y=0: mirror the polygon by transform, subtract once
+    symmetric_polygon = mirror_union(custom_polygon_component, axis="x", layer=(1, 0))
+    mmi = gf.boolean(A=mmi, B=symmetric_polygon, operation="A-B", layer=(1, 0))
     return mmi
 
 def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper_width1: float = 0.08, taper_width2: float = 0.25,
@@ -1840,47 +1768,13 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
     taper_end = waveguide_with_supports.add_ref(taper)
     taper_end.move((start[0], start[1]+vertical_straight_length+arc_radius*2))
 
-    # Function to add support structures inside waveguide_with_supports
-    def add_supports_along_straight(x_start, y_start, length, is_vertical=False):
-        num_supports = int(round((length-2) / support_spacing,0))  # Calculate number of supports
-        # print((length-2) / support_spacing)
-        # Create support component
-        support = gf.components.taper(length=support_length, width1=width, width2=support_width, layer=layer)
-        for i in range(1, num_supports + 2 ):
-            if is_vertical:
-                support_x = x_start  # X remains the same
-                support_y = y_start + i * (support_spacing -2.6) # Increment Y for vertical section
-                # support_y = round(y_start + i * support_spacing, -1)  # Snap Y to nearest 10 µm
-            else:
-                support_x = x_start + i * support_spacing  # Increment X for horizontal section
-                support_y = y_start  # Y remains the same
-
-            if is_vertical:
-                # Flip Up-Down correctly
-                waveguide_with_supports.add_ref(support).drotate(0).move((support_x, support_y + support_length))
-                waveguide_with_supports.add_ref(support).drotate(180).move((support_x, support_y + support_length))
-                # Flip Left-Right correctly
-                waveguide_with_supports.add_ref(support).drotate(90).move((support_x, support_y))
-                waveguide_with_supports.add_ref(support).drotate(270).move((support_x, support_y+support_length*2))
-            else:
-                # Correct horizontal placement
-                waveguide_with_supports.add_ref(support).drotate(90).move((support_x, support_y + width))  # Up
-                waveguide_with_supports.add_ref(support).drotate(270).move((support_x, support_y - width))  # Down
-                waveguide_with_supports.add_ref(support).move((support_x - support_length, support_y))  # Left
-                waveguide_with_supports.add_ref(support).drotate(180).move((support_x + support_length, support_y))  # Right
-
-    # Add supports in first horizontal section
-    add_supports_along_straight(start[0] -10, start[1], first_straight_length, is_vertical=False)
-
-    # Add supports in vertical section
-    upward_section_start_x = start[0] + first_straight_length + arc_radius+taper_length
-    upward_section_start_y = start[1] + arc_radius / 2-2
-    add_supports_along_straight(upward_section_start_x, upward_section_start_y, vertical_straight_length, is_vertical=True)
-
-    # Add supports in last horizontal section
-    last_section_start_x = start[0]-10
-    last_section_start_y = upward_section_start_y + vertical_straight_length + arc_radius * 3 / 2+2
-    add_supports_along_straight(last_section_start_x, last_section_start_y, last_straight_length, is_vertical=False)
+    # Supports: one merged cross-support cell referenced every support_spacing um of path
+    # length along the waveguide core, straights and arcs alike, turned to the local direction.
+    # The legs along the core are straight, so on an arc their far ends sit
+    # support_length**2 / (2 * arc_radius) off the core centre line (~0.13 um at 35 um).
+    support = cross_support(width=width, support_width=support_width, support_length=support_length, layer=layer)
+    add_supports_along_path(waveguide_with_supports, path.points, support_spacing, support,
+                            margin=support_length, offset=(start[0] + taper_length, start[1]))
 
     # Generate the **wider path** that will be used for subtraction
     wider_width = support_length * 2
@@ -2049,13 +1943,15 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     # c.show()
     return c
 
-def merge_layer(component, layer=(1, 0)):
+def merge_layer(component, layer=(1, 0), tile_size=None, threads=None):
     """
     Merges overlapping or adjacent shapes in the specified layer.
 
     Args:
         component (gf.Component): The input photonic component.
         layer (tuple): The GDS layer to merge (default: (1, 0)).
+        tile_size (float): If set, merge in tile_size x tile_size um tiles on worker threads.
+        threads (int): Number of worker threads for the tiled merge (default: all cores).
 
     Returns:
         gf.Component: A new component with merged shapes.
@@ -2071,7 +1967,10 @@ def merge_layer(component, layer=(1, 0)):
         return merged_component  # Return the original component
 
     # Merge adjacent or overlapping polygons
-    merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
+    if tile_size:
+        merged_shapes = merge_layer_tiled(layer_shapes, layer=layer, tile_size=tile_size, threads=threads)
+    else:
+        merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
 
     # Create a new component to store the merged result
     merged_component = gf.Component()
@@ -2098,7 +1997,7 @@ def create_fillet(radius = 0.15):
 def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers):
     # Coupon mode: create coupon design (without electrodes).
     design_component = create_design(clearance_width=clearance_width,to_debug=to_debug,layers=layers)
-    c = merge_layer(design_component, layer=layers["fine_ebl_layer"])
+    c = merge_layer(design_component, layer=layers["fine_ebl_layer"], tile_size=500)
     coarse_component=merge_layer(design_component, layer=layers["coarse_ebl_layer"])
     c.add_ref(coarse_component).flatten()
     if not to_debug:
@@ -2111,23 +2010,16 @@ def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers)
         gds_output_file = os.path.join(base_directory, f"Left MDM-{today_date}.gds")
         c.write_gds(gds_output_file)
         print(f"GDS saved to {gds_output_file}")
+        write_oas(c, os.path.splitext(gds_output_file)[0] + ".oas")
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name} MDM-{today_date}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
     if not to_debug:
-        save_rotated(c, 90, "Bottom")
-        save_rotated(c, 180, "Right")
-        save_rotated(c, 270, "Top")
+        variants = [(angle, name, os.path.join(base_directory, f"{name} MDM-{today_date}.gds"))
+                    for angle, name in ((90, "Bottom"), (180, "Right"), (270, "Top"))]
+        save_rotated_variants(c, variants, base_gds=gds_output_file)
 
-    c.show()
+    gds_cache.print_stats()
+    show(c)
 
 def run_labels_mode(base_directory, today_date,layers=None):
     # Die dose_labels mode: create and save the full die dose_labels.
@@ -2195,7 +2087,7 @@ def run_labels_mode(base_directory, today_date,layers=None):
         labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
         label_component.write_gds(labels_gds_file)
         print(f"GDS saved to {labels_gds_file}")
-        label_component.show()
+        show(label_component)
 
     save_label_gds("QT-MDM3.4",layers=layers)
     save_label_gds("QT-MDM3.5",layers=layers)
@@ -2448,18 +2340,17 @@ def add_electrodes_to_coupon(coupon = gf.Component(), layers = None):
     c.add_ref(gf.components.straight(length=150, width=pad_h, layer=e_layer)).move((xp, yp))
     c.add_ref(gf.components.text(text=label_text, size=label_size, position=(xp + label_offset_x, yp +label_offset_y), layer=pad_labels_layer))
 
-    merged_layer = merge_layer(c, e_layer)
-    merged_labels = merge_layer(c, pad_labels_layer)
+    # Merge electrodes and pad labels in a single walk of the hierarchy
+    merged_layers = merge_layers(c, [e_layer, pad_labels_layer], tile_size=500)
 
-    merged_layer.add_ref(coupon)
-    merged_layer.add_ref(merged_labels)
+    merged_layers.add_ref(coupon)
 
-    return merged_layer
+    return merged_layers
 
 def run_electrodes_mode(coupon_gds_path, base_directory, today_date,layers):
     # Load the coupon design from the existing GDS file.
-    # Here we use gdsfactory's import function.
-    coupon = gf.import_gds(coupon_gds_path)
+    # The import is cached and only re-read when the file changes.
+    coupon = import_gds_cached(coupon_gds_path)
 
     # Add the electrodes to the coupon design.
     coupon_with_electrodes = add_electrodes_to_coupon(coupon,layers)
@@ -2468,21 +2359,13 @@ def run_electrodes_mode(coupon_gds_path, base_directory, today_date,layers):
     electrodes_gds_file = os.path.join(base_directory, f"Left_Electrodes_{today_date}.gds")
     coupon_with_electrodes.write_gds(electrodes_gds_file)
     print(f"Updated coupon with electrodes saved to {electrodes_gds_file}")
-    coupon_with_electrodes.show()
+    write_oas(coupon_with_electrodes, os.path.splitext(electrodes_gds_file)[0] + ".oas")
+    show(coupon_with_electrodes)
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name} MDM-{today_date}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
-    save_rotated(coupon_with_electrodes, 90, "Bottom_Electrodes")
-    save_rotated(coupon_with_electrodes, 180, "Right_Electrodes")
-    save_rotated(coupon_with_electrodes, 270, "Top_Electrodes")
+    variants = [(angle, name, os.path.join(base_directory, f"{name} MDM-{today_date}.gds"))
+                for angle, name in ((90, "Bottom_Electrodes"), (180, "Right_Electrodes"), (270, "Top_Electrodes"))]
+    save_rotated_variants(coupon_with_electrodes, variants, base_gds=electrodes_gds_file)
 
 def main():
     layers = {
@@ -2508,7 +2391,8 @@ def main():
     # mode = "labels"
     # mode = "electrodes"
 
-    coupon_gds_path = r"C:\PyLayout\PyLayout\build\gds\MDM3C_run_coupon_mode.oas"
+    # The OASIS run_coupon_mode writes (the build/gds copy only exists when show() is not "off")
+    coupon_gds_path = os.path.join(base_directory, f"Left MDM-{today_date}.oas")
 
     if mode == "coupon":
         run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers)
@@ -2521,3 +2405,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
@@ -1,5 +1,3 @@
-import shutil
-
 import numpy as np
 import gdstk
 import gdsfactory as gf
@@ -11,6 +9,14 @@ import os
 # from kfactory.kf_types import layer
 from shapely.ops import orient
 
+from boolean_ops import merge_layer_tiled, merge_layers, mirror_union, union_all, unite_lattice
+from build_manifest import BuildManifest
+from gds_export import GdsStreamWriter, save_rotated_variants, write_oas
+from gds_library import dilated_gds, gds_cache, import_gds_cached, import_ported
+from hierarchy import CellDeduper
+from supports import add_supports_along_path, cross_support
+from viewer import show, viewer
+
 def merge_references(base, refs, layer):
     """Boolean OR of `base` with each item in `refs`, flattening any nesting.
     Never passes a list into gf.boolean (prevents .is_regular_array errors)."""
@@ -35,18 +41,18 @@ def merge_references(base, refs, layer):
     if not (isinstance(base, Comp) or isinstance(base, RefTypes)):
         raise TypeError(f"merge_references: `base` must be a Component or Reference, got {type(base)}")
 
-    merged = base
+    merged = [base]
     for obj in _iter_flat(refs):
         # Only merge valid geometry carriers
         if isinstance(obj, Comp) or isinstance(obj, RefTypes):
-            # Pairwise OR; A is always a single Component (or ref), never a list
-            merged = gf.boolean(A=merged, B=obj, operation="or", layer=layer)
+            merged.append(obj)
         else:
             # Ignore junk quietly; uncomment to debug:
             # print(f"⚠️ Skipping {type(obj)}")
             pass
 
-    return merged
+    # Single n-ary OR instead of one gf.boolean per reference
+    return union_all(merged, layer=layer)
 
 
 
@@ -141,18 +147,7 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
 
     # --- Load fish or alternative resonator geometry ---
     gds_path = Path("Selected Resonators to FAB\QT14.gds") if resonator == "fish" else Path("Selected Resonators to FAB\QT10.gds")
-    fish_component = gf.import_gds(gds_path)
-    fish_component.add_port(
-        name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer_main
-    )
-
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width-0.1,0),
-        width=0.5,
-        orientation=0,
-        layer=layer_main,
-    )
+    fish_component = import_ported(gds_path, layer=layer_main)
 
 
     # Cross-section for S-bend
@@ -246,13 +241,8 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
 
     # Merge all references
 
-    # Create mirrored waveguide (bot_waveguide)
-    bot_waveguide_ref = gf.Component().add_ref(top_waveguide).mirror_y()
-    # Shift if necessary: .dmovey(dy*0) does nothing, but keep it for clarity:
-    bot_waveguide_ref.dmovey(dy * 0)
-
-    # Combine top + bottom waveguides
-    combined_dc = gf.boolean(A=top_waveguide, B=bot_waveguide_ref, operation="or", layer=layer_main)
+    # Combine top + mirrored bottom (bot_waveguide) waveguides, merging only along y=0
+    combined_dc = mirror_union(top_waveguide, axis="x", layer=layer_main)
 
     ######## Thick DC #######
 
@@ -289,11 +279,8 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     s3 = thick_dc.add_ref(final_straight)
     s3.connect(port="in", other=b2.ports["out"])
 
-    # Create bottom mirrored version
-    thick_dc_ref_bot = gf.Component().add_ref(thick_dc).mirror_y()
-
-    # Combine top and bottom thick DC into one component
-    combined_thick_dc = gf.boolean(A=thick_dc, B=thick_dc_ref_bot, operation="or", layer=layer_main)
+    # Combine top and mirrored bottom thick DC into one component
+    combined_thick_dc = mirror_union(thick_dc, axis="x", layer=layer_main)
 
     #########################
 
@@ -566,24 +553,7 @@ def add_fish_components( c, gds_file, length_mmi, taper_length, taper_separation
         list: A list of references to the added fish components.
     """
     # Import the fish component from the GDS file
-    fish_raw = gf.import_gds(Path(gds_file))
-    fish_component = gf.boolean(A=fish_raw,B=fish_raw, operation="or", layer=(1, 0))
-
-    # Add ports to the imported fish component
-    fish_component.add_port(
-        name="o1",
-        center=(0, 0),  # Define the input port position (update as needed)
-        width=0.5,  # Update the width as required
-        orientation=180,  # Facing left
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width, 0),  # Define the output port position
-        width=0.5,  # Update the width as required
-        orientation=0,  # Facing right
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
+    fish_component = import_ported(gds_file, merged=True)
 
     # Add the fish components to the parent component
     fish_ref_1 = c.add_ref(fish_component)
@@ -921,7 +891,7 @@ def debug(self):
     c = gf.Component("TOP")
     straight_c = gf.components.straight(4.5)
     straight_ref = c.add_ref(straight_c)
-    c.show()
+    show(c)
 
 def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
     """
@@ -938,31 +908,15 @@ def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(
     """
     # Early return if only one instance is needed
     if rows == 1 and cols == 1:
-        if name:
-            component.name = name
-        return component
-
-    # Create a new component to store the unified array
-    c = gf.Component()
-
-    # Place the first instance to initialize merged geometry
-    merged_device = c.add_ref(component)
-
-    # Loop through the array and place each instance, uniting it with merged_device
-    for row in range(rows):
-        for col in range(cols):
-            # Skip the first instance since it's already added as merged_device
-            if row == 0 and col == 0:
-                continue
-
-            # Calculate the position for the next component
-            x_pos = col * spacing[0]
-            y_pos = row * spacing[1]
+        if not name:
+            return component
+        # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+        single = gf.Component(name)
+        single.add_ports(single.add_ref(component).ports)
+        return single
 
-            # Place and unite each instance with the merged_device
-            next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
-
-            merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+    # Unite the whole lattice in one batched region operation
+    merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
     # Name the final merged component
     if name:
@@ -1111,8 +1065,7 @@ def add_bulls_eye( c, n_bulls_eye, offset_x):
     a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
     gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-    b = gf.import_gds(gds_file)
-    b.name = "GDS_Import"
+    b = import_gds_cached(gds_file)
 
     c.add_ref(unite_array(b, cols=n_bulls_eye, rows=1, spacing=(12.5, 12.5), name="Bulls-eye")).dmovey(-20).dmovex(offset_x + 32)
 
@@ -1158,13 +1111,9 @@ def get_remove_polygon_points(self):
 def subtract_custom_polygon( mmi, polygon_points):
     custom_polygon_component = gf.Component()
     custom_polygon_component.add_polygon(polygon_points, layer=(1, 0))
-    mmi = gf.boolean(A=mmi, B=custom_polygon_component, operation="A-B", layer=(1, 0))
-
-    mirrored_polygon_component = gf.Component()
-    mirrored_polygon_component.add_polygon(
-        [(x, -y) for x, y in polygon_points], layer=(1, 0)
-    )
-    mmi = gf.boolean(A=mmi, B=mirrored_polygon_component, operation="A-B", layer=(1, 0))
+    # the cut is symmetric about y=0: mirror the polygon by transform, subtract once
+    symmetric_polygon = mirror_union(custom_polygon_component, axis="x", layer=(1, 0))
+    mmi = gf.boolean(A=mmi, B=symmetric_polygon, operation="A-B", layer=(1, 0))
     return mmi
 
 def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper_width1: float = 0.08,
@@ -1296,91 +1245,14 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
     taper_end = waveguide_with_supports.add_ref(taper)
     taper_end.move((start[0], start[1]+vertical_straight_length+arc_radius*2))
 
-    # Function to add support structures inside waveguide_with_supports
-    def add_supports_along_straight(x_start, y_start, length, is_vertical=False):
-        num_supports = int(round((length-2) / support_spacing,0))  # Calculate number of supports
-        if is_vertical:
-            num_supports+=1
-        # Create support component
-        support = gf.components.taper(length=support_length, width1=width, width2=support_width, layer=layer)
-        for i in range(1, num_supports + 2 ):
-            if is_vertical:
-                support_x = x_start  # X remains the same
-                support_y = y_start + i * (support_spacing -2.0) # Increment Y for vertical section
-                # support_y = round(y_start + i * support_spacing, -1)  # Snap Y to nearest 10 µm
-            else:
-                support_x = x_start + i * support_spacing  # Increment X for horizontal section
-                support_y = y_start  # Y remains the same
-
-            if is_vertical:
-                # Flip Up-Down correctly
-                waveguide_with_supports.add_ref(support).drotate(0).move((support_x, support_y + support_length))
-                waveguide_with_supports.add_ref(support).drotate(180).move((support_x, support_y + support_length))
-                # Flip Left-Right correctly
-                waveguide_with_supports.add_ref(support).drotate(90).move((support_x, support_y))
-                waveguide_with_supports.add_ref(support).drotate(270).move((support_x, support_y+support_length*2))
-            else:
-                # Correct horizontal placement
-                waveguide_with_supports.add_ref(support).drotate(90).move((support_x, support_y + width))  # Up
-                waveguide_with_supports.add_ref(support).drotate(270).move((support_x, support_y - width))  # Down
-                waveguide_with_supports.add_ref(support).move((support_x - support_length, support_y))  # Left
-                waveguide_with_supports.add_ref(support).drotate(180).move((support_x + support_length, support_y))  # Right
-
-    # Function to add support structures along arc
-    def add_supports_along_arc(center_x, center_y, radius, start_angle,end_angle , dx,dy):
-        # Calculate arc length
-        arc_length = np.abs(end_angle - start_angle) * np.pi * radius / 180
-        
-        # Create support components
-        support2 = gf.components.taper(length=support_length, width1=width, width2=support_width, layer=layer)
-
-        # Add support at the middle of the arc
-        angle = np.radians(start_angle + 45)
-        # Calculate position on arc with precise shifts
-        # For 225° (45° from 180°), we need both x and y shifts
-        support_x = center_x + radius * np.cos(angle)
-        support_y = center_y + radius * np.sin(angle) 
-        # Calculate rotation angle for the support
-        # The support should be perpendicular to the tangent of the arc
-        # For a circular arc, the tangent is perpendicular to the radius vector
-        # We subtract 90 degrees to match the horizontal support pattern
-        rotation_angle = np.degrees(angle)
-        
-        # Create bent support for this specific angle
-        bent_support1 = create_bent_taper(taper_length=0, taper_width1=support_width, taper_width2=0.2, 
-                                       bend_radius=radius*0.6, bend_angle=10, enable_sbend=False)
-        
-        # Add four supports around the point
-        # Order matches the horizontal pattern: right taper expands then contracts
-        # Adjust positions to account for support length and bend radius
-        waveguide_with_supports.add_ref(bent_support1).drotate(rotation_angle + 180).move((support_x, support_y))  # Right
-        waveguide_with_supports.add_ref(bent_support1).mirror_y().drotate(rotation_angle).move((support_x, support_y))  # Left
-        waveguide_with_supports.add_ref(support2).drotate(rotation_angle + 90).move((support_x+dx, support_y-dy))  # Up
-        waveguide_with_supports.add_ref(support2).drotate(rotation_angle + 270).move((support_x-dx, support_y+dy))  # Down
-
-    # Add supports in first horizontal section
-    add_supports_along_straight(start[0] -10, start[1], first_straight_length, is_vertical=False)
-
-    # Add supports in first arc
-    first_arc_center_x = start[0] + first_straight_length + taper_length + arc_radius+14.67
-    first_arc_center_y = start[1] + arc_radius
-    add_supports_along_arc(first_arc_center_x, first_arc_center_y, arc_radius, 180, 270,0.2,0.2)
-    waveguide_with_supports.show()
-    # Add supports in vertical section
-    upward_section_start_x = start[0] + first_straight_length + arc_radius + taper_length
-    upward_section_start_y = start[1] + arc_radius / 2 - 2
-    add_supports_along_straight(upward_section_start_x, upward_section_start_y, vertical_straight_length, is_vertical=True)
-
-    # Add supports in second arc
-    second_arc_center_x = start[0] + first_straight_length + taper_length + arc_radius-35.03
-    second_arc_center_y = start[1] + vertical_straight_length + arc_radius+49.7
-    add_supports_along_arc(second_arc_center_x, second_arc_center_y, arc_radius, 270, 360,0.2,-0.2)
-    # add_supports_along_arc(second_arc_center_x, second_arc_center_y, arc_radius, 315, 360)  # Add second support at 3/4 of arc
-    # waveguide_with_supports.show()
-    # Add supports in last horizontal section
-    last_section_start_x = start[0]-10
-    last_section_start_y = upward_section_start_y + vertical_straight_length + arc_radius * 3 / 2 + 2
-    add_supports_along_straight(last_section_start_x, last_section_start_y, last_straight_length, is_vertical=False)
+    # Supports: one merged cross-support cell referenced every support_spacing um of path
+    # length along the waveguide core, straights and arcs alike, turned to the local direction.
+    # The legs along the core are straight, so on an arc their far ends sit
+    # support_length**2 / (2 * arc_radius) off the core centre line (~0.13 um at 35 um).
+    support = cross_support(width=width, support_width=support_width, support_length=support_length, layer=layer)
+    add_supports_along_path(waveguide_with_supports, path.points, support_spacing, support,
+                            margin=support_length, offset=(start[0] + taper_length, start[1]))
+    show(waveguide_with_supports)
 
     # Generate the **wider path** that will be used for subtraction
     wider_width = support_length * 2
@@ -1405,7 +1277,7 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
 
     return cutout_component
 
-def create_design(clearance_width=50,to_debug=False,layers=None):
+def create_design(clearance_width=50,to_debug=False,layers=None,hierarchical=True):
     length_mmi = 79
     total_width_mmi = 10
     width_mmi = 6
@@ -1414,6 +1286,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     directional_coupler_l = 0.42
 
     c = gf.Component()
+    rows = CellDeduper(c, flatten=not hierarchical)  # identical rows share one cell
 
 
     config = {"Long_WG":True, "Resonators":True, "N_Bulls_eye": 0, "add_logo": True, "add_rectangle": False, "add_scalebar": True, }
@@ -1430,129 +1303,129 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
 
 
     if config["Resonators"]:
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y-y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y-y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT10.gds"
         offset_y+=y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
         bbox_component = create_bbox_component(length_mmi, total_width_mmi,clearance_width=clearance_width)
         params["taper_length_in"] = 10
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y ,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y ,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT10_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT10.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT10_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT10.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT14.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT14_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT14.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT14_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT14.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT17.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT17_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT17.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT17_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT17.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT18.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT18_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT18.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT18_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT18.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT20.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT20_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT20.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT20_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT20.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
     ###################   DIRECTIONAL COUPLER   ###################
     offset_y += 12
     params["resonator_type"] = "fish"
-    c.add_ref(create_dc_design_vertical(resonator=params["resonator_type"],
+    rows.add(create_dc_design_vertical(resonator=params["resonator_type"],
                                     coupler_l=directional_coupler_l,pad_x_offset=210,pad_y_offset=23,clearance_width=clearance_width,layers=layers
-                                        )).dmovey(offset_y).dmovex(21.6).flatten()
+                                        ), dx=21.6, dy=offset_y)
     offset_y += 18
     params["resonator_type"] = "extractor"
-    c.add_ref(create_dc_design_vertical(resonator=params["resonator_type"],
-                                    coupler_l=directional_coupler_l,clearance_width=clearance_width,layers=layers)).dmovey(offset_y).dmovex(21.6).flatten()
+    rows.add(create_dc_design_vertical(resonator=params["resonator_type"],
+                                    coupler_l=directional_coupler_l,clearance_width=clearance_width,layers=layers), dx=21.6, dy=offset_y)
     # offset_y += 19
     # c.add_ref(create_dc_design_comb(resonator=params["resonator_type"],
     #                                     coupler_l=directional_coupler_l,clearance_width=clearance_width)).dmovey(offset_y).dmovex(21.6).flatten()
@@ -1562,7 +1435,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     #                                 coupler_l=directional_coupler_l,clearance_width=clearance_width)).dmovey(offset_y).dmovex(21.6).flatten()
 
     if  config["add_logo"]:
-        c.add_ref(add_logos(c)).dmovex(90).dmovey(offset_y-120).flatten()
+        rows.add(add_logos(c), dx=90, dy=offset_y-120)
 
     if config["add_scalebar"]:
         add_scalebars(c, 17, -50)
@@ -1575,7 +1448,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
                 operation="A-B",
                 layer=(1, 0),
             )
-        c.add_ref(unite_array(circ,3,3,(5,5),layer=(1,0))).dmovex(95).dmovey(offset_y-90).flatten()
+        rows.add(unite_array(circ,3,3,(5,5),layer=(1,0)), dx=95, dy=offset_y-90)
 
         circ = gf.boolean(
             A=gf.components.circle(radius=6, layer=(1, 0)), #        B=gf.components.circle(radius=3, layer=(1, 0)),
@@ -1583,7 +1456,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
             operation="A-B",
             layer=(1, 0),
         )
-        c.add_ref(unite_array(circ, 3, 3, (8, 8), layer=(1, 0))).dmovex(90).dmovey(offset_y - 55).flatten()
+        rows.add(unite_array(circ, 3, 3, (8, 8), layer=(1, 0)), dx=90, dy=offset_y - 55)
 
     ###########################    Long WG    ######################
     if config["Long_WG"]:
@@ -1595,7 +1468,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
         for i in range(3):
             start_y = -35 + i * offset_step
             end_y = offset_y+32 - i*offset_step
-            c.add_ref(create_long_waveguide(start=(0, start_y), end=(0, end_y), length=wg_length, width=0.25, arc_radius=arc_radius,clearance_width=clearance_width)).flatten()
+            rows.add(create_long_waveguide(start=(0, start_y), end=(0, end_y), length=wg_length, width=0.25, arc_radius=arc_radius,clearance_width=clearance_width))
             wg_length -= length_step
 
     ############################## TEXT !!!!!! #####################
@@ -1608,15 +1481,18 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     # c.add_ref(gf.components.straight(length=clearance_width,width=offset_y+20,layer=(1,0))).dmovex(-clearance_width).dmovey(offset_y/2-3).flatten()
 
     # c.show()
+    rows.print_stats()
     return c
 
-def merge_layer(component, layer=(1, 0)):
+def merge_layer(component, layer=(1, 0), tile_size=None, threads=None):
     """
     Merges overlapping or adjacent shapes in the specified layer.
 
     Args:
         component (gf.Component): The input photonic component.
         layer (tuple): The GDS layer to merge (default: (1, 0)).
+        tile_size (float): If set, merge in tile_size x tile_size um tiles on worker threads.
+        threads (int): Number of worker threads for the tiled merge (default: all cores).
 
     Returns:
         gf.Component: A new component with merged shapes.
@@ -1632,7 +1508,10 @@ def merge_layer(component, layer=(1, 0)):
         return merged_component  # Return the original component
 
     # Merge adjacent or overlapping polygons
-    merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
+    if tile_size:
+        merged_shapes = merge_layer_tiled(layer_shapes, layer=layer, tile_size=tile_size, threads=threads)
+    else:
+        merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
 
     # Create a new component to store the merged result
     merged_component = gf.Component()
@@ -1656,10 +1535,18 @@ def create_fillet(radius = 0.15):
 
     return result
 
-def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers):
+def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers, manifest=None):
     # Coupon mode: create coupon design (without electrodes).
+    names = ("Left", "Bottom", "Right", "Top")
+    outputs = [os.path.join(base_directory, f"{name}.gds") for name in names] + [os.path.join(base_directory, "Left.oas")]
+    params = {"clearance_width": clearance_width, "layers": layers}
+    if manifest is not None and not to_debug and manifest.is_current("coupon", outputs, params, [run_coupon_mode]):
+        print(f"Coupon in {base_directory} is up to date, skipping the rebuild")
+        return
+    gds_cache.used.clear()
+
     design_component = create_design(clearance_width=clearance_width,to_debug=to_debug,layers=layers)
-    c = merge_layer(design_component, layer=layers["fine_ebl_layer"])
+    c = merge_layer(design_component, layer=layers["fine_ebl_layer"], tile_size=500)
     # coarse_component=merge_layer(design_component, layer=layers["coarse_ebl_layer"])
     # c.add_ref(coarse_component).flatten()
     if not to_debug:
@@ -1672,25 +1559,21 @@ def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers)
         gds_output_file = os.path.join(base_directory, f"Left.gds")
         c.write_gds(gds_output_file)
         print(f"GDS saved to {gds_output_file}")
+        write_oas(c, os.path.splitext(gds_output_file)[0] + ".oas")
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
     if not to_debug:
-        save_rotated(c, 90, "Bottom")
-        save_rotated(c, 180, "Right")
-        save_rotated(c, 270, "Top")
+        variants = [(angle, name, os.path.join(base_directory, f"{name}.gds"))
+                    for angle, name in ((90, "Bottom"), (180, "Right"), (270, "Top"))]
+        save_rotated_variants(c, variants, base_gds=gds_output_file)
+
+    if manifest is not None and not to_debug:
+        manifest.record("coupon", outputs, params, [run_coupon_mode], files=gds_cache.used)
 
-    c.show()
+    gds_cache.print_stats()
+    show(c)
 
-def run_labels_mode(base_directory, today_date,layers=None):
+def run_labels_mode(base_directory, today_date,layers=None, manifest=None):
     # Die dose_labels mode: create and save the full die dose_labels.
     dose_labels = ["300","290", "280","270", "260"]
     coupon_width=373
@@ -1736,40 +1619,47 @@ def run_labels_mode(base_directory, today_date,layers=None):
     }
 
     def save_label_gds(chip_name, include_ti=True,layers=None):
-        label_component = gf.Component(name=f"labels_{chip_name}")
-
-        # Full chip frame
-        outer = gf.components.rectangle(size=(3000, 3000), layer=(4, 0))
-        inner = gf.components.rectangle(size=(2990, 2990), layer=(4, 0))
-        inner_ref = gf.Component()
-        inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
-
-        frame = gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(4, 0))
-        label_component.add_ref(frame).flatten()
-        label_component.add_ref(gf.components.text(text="3 x 3 mm", size=100, layer=(4,0))).move((0,-100))
-
-        # EBL area frame
-        outer = gf.components.rectangle(size=(2400, 2400), layer=(5, 0))
-        inner = gf.components.rectangle(size=(2390, 2390), layer=(5, 0))
-        inner_ref = gf.Component()
-        inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
-
-        frame = gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(5, 0))
-        label_component.add_ref(frame).move((300,300)).flatten()
-        label_component.add_ref(gf.components.text(text="2.4 x 2.4 mm", size=100, layer=(5, 0))).move((300, 200))
-
-        for _, (x, y, is_horizontal, add_or_sub) in positions.items():
-            label_component.add_ref(
-                create_labels_component(
-                    dose_labels, chip_name, size=50, spacing=spacing, position=(x, y), horizontal=is_horizontal,
-                    add_or_sub=add_or_sub, include_ti=include_ti,layers=layers
+        labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
+        params = {"chip_name": chip_name, "include_ti": include_ti, "layers": layers}
+        if manifest is not None and manifest.is_current(f"labels:{chip_name}", [labels_gds_file], params, [run_labels_mode]):
+            print(f"{labels_gds_file} is up to date, skipping")
+            return
+
+        # The sheet is streamed block by block (see GdsStreamWriter), so only the
+        # block being built is held in memory.
+        with GdsStreamWriter(labels_gds_file, top_name=f"labels_{chip_name}") as sheet:
+            # Full chip frame
+            outer = gf.components.rectangle(size=(3000, 3000), layer=(4, 0))
+            inner = gf.components.rectangle(size=(2990, 2990), layer=(4, 0))
+            inner_ref = gf.Component()
+            inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
+
+            sheet.add(gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(4, 0)), name=f"labels_{chip_name}_chip_frame", free=True)
+            sheet.add(gf.components.text(text="3 x 3 mm", size=100, layer=(4,0)), origin=(0, -100))
+
+            # EBL area frame
+            outer = gf.components.rectangle(size=(2400, 2400), layer=(5, 0))
+            inner = gf.components.rectangle(size=(2390, 2390), layer=(5, 0))
+            inner_ref = gf.Component()
+            inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
+
+            sheet.add(gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(5, 0)), origin=(300, 300), name=f"labels_{chip_name}_ebl_frame", free=True)
+            sheet.add(gf.components.text(text="2.4 x 2.4 mm", size=100, layer=(5, 0)), origin=(300, 200))
+
+            for side, (x, y, is_horizontal, add_or_sub) in positions.items():
+                sheet.add(
+                    create_labels_component(
+                        dose_labels, chip_name, size=50, spacing=spacing, position=(x, y), horizontal=is_horizontal,
+                        add_or_sub=add_or_sub, include_ti=include_ti,layers=layers
+                    ),
+                    name=f"labels_{chip_name}_{side}",
+                    free=True,
                 )
-            ).flatten()
 
-        labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
-        label_component.write_gds(labels_gds_file)
         print(f"GDS saved to {labels_gds_file}")
-        label_component.show()
+        show(labels_gds_file)
+        if manifest is not None:
+            manifest.record(f"labels:{chip_name}", [labels_gds_file], params, [run_labels_mode])
 
     save_label_gds("QT-MDM3.7T", include_ti=True,layers=layers)
     save_label_gds("QT-MDM3.8T", include_ti=True,layers=layers)
@@ -2025,41 +1915,42 @@ def add_electrodes_to_coupon(coupon = gf.Component(), layers = None):
     c.add_ref(gf.components.straight(length=150, width=pad_h)).move((xp, yp))
     c.add_ref(gf.components.text(text=label_text, size=label_size, position=(xp + label_offset_x, yp +label_offset_y), layer=pad_labels_layer))
 
-    merged_layer = merge_layer(c, e_layer)
-    merged_labels = merge_layer(c, pad_labels_layer)
+    # Merge electrodes and pad labels in a single walk of the hierarchy
+    merged_layers = merge_layers(c, [e_layer, pad_labels_layer], tile_size=500)
 
-    merged_layer.add_ref(coupon)
-    merged_layer.add_ref(merged_labels)
+    merged_layers.add_ref(coupon)
 
-    return merged_layer
+    return merged_layers
+
+def run_electrodes_mode(coupon_gds_path, base_directory, today_date,layers, manifest=None):
+    electrodes_gds_file = os.path.join(base_directory, f"Left_Electrodes_{today_date}.gds")
+    rotations = ((90, "Bottom_Electrodes"), (180, "Right_Electrodes"), (270, "Top_Electrodes"))
+    variants = [(angle, name, os.path.join(base_directory, f"{name} MDM-{today_date}.gds")) for angle, name in rotations]
+    outputs = [electrodes_gds_file, os.path.splitext(electrodes_gds_file)[0] + ".oas"] + [path for _, _, path in variants]
+    params = {"coupon_gds_path": coupon_gds_path, "layers": layers}
+    if manifest is not None and manifest.is_current("electrodes", outputs, params, [run_electrodes_mode]):
+        print(f"Electrodes in {base_directory} are up to date, skipping the rebuild")
+        return
+    gds_cache.used.clear()
 
-def run_electrodes_mode(coupon_gds_path, base_directory, today_date,layers):
     # Load the coupon design from the existing GDS file.
-    # Here we use gdsfactory's import function.
-    coupon = gf.import_gds(coupon_gds_path)
+    # The import is cached and only re-read when the file changes.
+    coupon = import_gds_cached(coupon_gds_path)
 
     # Add the electrodes to the coupon design.
     coupon_with_electrodes = add_electrodes_to_coupon(coupon,layers)
 
     # Save the updated design to a new GDS file.
-    electrodes_gds_file = os.path.join(base_directory, f"Left_Electrodes_{today_date}.gds")
     coupon_with_electrodes.write_gds(electrodes_gds_file)
     print(f"Updated coupon with electrodes saved to {electrodes_gds_file}")
-    coupon_with_electrodes.show()
+    write_oas(coupon_with_electrodes, os.path.splitext(electrodes_gds_file)[0] + ".oas")
+    show(coupon_with_electrodes)
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name} MDM-{today_date}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
-    save_rotated(coupon_with_electrodes, 90, "Bottom_Electrodes")
-    save_rotated(coupon_with_electrodes, 180, "Right_Electrodes")
-    save_rotated(coupon_with_electrodes, 270, "Top_Electrodes")
+    save_rotated_variants(coupon_with_electrodes, variants, base_gds=electrodes_gds_file)
+
+    if manifest is not None:
+        manifest.record("electrodes", outputs, params, [run_electrodes_mode], files=gds_cache.used)
 
 def main():
     layers = {
@@ -2083,6 +1974,7 @@ def main():
 
     output_dir = os.path.join(base_directory, today_date)
     os.makedirs(output_dir, exist_ok=True)
+    manifest = BuildManifest(output_dir)  # inputs and provenance of every output in output_dir
 
 
     # Mode selection: coupon (default), labels, or electrodes
@@ -2090,20 +1982,19 @@ def main():
     # mode = "labels"
     # mode = "electrodes"
 
-    coupon_gds_path = r"C:\PyLayout\PyLayout\build\gds\MDM3C_run_coupon_mode.oas"
+    # The OASIS run_coupon_mode writes (the build/gds copy only exists when show() is not "off")
+    coupon_gds_path = os.path.join(output_dir, "Left.oas")
 
     if mode == "coupon":
-        run_coupon_mode(output_dir, today_date, clearance_width,to_debug,layers)
+        run_coupon_mode(output_dir, today_date, clearance_width,to_debug,layers, manifest=manifest)
     elif mode == "labels":
-        run_labels_mode(output_dir, today_date,layers)
+        run_labels_mode(output_dir, today_date,layers, manifest=manifest)
     elif mode == "electrodes":
-        run_electrodes_mode(coupon_gds_path, output_dir, today_date,layers)
+        run_electrodes_mode(coupon_gds_path, output_dir, today_date,layers, manifest=manifest)
     else:
         print(f"Unknown mode '{mode}'. Please choose 'coupon', 'labels', or 'electrodes'.")
 
-    if not to_debug: # Copy this script to the output directory
-        current_script = os.path.abspath(__file__)
-        shutil.copy(current_script, output_dir)
-
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
@@ -1,5 +1,3 @@
-import shutil
-
 import numpy as np
 import gdstk
 import gdsfactory as gf
@@ -11,6 +9,15 @@ import os
 # from kfactory.kf_types import layer
 from shapely.ops import orient
 
+from boolean_ops import boolean_cache, clearance_trench, lazy, merge_layer_tiled, merge_layers, mirror_union, offset_path, union_all, unite_lattice
+from build_manifest import BuildManifest
+from gcR_alld_highNA_red import add_polygons, grating_teeth, slab_rectangles
+from gds_export import GdsStreamWriter, save_rotated_variants, write_oas
+from gds_library import dilated_gds, gds_cache, import_gds_cached, import_ported
+from hierarchy import CellDeduper
+from supports import add_supports_along_path, cross_support
+from viewer import show, viewer
+
 def merge_references(base, refs, layer):
     """Boolean OR of `base` with each item in `refs`, flattening any nesting.
     Never passes a list into gf.boolean (prevents .is_regular_array errors)."""
@@ -35,18 +42,18 @@ def merge_references(base, refs, layer):
     if not (isinstance(base, Comp) or isinstance(base, RefTypes)):
         raise TypeError(f"merge_references: `base` must be a Component or Reference, got {type(base)}")
 
-    merged = base
+    merged = [base]
     for obj in _iter_flat(refs):
         # Only merge valid geometry carriers
         if isinstance(obj, Comp) or isinstance(obj, RefTypes):
-            # Pairwise OR; A is always a single Component (or ref), never a list
-            merged = gf.boolean(A=merged, B=obj, operation="or", layer=layer)
+            merged.append(obj)
         else:
             # Ignore junk quietly; uncomment to debug:
             # print(f"⚠️ Skipping {type(obj)}")
             pass
 
-    return merged
+    # Single n-ary OR instead of one gf.boolean per reference
+    return union_all(merged, layer=layer)
 
 def create_spring_vertical(c, cross_section, comb_spine):
     """
@@ -139,18 +146,7 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
 
     # --- Load fish or alternative resonator geometry ---
     gds_path = Path("Selected Resonators to FAB\QT14.gds") if resonator == "fish" else Path("Selected Resonators to FAB\QT10.gds")
-    fish_component = gf.import_gds(gds_path)
-    fish_component.add_port(
-        name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer_main
-    )
-
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width-0.1,0),
-        width=0.5,
-        orientation=0,
-        layer=layer_main,
-    )
+    fish_component = import_ported(gds_path, layer=layer_main)
 
 
     # Cross-section for S-bend
@@ -236,21 +232,11 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     refs.append(vertical_supports)
 
     # --- Construct top waveguide geometry with boolean OR ---
-    top_waveguide = gf.boolean(
-        A=taper_small_in_ref, B=taper1_ref, operation="or", layer=layer_main
-    )
+    # (lazy: the boolean chain below is evaluated once, when dc_positive is built)
+    top_waveguide = lazy(refs, layer_main)
 
-    top_waveguide = merge_references(top_waveguide, refs, layer_main)
-
-    # Merge all references
-
-    # Create mirrored waveguide (bot_waveguide)
-    bot_waveguide_ref = gf.Component().add_ref(top_waveguide).mirror_y()
-    # Shift if necessary: .dmovey(dy*0) does nothing, but keep it for clarity:
-    bot_waveguide_ref.dmovey(dy * 0)
-
-    # Combine top + bottom waveguides
-    combined_dc = gf.boolean(A=top_waveguide, B=bot_waveguide_ref, operation="or", layer=layer_main)
+    # Combine top + mirrored bottom (bot_waveguide) waveguides, merging only along y=0
+    combined_dc = top_waveguide.symmetric("x")
 
     ######## Thick DC #######
 
@@ -287,11 +273,8 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     s3 = thick_dc.add_ref(final_straight)
     s3.connect(port="in", other=b2.ports["out"])
 
-    # Create bottom mirrored version
-    thick_dc_ref_bot = gf.Component().add_ref(thick_dc).mirror_y()
-
-    # Combine top and bottom thick DC into one component
-    combined_thick_dc = gf.boolean(A=thick_dc, B=thick_dc_ref_bot, operation="or", layer=layer_main)
+    # Combine top and mirrored bottom thick DC
+    combined_thick_dc = lazy(thick_dc, layer_main).symmetric("x")
 
     #########################
 
@@ -302,7 +285,7 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
         bounding_rect = gf.components.straight(length=5.9, width=dy * 2.5 + 0.6)
     bounding_rect_ref = c.add_ref(bounding_rect).dmovex(25.5)
     bounding_ext = c.add_ref(gf.components.straight(length=clearance_width,width=50)).dmovex(-21.6-clearance_width)
-    bounding_rect_ref = gf.boolean(A=bounding_rect_ref, B=bounding_ext, operation="or", layer=layer_main)
+    bounding_rect_ref = lazy(bounding_rect_ref, layer_main) | bounding_ext
     # pad_h = 150
     # pad_l = 150
     # ext1 = c.add_ref(gf.components.straight(length=pad_x_offset+10, width=6, layer=layer_main)).dmovex(30)
@@ -311,9 +294,9 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     #     ext1 = gf.boolean(A=ext1, B=ext2, operation="or", layer=layer_main)
     # bounding_rect_ref = gf.boolean(A=bounding_rect_ref, B=ext1, operation="or", layer=layer_main)
 
-    bounding_rect_ref = c.add_ref(gf.boolean(A=bounding_rect_ref, B=combined_thick_dc, operation="or", layer=layer_main))
+    bounding_rect_ref = bounding_rect_ref | combined_thick_dc
 
-    dc_positive = gf.boolean(A=bounding_rect_ref, B=combined_dc, operation="A-B", layer=layer_main)
+    dc_positive = (bounding_rect_ref - combined_dc).to_component(cache=boolean_cache)
 
 
     result_c= gf.Component()
@@ -564,24 +547,7 @@ def add_fish_components( c, gds_file, length_mmi, taper_length, taper_separation
         list: A list of references to the added fish components.
     """
     # Import the fish component from the GDS file
-    fish_raw = gf.import_gds(Path(gds_file))
-    fish_component = gf.boolean(A=fish_raw,B=fish_raw, operation="or", layer=(1, 0))
-
-    # Add ports to the imported fish component
-    fish_component.add_port(
-        name="o1",
-        center=(0, 0),  # Define the input port position (update as needed)
-        width=0.5,  # Update the width as required
-        orientation=180,  # Facing left
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width, 0),  # Define the output port position
-        width=0.5,  # Update the width as required
-        orientation=0,  # Facing right
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
+    fish_component = import_ported(gds_file, merged=True)
 
     # Add the fish components to the parent component
     fish_ref_1 = c.add_ref(fish_component)
@@ -607,24 +573,7 @@ def add_fish( c, gds_file):
         list: A list of references to the added fish components.
     """
     # Import the fish component from the GDS file
-    fish_raw = gf.import_gds(Path(gds_file))
-    fish_component = gf.boolean(A=fish_raw,B=fish_raw, operation="or", layer=(1, 0))
-
-    # Add ports to the imported fish component
-    fish_component.add_port(
-        name="o1",
-        center=(0, 0),  # Define the input port position (update as needed)
-        width=0.5,  # Update the width as required
-        orientation=180,  # Facing left
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width, 0),  # Define the output port position
-        width=0.5,  # Update the width as required
-        orientation=0,  # Facing right
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
+    fish_component = import_ported(gds_file, merged=True)
 
     # Add the fish components to the parent component
     fish_ref = c.add_ref(fish_component)
@@ -918,11 +867,12 @@ def logo( name=None):
     Mid_CR2 = c.add_ref(gf.components.circle(radius=1.35, layer=(1, 0))).dmovex(3).dmovey(-3)
     Mid_CR3 = c.add_ref(gf.components.circle(radius=1.75, layer=(1, 0))).dmovex(3).dmovey(-3)
     Mid_CR4 = c.add_ref(gf.components.circle(radius=2, layer=(1, 0))).dmovex(3).dmovey(-3)
-    CR = c.add_ref(gf.boolean(A=Big_CR, B=Mid_CR4, operation="A-B", layer=(1, 0)))
+    # Boolean chain is built lazily and evaluated once at the end
+    CR = lazy(Big_CR) - lazy(Mid_CR4)
 
-    right_bottom_small_cir = c.add_ref(gf.boolean(A=Big_CR, B=Mid_CR1, operation="and", layer=(1, 0)))
-    right_bottom_shape = gf.boolean(A=Mid_CR3, B=Mid_CR2, operation="A-B", layer=(1, 0))
-    right_bottom_shape = gf.boolean(A=right_bottom_shape, B=right_bottom_small_cir, operation="or", layer=(1, 0))
+    right_bottom_small_cir = lazy(Big_CR) & lazy(Mid_CR1)
+    right_bottom_shape = lazy(Mid_CR3) - lazy(Mid_CR2)
+    right_bottom_shape = right_bottom_shape | right_bottom_small_cir
 
     PT = c.add_ref(gf.path.extrude(
         gf.Path([(0.0000, 4.0000), (0.0000, 2.5000), (-1.4000, 1.1000), (-1.4000, -1.1000), (0.0000, -2.5000), (0.0000, -4.0000)]), layer=(1, 0),
@@ -934,20 +884,20 @@ def logo( name=None):
     sbend2.connect(port="in", other=sbend1.ports["out"])
     sbend3 = c.add_ref(gf.components.bend_s(size=(1.15, .5), cross_section=x))
     sbend3.connect(port="in", other=sbend2.ports["out"])
-    sbend3_cut = c.add_ref(gf.boolean(A=sbend3, B=ToCut, operation="A-B", layer=(1, 0)))
+    sbend3_cut = lazy(sbend3) - lazy(ToCut)
 
-    mrg = gf.boolean(A=sbend3_cut, B=sbend2, operation="or", layer=(1, 0))
+    mrg = sbend3_cut | sbend2
 
-    mrg = gf.boolean(A=mrg, B=sbend1, operation="or", layer=(1, 0))
+    mrg = mrg | sbend1
 
-    mrg = gf.boolean(A=mrg, B=PT, operation="or", layer=(1, 0))
+    mrg = mrg | PT
 
-    center_logo = gf.boolean(A=CR, B=mrg, operation="A-B", layer=(1, 0))
-    mrg1 = gf.boolean(A=center_logo, B=right_bottom_shape, operation="or", layer=(1, 0))
-    qt_logo = gf.boolean(A=mrg1, B=Small_CR, operation="or", layer=(1, 0))
+    center_logo = CR - mrg
+    mrg1 = center_logo | right_bottom_shape
+    qt_logo = mrg1 | Small_CR
 
     s1 = gf.Component().add_ref(gf.components.straight(length=0.3, width=1.5)).dmovex(2.85).dmovey(-5)
-    qt_logo = gf.boolean(A=qt_logo, B=s1, operation="A-B", layer=(1, 0))
+    qt_logo = (qt_logo - s1).to_component()
 
     if not name==None:
         qt_logo.name = name
@@ -958,7 +908,7 @@ def debug(self):
     c = gf.Component("TOP")
     straight_c = gf.components.straight(4.5)
     straight_ref = c.add_ref(straight_c)
-    c.show()
+    show(c)
 
 def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
     """
@@ -975,31 +925,15 @@ def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(
     """
     # Early return if only one instance is needed
     if rows == 1 and cols == 1:
-        if name:
-            component.name = name
-        return component
-
-    # Create a new component to store the unified array
-    c = gf.Component()
-
-    # Place the first instance to initialize merged geometry
-    merged_device = c.add_ref(component)
-
-    # Loop through the array and place each instance, uniting it with merged_device
-    for row in range(rows):
-        for col in range(cols):
-            # Skip the first instance since it's already added as merged_device
-            if row == 0 and col == 0:
-                continue
-
-            # Calculate the position for the next component
-            x_pos = col * spacing[0]
-            y_pos = row * spacing[1]
-
-            # Place and unite each instance with the merged_device
-            next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
+        if not name:
+            return component
+        # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+        single = gf.Component(name)
+        single.add_ports(single.add_ref(component).ports)
+        return single
 
-            merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+    # Unite the whole lattice in one batched region operation
+    merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
     # Name the final merged component
     if name:
@@ -1148,8 +1082,7 @@ def add_bulls_eye( c, n_bulls_eye, offset_x):
     a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
     gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-    b = gf.import_gds(gds_file)
-    b.name = "GDS_Import"
+    b = import_gds_cached(gds_file)
 
     c.add_ref(unite_array(b, cols=n_bulls_eye, rows=1, spacing=(12.5, 12.5), name="Bulls-eye")).dmovey(-20).dmovex(offset_x + 32)
 
@@ -1195,15 +1128,12 @@ def get_remove_polygon_points(self):
 def subtract_custom_polygon( mmi, polygon_points):
     custom_polygon_component = gf.Component()
     custom_polygon_component.add_polygon(polygon_points, layer=(1, 0))
-    mmi = gf.boolean(A=mmi, B=custom_polygon_component, operation="A-B", layer=(1, 0))
-
-    mirrored_polygon_component = gf.Component()
-    mirrored_polygon_component.add_polygon(
-        [(x, -y) for x, y in polygon_points], layer=(1, 0)
-    )
-    mmi = gf.boolean(A=mmi, B=mirrored_polygon_component, operation="A-B", layer=(1, 0))
+    # the cut is symmetric about y=0: mirror the polygon by transform, subtract once
+    symmetric_polygon = mirror_union(custom_polygon_component, axis="x", layer=(1, 0))
+    mmi = gf.boolean(A=mmi, B=symmetric_polygon, operation="A-B", layer=(1, 0))
     return mmi
 
+@gf.cell
 def gcR_alld_highNA_red(
         xin: float = 0,
         yin: float = 0,
@@ -1231,6 +1161,10 @@ def gcR_alld_highNA_red(
         # layer_strp=(1, 0),
         layer_excite=(10, 0),  # excitation layer
 ):
+    """
+    Grating coupler cell, cached by @gf.cell on its full parameter set: repeated
+    calls with the same parameters return the same cell.
+    """
     c = gf.Component()
 
     gc_straight_length_true = gc_straight_length - gc_fill_factor * gc_period
@@ -1240,34 +1174,10 @@ def gcR_alld_highNA_red(
     y_rect_slab_min = gc_width_grating / 2 + width_brdg_sprt
     y_rect_slab_max = width_slb
     brdg_dx = 0
-    rect_post_tpr_top = c.add_polygon([(xin_rect_slab, y_rect_slab_min),
-                                       (xin_rect_slab, y_rect_slab_max),
-                                       (xout_rect_slab, y_rect_slab_max),
-                                       (xout_rect_slab, y_rect_slab_min)], layer=layer_rdg)
-
-    rect_post_tpr_btm = c.add_polygon([(xin_rect_slab, -y_rect_slab_min),
-                                       (xin_rect_slab, -y_rect_slab_max),
-                                       (xout_rect_slab, -y_rect_slab_max),
-                                       (xout_rect_slab, -y_rect_slab_min)], layer=layer_rdg)
-
-    comb_gc_ref = []
-
-    for i in range(gc_n_periods):
-        # print(i)
-
-        gc_xin = xin_rect_slab + gc_excitaion_x_lft + i * gc_period
-        gc_gap_width = round((1 - gc_fill_factor) * gc_period * 1E3) / 1E3
-
-        if (i == 0):
-            gc_clad_in_x = gc_xin
-        if (i == gc_n_periods - 1):
-            gc_clad_out_x = gc_xin + gc_gap_width
-
-        comb_gc_ref.append(c.add_polygon([(gc_xin, -gc_width_grating / 2),
-                                          (gc_xin + gc_gap_width, -gc_width_grating / 2),
-                                          (gc_xin + gc_gap_width, gc_width_grating / 2),
-                                          (gc_xin, gc_width_grating / 2)], layer=layer_rdg)
-                           )
+    add_polygons(c, np.concatenate([
+        slab_rectangles(xin_rect_slab, xout_rect_slab, y_rect_slab_min, y_rect_slab_max),
+        grating_teeth(xin_rect_slab + gc_excitaion_x_lft, gc_n_periods, gc_period, gc_fill_factor, gc_width_grating),
+    ]), layer=layer_rdg)
 
     # excitation
     x_excite = gc_excitaion_x_lft + gc_excitaion_x_offgc
@@ -1361,7 +1271,7 @@ def create_resonator_gc(component_type: str, taper_length: float = 10, taper_wid
 
     tpr3 = c_temp.add_ref(gf.components.taper(length=2.5, width1=0.95, width2=0.45)).dmovex(fish_ref.ports['o2'].center[0]-0.09)
     gc_right = c.add_ref(gf.boolean(A=gcR_alld_primitive_ref2, B=tpr3,operation="A-B", layer=layer)).dmovex(-0.2)
-    c.show()
+    show(c)
 
     # layers_to_merge = [layer] if isinstance(layer, tuple) else [tuple(layer)]
     # merged_component = component.extract(layers=layers_to_merge)
@@ -1379,8 +1289,8 @@ def create_resonator_gc(component_type: str, taper_length: float = 10, taper_wid
     subtracted_fish = gf.boolean(A=bbox, B=fish_ref, operation="A-B", layer=layer)
     rect2remove= gf.components.straight(length = 0.16,width = 0.72).dmovex(fish_ref.ports['o2'].center[0]-0.09)
     fish1 = c.add_ref(gf.boolean(A=subtracted_fish, B=rect2remove, layer=layer))
-    c_temp.show()
-    c.show()
+    show(c_temp)
+    show(c)
     resonator = os.path.splitext(os.path.basename(component_type))[0]
     if IsSupported:
         resonator = resonator + "-s"
@@ -1398,7 +1308,7 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
                           taper_length: float = 10, taper_width1: float = 0.08,clearance_width=50):
     """
     Creates a long waveguide with defined start and end points using straights and arcs,
-    adding supports and subtracting the waveguide (with tapers & supports) from a wider path.
+    adding supports and cutting an offset-based clearance trench around it.
 
     Args:
         start (tuple): Starting coordinates of the waveguide (x, y).
@@ -1414,7 +1324,7 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
         taper_width1 (float): Starting width of the taper. Default is 0.08 µm.
 
     Returns:
-        gf.Component: The generated waveguide component with supports and subtracted wider path.
+        gf.Component: The clearance trench around the waveguide with supports.
     """
     component = gf.Component()
 
@@ -1454,116 +1364,35 @@ def create_long_waveguide(start: tuple, end: tuple, length: float, width: float
     taper_end = waveguide_with_supports.add_ref(taper)
     taper_end.move((start[0], start[1]+vertical_straight_length+arc_radius*2))
 
-    # Function to add support structures inside waveguide_with_supports
-    def add_supports_along_straight(x_start, y_start, length, is_vertical=False):
-        num_supports = int(round((length-2) / support_spacing,0))  # Calculate number of supports
-        if is_vertical:
-            num_supports+=1
-        # Create support component
-        support = gf.components.taper(length=support_length, width1=width, width2=support_width, layer=layer)
-        for i in range(1, num_supports + 2 ):
-            if is_vertical:
-                support_x = x_start  # X remains the same
-                support_y = y_start + i * (support_spacing -2.0) # Increment Y for vertical section
-                # support_y = round(y_start + i * support_spacing, -1)  # Snap Y to nearest 10 µm
-            else:
-                support_x = x_start + i * support_spacing  # Increment X for horizontal section
-                support_y = y_start  # Y remains the same
-
-            if is_vertical:
-                # Flip Up-Down correctly
-                waveguide_with_supports.add_ref(support).drotate(0).move((support_x, support_y + support_length))
-                waveguide_with_supports.add_ref(support).drotate(180).move((support_x, support_y + support_length))
-                # Flip Left-Right correctly
-                waveguide_with_supports.add_ref(support).drotate(90).move((support_x, support_y))
-                waveguide_with_supports.add_ref(support).drotate(270).move((support_x, support_y+support_length*2))
-            else:
-                # Correct horizontal placement
-                waveguide_with_supports.add_ref(support).drotate(90).move((support_x, support_y + width))  # Up
-                waveguide_with_supports.add_ref(support).drotate(270).move((support_x, support_y - width))  # Down
-                waveguide_with_supports.add_ref(support).move((support_x - support_length, support_y))  # Left
-                waveguide_with_supports.add_ref(support).drotate(180).move((support_x + support_length, support_y))  # Right
-
-    # Function to add support structures along arc
-    def add_supports_along_arc(center_x, center_y, radius, start_angle,end_angle , dx,dy):
-        # Calculate arc length
-        arc_length = np.abs(end_angle - start_angle) * np.pi * radius / 180
-        
-        # Create support components
-        support2 = gf.components.taper(length=support_length, width1=width, width2=support_width, layer=layer)
-
-        # Add support at the middle of the arc
-        angle = np.radians(start_angle + 45)
-        # Calculate position on arc with precise shifts
-        # For 225° (45° from 180°), we need both x and y shifts
-        support_x = center_x + radius * np.cos(angle)
-        support_y = center_y + radius * np.sin(angle) 
-        # Calculate rotation angle for the support
-        # The support should be perpendicular to the tangent of the arc
-        # For a circular arc, the tangent is perpendicular to the radius vector
-        # We subtract 90 degrees to match the horizontal support pattern
-        rotation_angle = np.degrees(angle)
-        
-        # Create bent support for this specific angle
-        bent_support1 = create_bent_taper(taper_length=0, taper_width1=support_width, taper_width2=0.2, 
-                                       bend_radius=radius*0.6, bend_angle=10, enable_sbend=False)
-        
-        # Add four supports around the point
-        # Order matches the horizontal pattern: right taper expands then contracts
-        # Adjust positions to account for support length and bend radius
-        waveguide_with_supports.add_ref(bent_support1).drotate(rotation_angle + 180).move((support_x, support_y))  # Right
-        waveguide_with_supports.add_ref(bent_support1).mirror_y().drotate(rotation_angle).move((support_x, support_y))  # Left
-        waveguide_with_supports.add_ref(support2).drotate(rotation_angle + 90).move((support_x+dx, support_y-dy))  # Up
-        waveguide_with_supports.add_ref(support2).drotate(rotation_angle + 270).move((support_x-dx, support_y+dy))  # Down
-
-    # Add supports in first horizontal section
-    add_supports_along_straight(start[0] -10, start[1], first_straight_length, is_vertical=False)
-
-    # Add supports in first arc
-    first_arc_center_x = start[0] + first_straight_length + taper_length + arc_radius+14.67
-    first_arc_center_y = start[1] + arc_radius
-    add_supports_along_arc(first_arc_center_x, first_arc_center_y, arc_radius, 180, 270,0.2,0.2)
-    waveguide_with_supports.show()
-    # Add supports in vertical section
-    upward_section_start_x = start[0] + first_straight_length + arc_radius + taper_length
-    upward_section_start_y = start[1] + arc_radius / 2 - 2
-    add_supports_along_straight(upward_section_start_x, upward_section_start_y, vertical_straight_length, is_vertical=True)
-
-    # Add supports in second arc
-    second_arc_center_x = start[0] + first_straight_length + taper_length + arc_radius-35.03
-    second_arc_center_y = start[1] + vertical_straight_length + arc_radius+49.7
-    add_supports_along_arc(second_arc_center_x, second_arc_center_y, arc_radius, 270, 360,0.2,-0.2)
-    # add_supports_along_arc(second_arc_center_x, second_arc_center_y, arc_radius, 315, 360)  # Add second support at 3/4 of arc
-    # waveguide_with_supports.show()
-    # Add supports in last horizontal section
-    last_section_start_x = start[0]-10
-    last_section_start_y = upward_section_start_y + vertical_straight_length + arc_radius * 3 / 2 + 2
-    add_supports_along_straight(last_section_start_x, last_section_start_y, last_straight_length, is_vertical=False)
-
-    # Generate the **wider path** that will be used for subtraction
-    wider_width = support_length * 2
-    # Extend the wider path by adding a 10 µm straight section at the beginning and end
-    wider_path = gf.Path()
-    wider_path.append(gf.path.straight(length=taper_length+clearance_width))
-    wider_path.append(path)  # Original path
-    wider_path.append(gf.path.straight(length=taper_length+clearance_width))
-
-    wider_waveguide = gf.path.extrude(wider_path, layer=layer, width=wider_width)
-    wider_waveguide_ref = component.add_ref(wider_waveguide)
-    wider_waveguide_ref.move((start[0]-clearance_width, start[1]))
-
-    clearance_rect = gf.Component().add_ref(gf.components.straight(length=clearance_width,width=20)).move((start[0]-clearance_width, start[1]))
-    wider_waveguide_ref = gf.boolean(A=wider_waveguide_ref, B=clearance_rect, operation='or', layer=layer)
-    clearance_rect = gf.Component().add_ref(gf.components.straight(length=clearance_width, width=20)).move((start[0] - clearance_width, end[1]))
-    wider_waveguide_ref = gf.boolean(A=wider_waveguide_ref,B=clearance_rect,operation='or', layer=layer)
-
-    # Subtract the entire waveguide (with tapers and supports) from the wider waveguide
-    cutout_component = gf.boolean(A=wider_waveguide_ref, B=waveguide_with_supports, operation="A-B", layer=layer)
+    # Supports: one merged cross-support cell referenced every support_spacing um of path
+    # length along the waveguide core, straights and arcs alike, turned to the local direction.
+    # The legs along the core are straight, so on an arc their far ends sit
+    # support_length**2 / (2 * arc_radius) off the core centre line (~0.13 um at 35 um).
+    support = cross_support(width=width, support_width=support_width, support_length=support_length, layer=layer)
+    add_supports_along_path(waveguide_with_supports, path.points, support_spacing, support,
+                            margin=support_length, offset=(start[0] + taper_length, start[1]))
+    show(waveguide_with_supports)
+
+    # Clearance trench: buffer the waveguide core so the trench reaches support_length from
+    # the centre line everywhere, arcs included. The tapers change width, so their centre
+    # lines are buffered instead of their outlines. The supports are not buffered: they
+    # cross the trench and anchor the waveguide.
+    taper_axes = offset_path([taper_start.ports["o1"].dcenter, taper_start.ports["o2"].dcenter], support_length)
+    taper_axes |= offset_path([taper_end.ports["o1"].dcenter, taper_end.ports["o2"].dcenter], support_length)
+    trench = clearance_trench(
+        [(waveguide_ref, support_length - width / 2), (taper_axes, 0)],
+        device=waveguide_with_supports,
+        layer=layer,
+    )
+
+    clearance_rect_start = gf.Component().add_ref(gf.components.straight(length=clearance_width, width=20)).move((start[0] - clearance_width, start[1]))
+    clearance_rect_end = gf.Component().add_ref(gf.components.straight(length=clearance_width, width=20)).move((start[0] - clearance_width, end[1]))
+    cutout_component = (lazy(trench, layer) | clearance_rect_start | clearance_rect_end).to_component()
     component.add_ref(cutout_component)
 
     return cutout_component
 
-def create_design(clearance_width=50,to_debug=False,layers=None):
+def create_design(clearance_width=50,to_debug=False,layers=None,hierarchical=True):
     length_mmi = 79
     total_width_mmi = 10
     width_mmi = 6
@@ -1572,6 +1401,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     directional_coupler_l = 0.42
 
     c = gf.Component()
+    rows = CellDeduper(c, flatten=not hierarchical)  # identical rows share one cell
 
 
     config = {"Long_WG":True, "Resonators":True, "N_Bulls_eye": 0, "add_logo": True, "add_rectangle": False, "add_scalebar": True, }
@@ -1588,129 +1418,129 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
 
 
     if config["Resonators"]:
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y-y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y-y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT10.gds"
         offset_y+=y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
         bbox_component = create_bbox_component(length_mmi, total_width_mmi,clearance_width=clearance_width)
         params["taper_length_in"] = 10
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y ,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y ,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT10_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT10.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT10_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT10.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT14.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT14_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT14.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT14_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT14.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT17.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT17_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT17.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT17_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT17.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT18.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT18_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT18.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT18_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT18.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT20.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT20_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT20.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT20_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT20.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
     ###################   DIRECTIONAL COUPLER   ###################
     offset_y += 12
     params["resonator_type"] = "fish"
-    c.add_ref(create_dc_design_vertical(resonator=params["resonator_type"],
+    rows.add(create_dc_design_vertical(resonator=params["resonator_type"],
                                     coupler_l=directional_coupler_l,pad_x_offset=210,pad_y_offset=23,clearance_width=clearance_width,layers=layers
-                                        )).dmovey(offset_y).dmovex(21.6).flatten()
+                                        ), dx=21.6, dy=offset_y)
     offset_y += 18
     params["resonator_type"] = "extractor"
-    c.add_ref(create_dc_design_vertical(resonator=params["resonator_type"],
-                                    coupler_l=directional_coupler_l,clearance_width=clearance_width,layers=layers)).dmovey(offset_y).dmovex(21.6).flatten()
+    rows.add(create_dc_design_vertical(resonator=params["resonator_type"],
+                                    coupler_l=directional_coupler_l,clearance_width=clearance_width,layers=layers), dx=21.6, dy=offset_y)
     # offset_y += 19
     # c.add_ref(create_dc_design_comb(resonator=params["resonator_type"],
     #                                     coupler_l=directional_coupler_l,clearance_width=clearance_width)).dmovey(offset_y).dmovex(21.6).flatten()
@@ -1720,7 +1550,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     #                                 coupler_l=directional_coupler_l,clearance_width=clearance_width)).dmovey(offset_y).dmovex(21.6).flatten()
 
     if  config["add_logo"]:
-        c.add_ref(add_logos(c)).dmovex(90).dmovey(offset_y-120).flatten()
+        rows.add(add_logos(c), dx=90, dy=offset_y-120)
 
     if config["add_scalebar"]:
         add_scalebars(c, 17, -50)
@@ -1733,7 +1563,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
                 operation="A-B",
                 layer=(1, 0),
             )
-        c.add_ref(unite_array(circ,3,3,(5,5),layer=(1,0))).dmovex(95).dmovey(offset_y-90).flatten()
+        rows.add(unite_array(circ,3,3,(5,5),layer=(1,0)), dx=95, dy=offset_y-90)
 
         circ = gf.boolean(
             A=gf.components.circle(radius=6, layer=(1, 0)), #        B=gf.components.circle(radius=3, layer=(1, 0)),
@@ -1741,7 +1571,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
             operation="A-B",
             layer=(1, 0),
         )
-        c.add_ref(unite_array(circ, 3, 3, (8, 8), layer=(1, 0))).dmovex(90).dmovey(offset_y - 55).flatten()
+        rows.add(unite_array(circ, 3, 3, (8, 8), layer=(1, 0)), dx=90, dy=offset_y - 55)
 
     ###########################    Long WG    ######################
     if config["Long_WG"]:
@@ -1753,7 +1583,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
         for i in range(3):
             start_y = -35 + i * offset_step
             end_y = offset_y+32 - i*offset_step
-            c.add_ref(create_long_waveguide(start=(0, start_y), end=(0, end_y), length=wg_length, width=0.25, arc_radius=arc_radius,clearance_width=clearance_width)).flatten()
+            rows.add(create_long_waveguide(start=(0, start_y), end=(0, end_y), length=wg_length, width=0.25, arc_radius=arc_radius,clearance_width=clearance_width))
             wg_length -= length_step
 
     ############################## TEXT !!!!!! #####################
@@ -1766,15 +1596,18 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     # c.add_ref(gf.components.straight(length=clearance_width,width=offset_y+20,layer=(1,0))).dmovex(-clearance_width).dmovey(offset_y/2-3).flatten()
 
     # c.show()
+    rows.print_stats()
     return c
 
-def merge_layer(component, layer=(1, 0)):
+def merge_layer(component, layer=(1, 0), tile_size=None, threads=None):
     """
     Merges overlapping or adjacent shapes in the specified layer.
 
     Args:
         component (gf.Component): The input photonic component.
         layer (tuple): The GDS layer to merge (default: (1, 0)).
+        tile_size (float): If set, merge in tile_size x tile_size um tiles on worker threads.
+        threads (int): Number of worker threads for the tiled merge (default: all cores).
 
     Returns:
         gf.Component: A new component with merged shapes.
@@ -1790,7 +1623,10 @@ def merge_layer(component, layer=(1, 0)):
         return merged_component  # Return the original component
 
     # Merge adjacent or overlapping polygons
-    merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
+    if tile_size:
+        merged_shapes = merge_layer_tiled(layer_shapes, layer=layer, tile_size=tile_size, threads=threads)
+    else:
+        merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
 
     # Create a new component to store the merged result
     merged_component = gf.Component()
@@ -1814,10 +1650,18 @@ def create_fillet(radius = 0.15):
 
     return result
 
-def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers):
+def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers, manifest=None):
     # Coupon mode: create coupon design (without electrodes).
+    names = ("Left",)
+    outputs = [os.path.join(base_directory, f"{name}.gds") for name in names] + [os.path.join(base_directory, "Left.oas")]
+    params = {"clearance_width": clearance_width, "layers": layers}
+    if manifest is not None and not to_debug and manifest.is_current("coupon", outputs, params, [run_coupon_mode]):
+        print(f"Coupon in {base_directory} is up to date, skipping the rebuild")
+        return
+    gds_cache.used.clear()
+
     design_component = create_design(clearance_width=clearance_width,to_debug=to_debug,layers=layers)
-    c = merge_layer(design_component, layer=layers["fine_ebl_layer"])
+    c = merge_layer(design_component, layer=layers["fine_ebl_layer"], tile_size=500)
     # coarse_component=merge_layer(design_component, layer=layers["coarse_ebl_layer"])
     # c.add_ref(coarse_component).flatten()
     if not to_debug:
@@ -1830,25 +1674,22 @@ def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers)
         gds_output_file = os.path.join(base_directory, f"Left.gds")
         c.write_gds(gds_output_file)
         print(f"GDS saved to {gds_output_file}")
+        write_oas(c, os.path.splitext(gds_output_file)[0] + ".oas")
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
     # if not to_debug:
-    #     save_rotated(c, 90, "Bottom")
-    #     save_rotated(c, 180, "Right")
-    #     save_rotated(c, 270, "Top")
+    #     variants = [(angle, name, os.path.join(base_directory, f"{name}.gds"))
+    #                 for angle, name in ((90, "Bottom"), (180, "Right"), (270, "Top"))]
+    #     save_rotated_variants(c, variants, base_gds=gds_output_file)
+
+    if manifest is not None and not to_debug:
+        manifest.record("coupon", outputs, params, [run_coupon_mode], files=gds_cache.used)
 
-    c.show()
+    boolean_cache.print_stats()
+    gds_cache.print_stats()
+    show(c)
 
-def run_labels_mode(base_directory, today_date,layers=None):
+def run_labels_mode(base_directory, today_date,layers=None, manifest=None):
     # Die dose_labels mode: create and save the full die dose_labels.
     dose_labels = ["300","290", "280","270", "260"]
     coupon_width=373
@@ -1894,40 +1735,47 @@ def run_labels_mode(base_directory, today_date,layers=None):
     }
 
     def save_label_gds(chip_name, include_ti=True,layers=None):
-        label_component = gf.Component(name=f"labels_{chip_name}")
-
-        # Full chip frame
-        outer = gf.components.rectangle(size=(3000, 3000), layer=(4, 0))
-        inner = gf.components.rectangle(size=(2990, 2990), layer=(4, 0))
-        inner_ref = gf.Component()
-        inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
-
-        frame = gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(4, 0))
-        label_component.add_ref(frame).flatten()
-        label_component.add_ref(gf.components.text(text="3 x 3 mm", size=100, layer=(4,0))).move((0,-100))
-
-        # EBL area frame
-        outer = gf.components.rectangle(size=(2400, 2400), layer=(5, 0))
-        inner = gf.components.rectangle(size=(2390, 2390), layer=(5, 0))
-        inner_ref = gf.Component()
-        inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
-
-        frame = gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(5, 0))
-        label_component.add_ref(frame).move((300,300)).flatten()
-        label_component.add_ref(gf.components.text(text="2.4 x 2.4 mm", size=100, layer=(5, 0))).move((300, 200))
-
-        for _, (x, y, is_horizontal, add_or_sub) in positions.items():
-            label_component.add_ref(
-                create_labels_component(
-                    dose_labels, chip_name, size=50, spacing=spacing, position=(x, y), horizontal=is_horizontal,
-                    add_or_sub=add_or_sub, include_ti=include_ti,layers=layers
+        labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
+        params = {"chip_name": chip_name, "include_ti": include_ti, "layers": layers}
+        if manifest is not None and manifest.is_current(f"labels:{chip_name}", [labels_gds_file], params, [run_labels_mode]):
+            print(f"{labels_gds_file} is up to date, skipping")
+            return
+
+        # The sheet is streamed block by block (see GdsStreamWriter), so only the
+        # block being built is held in memory.
+        with GdsStreamWriter(labels_gds_file, top_name=f"labels_{chip_name}") as sheet:
+            # Full chip frame
+            outer = gf.components.rectangle(size=(3000, 3000), layer=(4, 0))
+            inner = gf.components.rectangle(size=(2990, 2990), layer=(4, 0))
+            inner_ref = gf.Component()
+            inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
+
+            sheet.add(gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(4, 0)), name=f"labels_{chip_name}_chip_frame", free=True)
+            sheet.add(gf.components.text(text="3 x 3 mm", size=100, layer=(4,0)), origin=(0, -100))
+
+            # EBL area frame
+            outer = gf.components.rectangle(size=(2400, 2400), layer=(5, 0))
+            inner = gf.components.rectangle(size=(2390, 2390), layer=(5, 0))
+            inner_ref = gf.Component()
+            inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
+
+            sheet.add(gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(5, 0)), origin=(300, 300), name=f"labels_{chip_name}_ebl_frame", free=True)
+            sheet.add(gf.components.text(text="2.4 x 2.4 mm", size=100, layer=(5, 0)), origin=(300, 200))
+
+            for side, (x, y, is_horizontal, add_or_sub) in positions.items():
+                sheet.add(
+                    create_labels_component(
+                        dose_labels, chip_name, size=50, spacing=spacing, position=(x, y), horizontal=is_horizontal,
+                        add_or_sub=add_or_sub, include_ti=include_ti,layers=layers
+                    ),
+                    name=f"labels_{chip_name}_{side}",
+                    free=True,
                 )
-            ).flatten()
 
-        labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
-        label_component.write_gds(labels_gds_file)
         print(f"GDS saved to {labels_gds_file}")
-        label_component.show()
+        show(labels_gds_file)
+        if manifest is not None:
+            manifest.record(f"labels:{chip_name}", [labels_gds_file], params, [run_labels_mode])
 
     save_label_gds("QT-MDM3.7T", include_ti=True,layers=layers)
     save_label_gds("QT-MDM3.8T", include_ti=True,layers=layers)
@@ -2183,41 +2031,42 @@ def add_electrodes_to_coupon(coupon = gf.Component(), layers = None):
     c.add_ref(gf.components.straight(length=150, width=pad_h)).move((xp, yp))
     c.add_ref(gf.components.text(text=label_text, size=label_size, position=(xp + label_offset_x, yp +label_offset_y), layer=pad_labels_layer))
 
-    merged_layer = merge_layer(c, e_layer)
-    merged_labels = merge_layer(c, pad_labels_layer)
+    # Merge electrodes and pad labels in a single walk of the hierarchy
+    merged_layers = merge_layers(c, [e_layer, pad_labels_layer], tile_size=500)
+
+    merged_layers.add_ref(coupon)
 
-    merged_layer.add_ref(coupon)
-    merged_layer.add_ref(merged_labels)
+    return merged_layers
 
-    return merged_layer
+def run_electrodes_mode(coupon_gds_path, base_directory, today_date,layers, manifest=None):
+    electrodes_gds_file = os.path.join(base_directory, f"Left_Electrodes_{today_date}.gds")
+    rotations = ((90, "Bottom_Electrodes"), (180, "Right_Electrodes"), (270, "Top_Electrodes"))
+    variants = [(angle, name, os.path.join(base_directory, f"{name} MDM-{today_date}.gds")) for angle, name in rotations]
+    outputs = [electrodes_gds_file, os.path.splitext(electrodes_gds_file)[0] + ".oas"] + [path for _, _, path in variants]
+    params = {"coupon_gds_path": coupon_gds_path, "layers": layers}
+    if manifest is not None and manifest.is_current("electrodes", outputs, params, [run_electrodes_mode]):
+        print(f"Electrodes in {base_directory} are up to date, skipping the rebuild")
+        return
+    gds_cache.used.clear()
 
-def run_electrodes_mode(coupon_gds_path, base_directory, today_date,layers):
     # Load the coupon design from the existing GDS file.
-    # Here we use gdsfactory's import function.
-    coupon = gf.import_gds(coupon_gds_path)
+    # The import is cached and only re-read when the file changes.
+    coupon = import_gds_cached(coupon_gds_path)
 
     # Add the electrodes to the coupon design.
     coupon_with_electrodes = add_electrodes_to_coupon(coupon,layers)
 
     # Save the updated design to a new GDS file.
-    electrodes_gds_file = os.path.join(base_directory, f"Left_Electrodes_{today_date}.gds")
     coupon_with_electrodes.write_gds(electrodes_gds_file)
     print(f"Updated coupon with electrodes saved to {electrodes_gds_file}")
-    coupon_with_electrodes.show()
+    write_oas(coupon_with_electrodes, os.path.splitext(electrodes_gds_file)[0] + ".oas")
+    show(coupon_with_electrodes)
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name} MDM-{today_date}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
-    save_rotated(coupon_with_electrodes, 90, "Bottom_Electrodes")
-    save_rotated(coupon_with_electrodes, 180, "Right_Electrodes")
-    save_rotated(coupon_with_electrodes, 270, "Top_Electrodes")
+    save_rotated_variants(coupon_with_electrodes, variants, base_gds=electrodes_gds_file)
+
+    if manifest is not None:
+        manifest.record("electrodes", outputs, params, [run_electrodes_mode], files=gds_cache.used)
 
 def main():
     layers = {
@@ -2241,6 +2090,7 @@ def main():
 
     output_dir = os.path.join(base_directory, today_date)
     os.makedirs(output_dir, exist_ok=True)
+    manifest = BuildManifest(output_dir)  # inputs and provenance of every output in output_dir
 
 
     # Mode selection: coupon (default), labels, or electrodes
@@ -2248,20 +2098,19 @@ def main():
     # mode = "labels"
     # mode = "electrodes"
 
-    coupon_gds_path = r"C:\PyLayout\PyLayout\build\gds\MDM3C_run_coupon_mode.oas"
+    # The OASIS run_coupon_mode writes (the build/gds copy only exists when show() is not "off")
+    coupon_gds_path = os.path.join(output_dir, "Left.oas")
 
     if mode == "coupon":
-        run_coupon_mode(output_dir, today_date, clearance_width,to_debug,layers)
+        run_coupon_mode(output_dir, today_date, clearance_width,to_debug,layers, manifest=manifest)
     elif mode == "labels":
-        run_labels_mode(output_dir, today_date,layers)
+        run_labels_mode(output_dir, today_date,layers, manifest=manifest)
     elif mode == "electrodes":
-        run_electrodes_mode(coupon_gds_path, output_dir, today_date,layers)
+        run_electrodes_mode(coupon_gds_path, output_dir, today_date,layers, manifest=manifest)
     else:
         print(f"Unknown mode '{mode}'. Please choose 'coupon', 'labels', or 'electrodes'.")
 
-    if not to_debug: # Copy this script to the output directory
-        current_script = os.path.abspath(__file__)
-        shutil.copy(current_script, output_dir)
-
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
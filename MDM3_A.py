@@ -6,6 +6,10 @@ from pathlib import Path
 from datetime import datetime
 import os
 
+from boolean_ops import mirror_union, unite_lattice
+from gds_library import import_gds_cached, import_ported
+from viewer import show, viewer
+
 
 
 # # ------------------------------------------
@@ -157,9 +161,7 @@ def create_dc_design(resonator="fish",width_resonator=0.54):
     layer = (1, 0)
 
     # Load fish component
-    fish_component = gf.import_gds(Path('QT14.gds' if resonator == 'fish' else 'QT10.gds'))
-    fish_component.add_port(name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer)
-    fish_component.add_port(name="o2", center=(fish_component.size_info.width, 0), width=0.5, orientation=0, layer=layer)
+    fish_component = import_ported('QT14.gds' if resonator == 'fish' else 'QT10.gds', layer=layer)
 
     x = gf.CrossSection(sections=[gf.Section(width=width, layer=layer, port_names=("in", "out"))])
 
@@ -465,23 +467,7 @@ def add_fish_components( c, gds_file, length_mmi, taper_length, taper_separation
         list: A list of references to the added fish components.
     """
     # Import the fish component from the GDS file
-    fish_component = gf.import_gds(Path(gds_file))
-
-    # Add ports to the imported fish component
-    fish_component.add_port(
-        name="o1",
-        center=(0, 0),  # Define the input port position (update as needed)
-        width=0.5,  # Update the width as required
-        orientation=180,  # Facing left
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width, 0),  # Define the output port position
-        width=0.5,  # Update the width as required
-        orientation=0,  # Facing right
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
+    fish_component = import_ported(gds_file)
 
     # Add the fish components to the parent component
     fish_ref_1 = c.add_ref(fish_component)
@@ -819,7 +805,7 @@ def debug(self):
     c = gf.Component("TOP")
     straight_c = gf.components.straight(4.5)
     straight_ref = c.add_ref(straight_c)
-    c.show()
+    show(c)
 
 def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
     """
@@ -836,31 +822,15 @@ def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(
     """
     # Early return if only one instance is needed
     if rows == 1 and cols == 1:
-        if name:
-            component.name = name
-        return component
-
-    # Create a new component to store the unified array
-    c = gf.Component()
-
-    # Place the first instance to initialize merged geometry
-    merged_device = c.add_ref(component)
-
-    # Loop through the array and place each instance, uniting it with merged_device
-    for row in range(rows):
-        for col in range(cols):
-            # Skip the first instance since it’s already added as merged_device
-            if row == 0 and col == 0:
-                continue
-
-            # Calculate the position for the next component
-            x_pos = col * spacing[0]
-            y_pos = row * spacing[1]
+        if not name:
+            return component
+        # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+        single = gf.Component(name)
+        single.add_ports(single.add_ref(component).ports)
+        return single
 
-            # Place and unite each instance with the merged_device
-            next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
-
-            merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+    # Unite the whole lattice in one batched region operation
+    merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
     # Name the final merged component
     if name:
@@ -1005,8 +975,7 @@ def add_bulls_eye( c, n_bulls_eye, offset_x):
     a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
     gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-    b = gf.import_gds(gds_file)
-    b.name = "GDS_Import"
+    b = import_gds_cached(gds_file)
 
     c.add_ref(unite_array(b, cols=n_bulls_eye, rows=1, spacing=(12.5, 12.5), name="Bulls-eye")).dmovey(-20).dmovex(offset_x + 32)
 
@@ -1052,13 +1021,9 @@ def get_remove_polygon_points(self):
 def subtract_custom_polygon( mmi, polygon_points):
     custom_polygon_component = gf.Component()
     custom_polygon_component.add_polygon(polygon_points, layer=(1, 0))
-    mmi = gf.boolean(A=mmi, B=custom_polygon_component, operation="A-B", layer=(1, 0))
-
-    mirrored_polygon_component = gf.Component()
-    mirrored_polygon_component.add_polygon(
-        [(x, -y) for x, y in polygon_points], layer=(1, 0)
-    )
-    mmi = gf.boolean(A=mmi, B=mirrored_polygon_component, operation="A-B", layer=(1, 0))
+    # the cut is symmetric about y=0: mirror the polygon by transform, subtract once
+    symmetric_polygon = mirror_union(custom_polygon_component, axis="x", layer=(1, 0))
+    mmi = gf.boolean(A=mmi, B=symmetric_polygon, operation="A-B", layer=(1, 0))
     return mmi
 
 def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper_width1: float = 0.08, taper_width2: float = 0.25,
@@ -1150,7 +1115,7 @@ def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper
             circle_ref=gf.boolean(A=circle_ref,B=gf.Component().add_ref(gf.components.straight(length=taper_length+3,
                                                                                                width=arc_radius*2-.57)).dmovey(
                 y_spacing-1.5+arc_radius),operation='or')
-            component.show()
+            show(component)
 
     support = component.add_ref(gf.components.straight(length=0.3, width=6)).dmovex(taper_length + 2 - 0.15).dmovey(y_spacing)
 
@@ -1539,11 +1504,13 @@ def main():
     output_file = os.path.join(base_directory, f"MDMA-{today_date}.gds")
 
     # merged_component.write_gds(output_file)
-    merged_component.show()
+    show(merged_component)
     print(f"Design saved to {output_file}")
 
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
 
 
 
@@ -6,6 +6,10 @@ from pathlib import Path
 from datetime import datetime
 import os
 
+from boolean_ops import mirror_union, unite_lattice
+from gds_library import import_gds_cached, import_ported
+from viewer import show, viewer
+
 
 def create_bent_taper(taper_length, taper_width1, taper_width2, bend_radius, bend_angle, enable_sbend=False):
     """
@@ -275,23 +279,7 @@ class PhotonicDesign:
             list: A list of references to the added fish components.
         """
         # Import the fish component from the GDS file
-        fish_component = gf.import_gds(Path(gds_file))
-
-        # Add ports to the imported fish component
-        fish_component.add_port(
-            name="o1",
-            center=(0, 0),  # Define the input port position (update as needed)
-            width=0.5,  # Update the width as required
-            orientation=180,  # Facing left
-            layer=(1, 0)  # Adjust the layer if necessary
-        )
-        fish_component.add_port(
-            name="o2",
-            center=(fish_component.size_info.width, 0),  # Define the output port position
-            width=0.5,  # Update the width as required
-            orientation=0,  # Facing right
-            layer=(1, 0)  # Adjust the layer if necessary
-        )
+        fish_component = import_ported(gds_file)
 
         # Add the fish components to the parent component
         fish_ref_1 = c.add_ref(fish_component)
@@ -632,7 +620,7 @@ class PhotonicDesign:
         c = gf.Component("TOP")
         straight_c = gf.components.straight(4.5)
         straight_ref = c.add_ref(straight_c)
-        c.show()
+        show(c)
 
     def unite_array(self, component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
         """
@@ -649,31 +637,15 @@ class PhotonicDesign:
         """
         # Early return if only one instance is needed
         if rows == 1 and cols == 1:
-            if name:
-                component.name = name
-            return component
-
-        # Create a new component to store the unified array
-        c = gf.Component()
-
-        # Place the first instance to initialize merged geometry
-        merged_device = c.add_ref(component)
-
-        # Loop through the array and place each instance, uniting it with merged_device
-        for row in range(rows):
-            for col in range(cols):
-                # Skip the first instance since it’s already added as merged_device
-                if row == 0 and col == 0:
-                    continue
-
-                # Calculate the position for the next component
-                x_pos = col * spacing[0]
-                y_pos = row * spacing[1]
+            if not name:
+                return component
+            # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+            single = gf.Component(name)
+            single.add_ports(single.add_ref(component).ports)
+            return single
 
-                # Place and unite each instance with the merged_device
-                next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
-
-                merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+        # Unite the whole lattice in one batched region operation
+        merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
         # Name the final merged component
         if name:
@@ -822,8 +794,7 @@ class PhotonicDesign:
         a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
         gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-        b = gf.import_gds(gds_file)
-        b.name = "GDS_Import"
+        b = import_gds_cached(gds_file)
 
         c.add_ref(self.unite_array(b, cols=n_bulls_eye, rows=1, spacing=(12.5, 12.5), name="Bulls-eye")).dmovey(-20).dmovex(offset_x + 32)
 
@@ -869,13 +840,9 @@ class PhotonicDesign:
     def subtract_custom_polygon(self, mmi, polygon_points):
         custom_polygon_component = gf.Component()
         custom_polygon_component.add_polygon(polygon_points, layer=(1, 0))
-        mmi = gf.boolean(A=mmi, B=custom_polygon_component, operation="A-B", layer=(1, 0))
-
-        mirrored_polygon_component = gf.Component()
-        mirrored_polygon_component.add_polygon(
-            [(x, -y) for x, y in polygon_points], layer=(1, 0)
-        )
-        mmi = gf.boolean(A=mmi, B=mirrored_polygon_component, operation="A-B", layer=(1, 0))
+        # the cut is symmetric about y=0: mirror the polygon by transform, subtract once
+        symmetric_polygon = mirror_union(custom_polygon_component, axis="x", layer=(1, 0))
+        mmi = gf.boolean(A=mmi, B=symmetric_polygon, operation="A-B", layer=(1, 0))
         return mmi
 
     def create_design(self, debug=True):
@@ -999,7 +966,7 @@ class PhotonicDesign:
             c.add_ref(gf.components.text(text=str(i), size=15)).dmovex(x_offset).dmovey(y_offset).flatten()
 
 
-        c.show()
+        show(c)
         return c
 
 
@@ -1148,3 +1115,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
@@ -6,6 +6,10 @@ from pathlib import Path
 from datetime import datetime
 import os
 
+from boolean_ops import unite_lattice
+from gds_library import import_gds_cached
+from viewer import show, viewer
+
 def create_rounded_rectangle(length, width, corner_radius, layer):
     """Creates a rectangle with rounded corners as a polygon."""
     if corner_radius > 0:
@@ -45,7 +49,7 @@ class PhotonicDesign:
         return taper_up, taper_down
 
     def add_fish_components(self,c, gds_file, length_mmi, taper_length, taper_separation):
-        fish_component = gf.import_gds(Path(gds_file))
+        fish_component = import_gds_cached(gds_file)
         c.add_ref(fish_component).dmove((length_mmi + taper_length * 2 - 4, taper_separation / 2))
         c.add_ref(fish_component).dmove((length_mmi + taper_length * 2 - 4, -taper_separation / 2))
 
@@ -178,7 +182,7 @@ class PhotonicDesign:
         c = gf.Component("TOP")
         straight_c = gf.components.straight(4.5)
         straight_ref = c.add_ref(straight_c)
-        c.show()
+        show(c)
 
     def unite_array(self, component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
         """
@@ -195,31 +199,15 @@ class PhotonicDesign:
         """
         # Early return if only one instance is needed
         if rows == 1 and cols == 1:
-            if name:
-                component.name = name
-            return component
-
-        # Create a new component to store the unified array
-        c = gf.Component()
-
-        # Place the first instance to initialize merged geometry
-        merged_device = c.add_ref(component)
-
-        # Loop through the array and place each instance, uniting it with merged_device
-        for row in range(rows):
-            for col in range(cols):
-                # Skip the first instance since it’s already added as merged_device
-                if row == 0 and col == 0:
-                    continue
-
-                # Calculate the position for the next component
-                x_pos = col * spacing[0]
-                y_pos = row * spacing[1]
-
-                # Place and unite each instance with the merged_device
-                next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
+            if not name:
+                return component
+            # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+            single = gf.Component(name)
+            single.add_ports(single.add_ref(component).ports)
+            return single
 
-                merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+        # Unite the whole lattice in one batched region operation
+        merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
         # Name the final merged component
         if name:
@@ -376,8 +364,7 @@ class PhotonicDesign:
             a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
             gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-            b = gf.import_gds(gds_file)
-            b.name = "GDS_Import"
+            b = import_gds_cached(gds_file)
 
             if is_resist_positive:
                 b = gf.boolean(A=a, B=b, operation="A-B", layer=(1, 0))
@@ -394,7 +381,7 @@ class PhotonicDesign:
             self.add_scalebar(component=c, size=100, position=(additional_patterns_offset + 25, -25), font_size=10)
             self.add_scalebar(component=c, size=10, position=(additional_patterns_offset + 30, -30), font_size=5)
 
-        c.show()
+        show(c)
         return c
 
 def main():
@@ -418,3 +405,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
@@ -9,6 +9,11 @@ import os
 from kfactory.kf_types import layer
 from shapely.ops import orient
 
+from boolean_ops import merge_layer_tiled, mirror_union, union_all, unite_lattice
+from gds_export import save_rotated_variants, write_oas
+from gds_library import gds_cache, import_gds_cached, import_ported
+from viewer import show, viewer
+
 
 # # ------------------------------------------
 # # KLayout Macro: Save Layout as High-Res PNG
@@ -167,11 +172,8 @@ def merge_references(base, refs, layer):
 
     flatten(refs)  # Flatten input list
 
-    # Perform boolean OR operation on all valid references
-    for ref in flattened_refs:
-        merged = gf.boolean(A=merged, B=ref, operation="or", layer=layer)
-
-    return merged
+    # Merge base and all valid references in a single region operation
+    return union_all([merged] + flattened_refs, layer=layer)
 
 
 def create_spring(c, cross_section, start_pos):
@@ -322,18 +324,7 @@ def create_dc_design(resonator="fish", width_resonator=0.54,coupler_l=0.42,clear
 
     # --- Load fish or alternative resonator geometry ---
     gds_path = Path("QT14_v1.gds") if resonator == "fish" else Path("QT10.gds")
-    fish_component = gf.import_gds(gds_path)
-    fish_component.add_port(
-        name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer_main
-    )
-
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width - 0.002,0),
-        width=0.5,
-        orientation=0,
-        layer=layer_main,
-    )
+    fish_component = import_ported(gds_path, layer=layer_main)
 
 
     # Cross-section for S-bend
@@ -492,13 +483,8 @@ def create_dc_design(resonator="fish", width_resonator=0.54,coupler_l=0.42,clear
 
     # Merge all references
 
-    # Create mirrored waveguide (bot_waveguide)
-    bot_waveguide_ref = gf.Component().add_ref(top_waveguide).mirror_y()
-    # Shift if necessary: .dmovey(dy*0) does nothing, but keep it for clarity:
-    bot_waveguide_ref.dmovey(dy * 0)
-
-    # Combine top + bottom waveguides
-    combined_dc = gf.boolean(A=top_waveguide, B=bot_waveguide_ref, operation="or", layer=layer_main)
+    # Combine top + mirrored bottom (bot_waveguide) waveguides, merging only along y=0
+    combined_dc = mirror_union(top_waveguide, axis="x", layer=layer_main)
 
     #########################
 
@@ -535,11 +521,8 @@ def create_dc_design(resonator="fish", width_resonator=0.54,coupler_l=0.42,clear
     s3 = thick_dc.add_ref(final_straight)
     s3.connect(port="in", other=b2.ports["out"])
 
-    # Create bottom mirrored version
-    thick_dc_ref_bot = gf.Component().add_ref(thick_dc).mirror_y()
-
-    # Combine top and bottom thick DC into one component
-    combined_thick_dc = gf.boolean(A=thick_dc, B=thick_dc_ref_bot, operation="or", layer=layer_main)
+    # Combine top and mirrored bottom thick DC into one component
+    combined_thick_dc = mirror_union(thick_dc, axis="x", layer=layer_main)
 
     #########################
 
@@ -808,23 +791,7 @@ def add_fish_components( c, gds_file, length_mmi, taper_length, taper_separation
         list: A list of references to the added fish components.
     """
     # Import the fish component from the GDS file
-    fish_component = gf.import_gds(Path(gds_file))
-
-    # Add ports to the imported fish component
-    fish_component.add_port(
-        name="o1",
-        center=(0, 0),  # Define the input port position (update as needed)
-        width=0.5,  # Update the width as required
-        orientation=180,  # Facing left
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width, 0),  # Define the output port position
-        width=0.5,  # Update the width as required
-        orientation=0,  # Facing right
-        layer=(1, 0)  # Adjust the layer if necessary
-    )
+    fish_component = import_ported(gds_file)
 
     # Add the fish components to the parent component
     fish_ref_1 = c.add_ref(fish_component)
@@ -1162,7 +1129,7 @@ def debug(self):
     c = gf.Component("TOP")
     straight_c = gf.components.straight(4.5)
     straight_ref = c.add_ref(straight_c)
-    c.show()
+    show(c)
 
 def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
     """
@@ -1179,31 +1146,15 @@ def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(
     """
     # Early return if only one instance is needed
     if rows == 1 and cols == 1:
-        if name:
-            component.name = name
-        return component
-
-    # Create a new component to store the unified array
-    c = gf.Component()
-
-    # Place the first instance to initialize merged geometry
-    merged_device = c.add_ref(component)
-
-    # Loop through the array and place each instance, uniting it with merged_device
-    for row in range(rows):
-        for col in range(cols):
-            # Skip the first instance since it’s already added as merged_device
-            if row == 0 and col == 0:
-                continue
-
-            # Calculate the position for the next component
-            x_pos = col * spacing[0]
-            y_pos = row * spacing[1]
+        if not name:
+            return component
+        # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+        single = gf.Component(name)
+        single.add_ports(single.add_ref(component).ports)
+        return single
 
-            # Place and unite each instance with the merged_device
-            next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
-
-            merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+    # Unite the whole lattice in one batched region operation
+    merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
     # Name the final merged component
     if name:
@@ -1352,8 +1303,7 @@ def add_bulls_eye( c, n_bulls_eye, offset_x):
     a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
     gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-    b = gf.import_gds(gds_file)
-    b.name = "GDS_Import"
+    b = import_gds_cached(gds_file)
 
     c.add_ref(unite_array(b, cols=n_bulls_eye, rows=1, spacing=(12.5, 12.5), name="Bulls-eye")).dmovey(-20).dmovex(offset_x + 32)
 
@@ -1399,13 +1349,9 @@ def get_remove_polygon_points(self):
 def subtract_custom_polygon( mmi, polygon_points):
     custom_polygon_component = gf.Component()
     custom_polygon_component.add_polygon(polygon_points, layer=(1, 0))
-    mmi = gf.boolean(A=mmi, B=custom_polygon_component, operation="A-B", layer=(1, 0))
-
-    mirrored_polygon_component = gf.Component()
-    mirrored_polygon_component.add_polygon(
-        [(x, -y) for x, y in polygon_points], layer=(1, 0)
-    )
-    mmi = gf.boolean(A=mmi, B=mirrored_polygon_component, operation="A-B", layer=(1, 0))
+    # the cut is symmetric about y=0: mirror the polygon by transform, subtract once
+    symmetric_polygon = mirror_union(custom_polygon_component, axis="x", layer=(1, 0))
+    mmi = gf.boolean(A=mmi, B=symmetric_polygon, operation="A-B", layer=(1, 0))
     return mmi
 
 def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper_width1: float = 0.08, taper_width2: float = 0.25,
@@ -1820,13 +1766,15 @@ def create_design(clearance_width=50,to_debug=False):
     return c
 
 
-def merge_layer(component, layer=(1, 0)):
+def merge_layer(component, layer=(1, 0), tile_size=None, threads=None):
     """
     Merges overlapping or adjacent shapes in the specified layer.
 
     Args:
         component (gf.Component): The input photonic component.
         layer (tuple): The GDS layer to merge (default: (1, 0)).
+        tile_size (float): If set, merge in tile_size x tile_size um tiles on worker threads.
+        threads (int): Number of worker threads for the tiled merge (default: all cores).
 
     Returns:
         gf.Component: A new component with merged shapes.
@@ -1840,7 +1788,10 @@ def merge_layer(component, layer=(1, 0)):
         return component  # Return the original component
 
     # Merge adjacent or overlapping polygons
-    merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
+    if tile_size:
+        merged_shapes = merge_layer_tiled(layer_shapes, layer=layer, tile_size=tile_size, threads=threads)
+    else:
+        merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
 
     # Create a new component to store the merged result
     merged_component = gf.Component("Merged_Design")
@@ -1871,7 +1822,7 @@ def create_fillet(radius = 0.15):
 
 def run_coupon_mode(base_directory, today_date, clearance_width,to_debug):
     # Coupon mode: create coupon design (without electrodes).
-    c = merge_layer(create_design(clearance_width=clearance_width,to_debug=to_debug), layer=(1, 0))
+    c = merge_layer(create_design(clearance_width=clearance_width,to_debug=to_debug), layer=(1, 0), tile_size=500)
     if not to_debug:
         c.add_ref(gf.components.straight(length=10, width=50)).dmovey(-65.5).dmovex(-clearance_width).flatten()
         c.add_ref(gf.components.straight(length=10, width=50)).dmovey(191).dmovex(-clearance_width).flatten()
@@ -1880,23 +1831,16 @@ def run_coupon_mode(base_directory, today_date, clearance_width,to_debug):
         gds_output_file = os.path.join(base_directory, f"Left MDM-{today_date}.gds")
         c.write_gds(gds_output_file)
         print(f"GDS saved to {gds_output_file}")
+        write_oas(c, os.path.splitext(gds_output_file)[0] + ".oas")
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name} MDM-{today_date}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
     if not to_debug:
-        save_rotated(c, 90, "Bottom")
-        save_rotated(c, 180, "Right")
-        save_rotated(c, 270, "Top")
+        variants = [(angle, name, os.path.join(base_directory, f"{name} MDM-{today_date}.gds"))
+                    for angle, name in ((90, "Bottom"), (180, "Right"), (270, "Top"))]
+        save_rotated_variants(c, variants, base_gds=gds_output_file)
 
-    c.show()
+    gds_cache.print_stats()
+    show(c)
 
 
 def run_labels_mode(base_directory, today_date):
@@ -1960,7 +1904,7 @@ def run_labels_mode(base_directory, today_date):
         labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
         label_component.write_gds(labels_gds_file)
         print(f"GDS saved to {labels_gds_file}")
-        label_component.show()
+        show(label_component)
 
     save_label_gds("QT-MDM3.4")
     save_label_gds("QT-MDM3.5")
@@ -2115,8 +2059,8 @@ def add_electrodes_to_coupon(coupon = gf.Component()):
 
 def run_electrodes_mode(coupon_gds_path, base_directory, today_date):
     # Load the coupon design from the existing GDS file.
-    # Here we use gdsfactory's import function.
-    coupon = gf.import_gds(coupon_gds_path)
+    # The import is cached and only re-read when the file changes.
+    coupon = import_gds_cached(coupon_gds_path)
 
     # Add the electrodes to the coupon design.
     coupon_with_electrodes = add_electrodes_to_coupon(coupon)
@@ -2125,7 +2069,8 @@ def run_electrodes_mode(coupon_gds_path, base_directory, today_date):
     electrodes_gds_file = os.path.join(base_directory, f"Electrodes_{today_date}.gds")
     coupon_with_electrodes.write_gds(electrodes_gds_file)
     print(f"Updated coupon with electrodes saved to {electrodes_gds_file}")
-    coupon_with_electrodes.show()
+    write_oas(coupon_with_electrodes, os.path.splitext(electrodes_gds_file)[0] + ".oas")
+    show(coupon_with_electrodes)
 
 
 def main():
@@ -2139,7 +2084,8 @@ def main():
     # mode = "labels"
     mode = "electrodes"
 
-    coupon_gds_path = r"C:\PyLayout\PyLayout\build\gds\MDM3_Ct_comb_run_coupon_mode.oas"
+    # The OASIS run_coupon_mode writes (the build/gds copy only exists when show() is not "off")
+    coupon_gds_path = os.path.join(base_directory, f"Left MDM-{today_date}.oas")
 
     if mode == "coupon":
         run_coupon_mode(base_directory, today_date, clearance_width,to_debug)
@@ -2153,3 +2099,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
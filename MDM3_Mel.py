@@ -1,5 +1,3 @@
-import shutil
-
 import numpy as np
 import gdstk
 import gdsfactory as gf
@@ -13,10 +11,17 @@ import os
 
 from shapely.ops import orient
 
+from boolean_ops import merge_layer_tiled, mirror_union, union_all, unite_lattice
+from build_manifest import BuildManifest
+from gds_export import GdsStreamWriter, save_rotated_variants, write_oas
+from gds_library import dilated_gds, gds_cache, import_gds_cached, import_ported
+from hierarchy import CellDeduper
+from phc_lattice import add_holes, chain_centres, triangular_lattice_centres
+from viewer import show, viewer
+
 # https://www.nature.com/articles/s41467-024-50667-5
 # https://static-content.springer.com/esm/art%3A10.1038%2Fs41467-024-50667-5/MediaObjects/41467_2024_50667_MOESM1_ESM.pdf
 
-_imported_gds_cache = {}
 _wrapped_fish_cache = {}
 
 def add_2D_phc_cavity(
@@ -31,23 +36,8 @@ def add_2D_phc_cavity(
     layer=(1, 0),
 ):
     """Adds a 2D photonic crystal with a line-defect cavity to a given component."""
-    for i in range(-nx, nx + 1):
-        for j in range(-ny, ny + 1):
-            x = i * a
-            y = j * a * (3**0.5) / 2
-
-            if j == 0:
-                continue
-
-            shift = 0
-            abs_i = abs(i)
-            if abs_i in [1, 2, 3, 4]:
-                shift = shifts[abs_i - 1] * (1 if i > 0 else -1)
-                x += shift
-
-            hole = gf.components.circle(radius=r, layer=layer)
-            hole_ref = component.add_ref(hole)
-            hole_ref.move((x + x_offset, y + y_offset))
+    centres = triangular_lattice_centres(a, nx, ny, shifts=shifts)
+    add_holes(component, centres, r, layer=layer, offset=(x_offset, y_offset))
 
 
 def create_photonic_crystal_chip() -> gf.Component:
@@ -75,12 +65,7 @@ def create_photonic_crystal_chip() -> gf.Component:
 
     beam = gf.components.straight(length=beam_length, width=w_um)#, layer=layer)
     holes = gf.Component()
-    x = 0
-    for ai in a_list_um:
-        hole = gf.components.circle(radius=r_um, layer=layer)
-        hole_ref = holes.add_ref(hole)
-        hole_ref.move((x + ai / 2, 0))
-        x += ai
+    add_holes(holes, chain_centres(a_list_um), r_um, layer=layer)
 
     beam_final = gf.boolean(A=beam, B=holes, operation="A-B", layer=layer)
     beam_ref = c.add_ref(beam_final)
@@ -144,11 +129,8 @@ def merge_references(base, refs, layer):
 
     flatten(refs)  # Flatten input list
 
-    # Perform boolean OR operation on all valid references
-    for ref in flattened_refs:
-        merged = gf.boolean(A=merged, B=ref, operation="or", layer=layer)
-
-    return merged
+    # Merge base and all valid references in a single region operation
+    return union_all([merged] + flattened_refs, layer=layer)
 
 
 def create_spring_vertical(c, cross_section, comb_spine):
@@ -242,18 +224,7 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
 
     # --- Load fish or alternative resonator geometry ---
     gds_path = Path("Selected Resonators to FAB\QT14.gds") if resonator == "fish" else Path("Selected Resonators to FAB\QT10.gds")
-    fish_component = gf.import_gds(gds_path)
-    fish_component.add_port(
-        name="o1", center=(0, 0), width=0.5, orientation=180, layer=layer_main
-    )
-
-    fish_component.add_port(
-        name="o2",
-        center=(fish_component.size_info.width-0.1,0),
-        width=0.5,
-        orientation=0,
-        layer=layer_main,
-    )
+    fish_component = import_ported(gds_path, layer=layer_main)
 
 
     # Cross-section for S-bend
@@ -347,13 +318,8 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
 
     # Merge all references
 
-    # Create mirrored waveguide (bot_waveguide)
-    bot_waveguide_ref = gf.Component().add_ref(top_waveguide).mirror_y()
-    # Shift if necessary: .dmovey(dy*0) does nothing, but keep it for clarity:
-    bot_waveguide_ref.dmovey(dy * 0)
-
-    # Combine top + bottom waveguides
-    combined_dc = gf.boolean(A=top_waveguide, B=bot_waveguide_ref, operation="or", layer=layer_main)
+    # Combine top + mirrored bottom (bot_waveguide) waveguides, merging only along y=0
+    combined_dc = mirror_union(top_waveguide, axis="x", layer=layer_main)
 
     ######## Thick DC #######
 
@@ -390,11 +356,8 @@ def create_dc_design_vertical(resonator="fish",coupler_l=0.42,clearance_width=50
     s3 = thick_dc.add_ref(final_straight)
     s3.connect(port="in", other=b2.ports["out"])
 
-    # Create bottom mirrored version
-    thick_dc_ref_bot = gf.Component().add_ref(thick_dc).mirror_y()
-
-    # Combine top and bottom thick DC into one component
-    combined_thick_dc = gf.boolean(A=thick_dc, B=thick_dc_ref_bot, operation="or", layer=layer_main)
+    # Combine top and mirrored bottom thick DC into one component
+    combined_thick_dc = mirror_union(thick_dc, axis="x", layer=layer_main)
 
     #########################
 
@@ -683,10 +646,8 @@ def add_fish_components( c, gds_file, length_mmi, taper_length, taper_separation
     """
     key = (str(gds_file), length_mmi, taper_length)
 
-    # 1) import raw GDS only once
-    if key not in _imported_gds_cache:
-        _imported_gds_cache[key] = gf.import_gds(Path(gds_file))
-    orig = _imported_gds_cache[key]
+    # 1) import raw GDS only once (shared, mtime-checked import cache)
+    orig = import_gds_cached(gds_file)
 
     # 2) wrap-and-name only once for this key
     if key not in _wrapped_fish_cache:
@@ -1064,7 +1025,7 @@ def debug(self):
     c = gf.Component("TOP")
     straight_c = gf.components.straight(4.5)
     straight_ref = c.add_ref(straight_c)
-    c.show()
+    show(c)
 
 def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(1,0)):
     """
@@ -1081,31 +1042,15 @@ def unite_array( component, rows=1, cols=1, spacing=(10, 10), name=None, layer=(
     """
     # Early return if only one instance is needed
     if rows == 1 and cols == 1:
-        if name:
-            component.name = name
-        return component
+        if not name:
+            return component
+        # `component` may be a cached cell shared with other callers: wrap it rather than rename it
+        single = gf.Component(name)
+        single.add_ports(single.add_ref(component).ports)
+        return single
 
-    # Create a new component to store the unified array
-    c = gf.Component()
-
-    # Place the first instance to initialize merged geometry
-    merged_device = c.add_ref(component)
-
-    # Loop through the array and place each instance, uniting it with merged_device
-    for row in range(rows):
-        for col in range(cols):
-            # Skip the first instance since it's already added as merged_device
-            if row == 0 and col == 0:
-                continue
-
-            # Calculate the position for the next component
-            x_pos = col * spacing[0]
-            y_pos = row * spacing[1]
-
-            # Place and unite each instance with the merged_device
-            next_device = gf.Component().add_ref(component).dmove((x_pos, y_pos))
-
-            merged_device = gf.boolean(A=merged_device, B=next_device, operation="or", layer=layer)
+    # Unite the whole lattice in one batched region operation
+    merged_device = unite_lattice(component, rows=rows, cols=cols, spacing=spacing, layer=layer)
 
     # Name the final merged component
     if name:
@@ -1254,8 +1199,7 @@ def add_bulls_eye( c, n_bulls_eye, offset_x):
     a = gf.boolean(A=a, B=s1, operation="A-B", layer=(1, 0))
 
     gds_file = Path('Bulls_Eye_Layout_v1.1.gds')
-    b = gf.import_gds(gds_file)
-    b.name = "GDS_Import"
+    b = import_gds_cached(gds_file)
 
     c.add_ref(unite_array(b, cols=n_bulls_eye, rows=1, spacing=(12.5, 12.5), name="Bulls-eye")).dmovey(-20).dmovex(offset_x + 32)
 
@@ -1301,13 +1245,9 @@ def get_remove_polygon_points(self):
 def subtract_custom_polygon( mmi, polygon_points):
     custom_polygon_component = gf.Component()
     custom_polygon_component.add_polygon(polygon_points, layer=(1, 0))
-    mmi = gf.boolean(A=mmi, B=custom_polygon_component, operation="A-B", layer=(1, 0))
-
-    mirrored_polygon_component = gf.Component()
-    mirrored_polygon_component.add_polygon(
-        [(x, -y) for x, y in polygon_points], layer=(1, 0)
-    )
-    mmi = gf.boolean(A=mmi, B=mirrored_polygon_component, operation="A-B", layer=(1, 0))
+    # the cut is symmetric about y=0: mirror the polygon by transform, subtract once
+    symmetric_polygon = mirror_union(custom_polygon_component, axis="x", layer=(1, 0))
+    mmi = gf.boolean(A=mmi, B=symmetric_polygon, operation="A-B", layer=(1, 0))
     return mmi
 
 def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper_width1: float = 0.08,
@@ -1387,7 +1327,7 @@ def create_resonator_or_smw(component_type: str, taper_length: float = 10, taper
     return c
 
 
-def create_design(clearance_width=50,to_debug=False,layers=None):
+def create_design(clearance_width=50,to_debug=False,layers=None,hierarchical=True):
     length_mmi = 79
     total_width_mmi = 10
     width_mmi = 6
@@ -1396,6 +1336,7 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
     directional_coupler_l = 0.42
 
     c = gf.Component()
+    rows = CellDeduper(c, flatten=not hierarchical)  # identical rows share one cell
 
 
     config = {"Resonators":True, "N_Bulls_eye": 0, "add_logo": True, "add_rectangle": False, "add_scalebar": True, }
@@ -1414,167 +1355,170 @@ def create_design(clearance_width=50,to_debug=False,layers=None):
 
 
     if config["Resonators"]:
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y-y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y-y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT10.gds"
         offset_y+=y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                  taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
         bbox_component = create_bbox_component(length_mmi, total_width_mmi,clearance_width=clearance_width)
         params["taper_length_in"] = 10
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y ,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y ,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT10_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT10.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT10_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT10.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT14.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT14_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT14.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"],clearance=clearance_width,IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing/2,taper_length=params["taper_length_in"],clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT14_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT14.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT17.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT17_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT17.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT17_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT17.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT18.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT18_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT18.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT18_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT18.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
         params["resonator_type"] = "Selected Resonators to FAB\QT20.gds"
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT20_dil5.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT20.gds", 5)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
-        params["resonator_type"] = "Selected Resonators to FAB\QT20_dil10.gds"
+        params["resonator_type"] = dilated_gds("Selected Resonators to FAB\QT20.gds", 10)
         offset_y += y_spacing
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True)).flatten()
-        c.add_ref(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
-                                          taper_length=params["taper_length_in"], clearance=clearance_width)).flatten()
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width, IsSupported=True))
+        rows.add(create_resonator_or_smw(component_type=params["resonator_type"], y_spacing=offset_y - y_spacing / 2,
+                                          taper_length=params["taper_length_in"], clearance=clearance_width))
 
     ###################   DIRECTIONAL COUPLER   ###################
     offset_y += 12
     params["resonator_type"] = "fish"
-    c.add_ref(create_dc_design_vertical(resonator=params["resonator_type"],
+    rows.add(create_dc_design_vertical(resonator=params["resonator_type"],
                                     coupler_l=directional_coupler_l,pad_x_offset=210,pad_y_offset=23,clearance_width=clearance_width,layers=layers
-                                        )).dmovey(offset_y).dmovex(21.6).flatten()
+                                        ), dx=21.6, dy=offset_y)
     offset_y += 18
     params["resonator_type"] = "extractor"
-    c.add_ref(create_dc_design_vertical(resonator=params["resonator_type"],
-                                    coupler_l=directional_coupler_l,clearance_width=clearance_width,layers=layers)).dmovey(offset_y).dmovex(21.6).flatten()
+    rows.add(create_dc_design_vertical(resonator=params["resonator_type"],
+                                    coupler_l=directional_coupler_l,clearance_width=clearance_width,layers=layers), dx=21.6, dy=offset_y)
 
     ###################   MMI COUPLER   ###################
     offset_y += 20
     bbox_component = create_bbox_component(length_mmi=length_mmi, total_width_mmi=total_width_mmi, taper_length=params["taper_length_in"],
                                            clearance_width=clearance_width)
-    c.add_ref(add_mmi_patterns(c, bbox_component, params)).dmovey(offset_y).dmovex(params["taper_length_in"] - 10).flatten()
+    rows.add(add_mmi_patterns(c, bbox_component, params), dx=params["taper_length_in"] - 10, dy=offset_y)
     params["resonator_type"] = "fish"
     offset_y += 18
-    c.add_ref(add_mmi_patterns(c, bbox_component, params)).dmovey(offset_y).dmovex(params["taper_length_in"] - 10).flatten()
+    rows.add(add_mmi_patterns(c, bbox_component, params), dx=params["taper_length_in"] - 10, dy=offset_y)
 
     offset_y += 18
     params["weird_support"] = True
     params["taper_length_in"] = 20
-    c.add_ref(add_mmi_patterns(c, bbox_component, params)).dmovey(offset_y).dmovex(params["taper_length_in"] - 10).flatten()
+    rows.add(add_mmi_patterns(c, bbox_component, params), dx=params["taper_length_in"] - 10, dy=offset_y)
 
     offset_y += 18
     params["resonator_type"] = "extractor"
-    c.add_ref(add_mmi_patterns(c, bbox_component, params)).dmovey(offset_y).dmovex(params["taper_length_in"] - 10).flatten()
+    rows.add(add_mmi_patterns(c, bbox_component, params), dx=params["taper_length_in"] - 10, dy=offset_y)
 
-    c.add_ref(gf.components.straight(length=5,width=18*4+20)).dmovey(offset_y-18*2).dmovex(-5).flatten()
+    rows.add(gf.components.straight(length=5,width=18*4+20), dx=-5, dy=offset_y-18*2)
 
 
     if  config["add_logo"]:
-        c.add_ref(add_logos(c)).dmovex(90).dmovey(offset_y-120).flatten()
+        rows.add(add_logos(c), dx=90, dy=offset_y-120)
 
     if config["add_scalebar"]:
         add_scalebars(c, 17, -50)
 
     # c.show()
+    rows.print_stats()
     return c
 
-def merge_layer(component, layer=(1, 0)):
+def merge_layer(component, layer=(1, 0), tile_size=None, threads=None):
     """
     Merges overlapping or adjacent shapes in the specified layer.
 
     Args:
         component (gf.Component): The input photonic component.
         layer (tuple): The GDS layer to merge (default: (1, 0)).
+        tile_size (float): If set, merge in tile_size x tile_size um tiles on worker threads.
+        threads (int): Number of worker threads for the tiled merge (default: all cores).
 
     Returns:
         gf.Component: A new component with merged shapes.
@@ -1590,7 +1534,10 @@ def merge_layer(component, layer=(1, 0)):
         return merged_component  # Return the original component
 
     # Merge adjacent or overlapping polygons
-    merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
+    if tile_size:
+        merged_shapes = merge_layer_tiled(layer_shapes, layer=layer, tile_size=tile_size, threads=threads)
+    else:
+        merged_shapes = gf.boolean(A=layer_shapes, B=layer_shapes, operation="or", layer=layer)
 
     # Create a new component to store the merged result
     merged_component = gf.Component()
@@ -1614,10 +1561,18 @@ def create_fillet(radius = 0.15):
 
     return result
 
-def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers):
+def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers, manifest=None):
     # Coupon mode: create coupon design (without electrodes).
+    names = ("Left", "Bottom", "Right", "Top")
+    outputs = [os.path.join(base_directory, f"{name}.gds") for name in names] + [os.path.join(base_directory, "Left.oas")]
+    params = {"clearance_width": clearance_width, "layers": layers}
+    if manifest is not None and not to_debug and manifest.is_current("coupon", outputs, params, [run_coupon_mode]):
+        print(f"Coupon in {base_directory} is up to date, skipping the rebuild")
+        return
+    gds_cache.used.clear()
+
     design_component = create_design(clearance_width=clearance_width,to_debug=to_debug,layers=layers)
-    c = merge_layer(design_component, layer=layers["fine_ebl_layer"])
+    c = merge_layer(design_component, layer=layers["fine_ebl_layer"], tile_size=500)
     # coarse_component=merge_layer(design_component, layer=layers["coarse_ebl_layer"])
     # c.add_ref(coarse_component).flatten()
     if not to_debug:
@@ -1630,25 +1585,21 @@ def run_coupon_mode(base_directory, today_date, clearance_width,to_debug,layers)
         gds_output_file = os.path.join(base_directory, f"Left.gds")
         c.write_gds(gds_output_file)
         print(f"GDS saved to {gds_output_file}")
+        write_oas(c, os.path.splitext(gds_output_file)[0] + ".oas")
 
     # Create rotated versions and save them
-    def save_rotated(original, angle, name):
-        rotated = gf.Component(name=f"rotated_{name}")
-        ref = rotated.add_ref(original)
-        ref.rotate(angle)
-        gds_file = os.path.join(base_directory, f"{name}.gds")
-        rotated.write_gds(gds_file)
-        print(f"GDS saved to {gds_file}")
-        rotated.show()
-
     if not to_debug:
-        save_rotated(c, 90, "Bottom")
-        save_rotated(c, 180, "Right")
-        save_rotated(c, 270, "Top")
+        variants = [(angle, name, os.path.join(base_directory, f"{name}.gds"))
+                    for angle, name in ((90, "Bottom"), (180, "Right"), (270, "Top"))]
+        save_rotated_variants(c, variants, base_gds=gds_output_file)
+
+    if manifest is not None and not to_debug:
+        manifest.record("coupon", outputs, params, [run_coupon_mode], files=gds_cache.used)
 
-    c.show()
+    gds_cache.print_stats()
+    show(c)
 
-def run_labels_mode(base_directory, today_date,layers=None):
+def run_labels_mode(base_directory, today_date,layers=None, manifest=None):
     # Die dose_labels mode: create and save the full die dose_labels.
     dose_labels = ["300","290", "280","270", "260"]
     coupon_width=373
@@ -1694,40 +1645,47 @@ def run_labels_mode(base_directory, today_date,layers=None):
     }
 
     def save_label_gds(chip_name, include_ti=True,layers=None):
-        label_component = gf.Component(name=f"labels_{chip_name}")
-
-        # Full chip frame
-        outer = gf.components.rectangle(size=(3000, 3000), layer=(4, 0))
-        inner = gf.components.rectangle(size=(2990, 2990), layer=(4, 0))
-        inner_ref = gf.Component()
-        inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
-
-        frame = gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(4, 0))
-        label_component.add_ref(frame).flatten()
-        label_component.add_ref(gf.components.text(text="3 x 3 mm", size=100, layer=(4,0))).move((0,-100))
-
-        # EBL area frame
-        outer = gf.components.rectangle(size=(2400, 2400), layer=(5, 0))
-        inner = gf.components.rectangle(size=(2390, 2390), layer=(5, 0))
-        inner_ref = gf.Component()
-        inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
-
-        frame = gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(5, 0))
-        label_component.add_ref(frame).move((300,300)).flatten()
-        label_component.add_ref(gf.components.text(text="2.4 x 2.4 mm", size=100, layer=(5, 0))).move((300, 200))
-
-        for _, (x, y, is_horizontal, add_or_sub) in positions.items():
-            label_component.add_ref(
-                create_labels_component(
-                    dose_labels, chip_name, size=50, spacing=spacing, position=(x, y), horizontal=is_horizontal,
-                    add_or_sub=add_or_sub, include_ti=include_ti,layers=layers
+        labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
+        params = {"chip_name": chip_name, "include_ti": include_ti, "layers": layers}
+        if manifest is not None and manifest.is_current(f"labels:{chip_name}", [labels_gds_file], params, [run_labels_mode]):
+            print(f"{labels_gds_file} is up to date, skipping")
+            return
+
+        # The sheet is streamed block by block (see GdsStreamWriter), so only the
+        # block being built is held in memory.
+        with GdsStreamWriter(labels_gds_file, top_name=f"labels_{chip_name}") as sheet:
+            # Full chip frame
+            outer = gf.components.rectangle(size=(3000, 3000), layer=(4, 0))
+            inner = gf.components.rectangle(size=(2990, 2990), layer=(4, 0))
+            inner_ref = gf.Component()
+            inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
+
+            sheet.add(gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(4, 0)), name=f"labels_{chip_name}_chip_frame", free=True)
+            sheet.add(gf.components.text(text="3 x 3 mm", size=100, layer=(4,0)), origin=(0, -100))
+
+            # EBL area frame
+            outer = gf.components.rectangle(size=(2400, 2400), layer=(5, 0))
+            inner = gf.components.rectangle(size=(2390, 2390), layer=(5, 0))
+            inner_ref = gf.Component()
+            inner_ref.add_ref(inner).move((5, 5))  # center inner square inside the outer
+
+            sheet.add(gf.boolean(A=outer, B=inner_ref, operation="A-B", layer=(5, 0)), origin=(300, 300), name=f"labels_{chip_name}_ebl_frame", free=True)
+            sheet.add(gf.components.text(text="2.4 x 2.4 mm", size=100, layer=(5, 0)), origin=(300, 200))
+
+            for side, (x, y, is_horizontal, add_or_sub) in positions.items():
+                sheet.add(
+                    create_labels_component(
+                        dose_labels, chip_name, size=50, spacing=spacing, position=(x, y), horizontal=is_horizontal,
+                        add_or_sub=add_or_sub, include_ti=include_ti,layers=layers
+                    ),
+                    name=f"labels_{chip_name}_{side}",
+                    free=True,
                 )
-            ).flatten()
 
-        labels_gds_file = os.path.join(base_directory, f"{chip_name}-{today_date}.gds")
-        label_component.write_gds(labels_gds_file)
         print(f"GDS saved to {labels_gds_file}")
-        label_component.show()
+        show(labels_gds_file)
+        if manifest is not None:
+            manifest.record(f"labels:{chip_name}", [labels_gds_file], params, [run_labels_mode])
 
     save_label_gds("QT-MDM3.7T", include_ti=True,layers=layers)
     save_label_gds("QT-MDM3.8T", include_ti=True,layers=layers)
@@ -1758,6 +1716,7 @@ def main():
 
     output_dir = os.path.join(base_directory, today_date)
     os.makedirs(output_dir, exist_ok=True)
+    manifest = BuildManifest(output_dir)  # inputs and provenance of every output in output_dir
 
 
     # Mode selection: coupon (default), labels, or electrodes
@@ -1765,18 +1724,17 @@ def main():
     # mode = "labels"
     # mode = "electrodes"
 
-    coupon_gds_path = r"C:\PyLayout\PyLayout\build\gds\MDM3C_run_coupon_mode.oas"
+    # The OASIS run_coupon_mode writes (the build/gds copy only exists when show() is not "off")
+    coupon_gds_path = os.path.join(output_dir, "Left.oas")
 
     if mode == "coupon":
-        run_coupon_mode(output_dir, today_date, clearance_width,to_debug,layers)
+        run_coupon_mode(output_dir, today_date, clearance_width,to_debug,layers, manifest=manifest)
     elif mode == "labels":
-        run_labels_mode(output_dir, today_date,layers)
+        run_labels_mode(output_dir, today_date,layers, manifest=manifest)
     else:
         print(f"Unknown mode '{mode}'. Please choose 'coupon', 'labels', or 'electrodes'.")
 
-    if not to_debug: # Copy this script to the output directory
-        current_script = os.path.abspath(__file__)
-        shutil.copy(current_script, output_dir)
-
 if __name__ == "__main__":
     main()
+    viewer.flush()
+    viewer.print_stats()
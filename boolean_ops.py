@@ -0,0 +1,778 @@
+import hashlib
+import math
+import os
+import struct
+from collections import defaultdict
+from pathlib import Path
+
+import gdsfactory as gf
+import kfactory as kf
+import numpy as np
+from gdsfactory.component import boolean_operations
+
+
+def is_instance(obj):
+    """True for gdsfactory references (Instance / DInstance, whatever the gdsfactory version)."""
+    return hasattr(obj, "cplx_trans") and hasattr(obj, "cell")
+
+
+def iter_geometry(items):
+    """
+    Yields every Component / Instance found in `items`, flattening nested lists.
+    Anything else is skipped with a warning (same behaviour as merge_references).
+    """
+    if items is None:
+        return
+    if isinstance(items, (list, tuple, set)):
+        for item in items:
+            yield from iter_geometry(item)
+    elif isinstance(items, gf.Component) or is_instance(items):
+        yield items
+    else:
+        print(f"❌ Warning: Ignoring invalid reference of type {type(items)}")
+
+
+def get_region(obj, layer=(1, 0)):
+    """
+    Returns the shapes of a Component or Instance on `layer` as a kdb.Region
+    (in the coordinates of the parent cell for instances, arrays expanded).
+    """
+    layer_index = gf.get_layer(layer)
+    if not is_instance(obj):
+        return kf.kdb.Region(obj.begin_shapes_rec(layer_index))
+
+    cell_region = kf.kdb.Region(obj.cell.begin_shapes_rec(layer_index))
+    na = getattr(obj, "na", 1) or 1
+    nb = getattr(obj, "nb", 1) or 1
+    if na == 1 and nb == 1:
+        return cell_region.transformed(obj.cplx_trans)
+
+    # The array vectors a/b are in the parent frame: displace after the instance transformation
+    region = kf.kdb.Region()
+    for ia in range(na):
+        for ib in range(nb):
+            region.insert(cell_region.transformed(kf.kdb.ICplxTrans(ia * obj.a + ib * obj.b) * obj.cplx_trans))
+    return region
+
+
+def region_to_component(region, layer=(1, 0), name=None):
+    """Wraps a kdb.Region into a new Component on `layer`."""
+    c = gf.Component(name=name) if name else gf.Component()
+    c.shapes(gf.get_layer(layer)).insert(region)
+    return c
+
+
+def union_all(items, layer=(1, 0), name=None):
+    """
+    Boolean OR of any number of Components / Instances in a single region merge.
+
+    Equivalent to folding the items with gf.boolean(..., operation="or"), but the
+    polygons are collected once and merged once, so the cost grows linearly with
+    the number of items instead of quadratically.
+
+    Args:
+        items: Component/Instance or (nested) list of them.
+        layer (tuple): Layer to read from and to write the merged result on.
+        name (str): Optional name of the returned component.
+
+    Returns:
+        gf.Component: A new component with the merged polygons on `layer`.
+    """
+    region = kf.kdb.Region()
+    for obj in iter_geometry(items):
+        region.insert(get_region(obj, layer))
+    region.merge()
+    return region_to_component(region, layer=layer, name=name)
+
+
+def unite_lattice(component, rows=1, cols=1, spacing=(10, 10), layer=(1, 0), name=None):
+    """
+    Unites a rows x cols lattice of `component` into a single geometry.
+
+    The tile is merged once and translated copies are collected into one region.
+    If the tile fits inside its lattice cell the copies cannot touch, so they are
+    emitted as-is; otherwise the whole lattice is merged in a single pass.
+
+    Args:
+        component (gf.Component): The tile to repeat.
+        rows (int): Number of rows in the array.
+        cols (int): Number of columns in the array.
+        spacing (tuple): Spacing (x, y) between instances in the array.
+        layer (tuple): Layer to read from and to write the result on.
+        name (str): Optional name of the returned component.
+
+    Returns:
+        gf.Component: A new component with the united lattice on `layer`.
+    """
+    tile = get_region(component, layer)
+    tile.merge()
+
+    dbu = kf.kcl.dbu
+    dx, dy = round(spacing[0] / dbu), round(spacing[1] / dbu)
+    box = tile.bbox()
+    overlapping = (cols > 1 and box.width() >= abs(dx)) or (rows > 1 and box.height() >= abs(dy))
+
+    region = kf.kdb.Region()
+    for row in range(rows):
+        for col in range(cols):
+            region.insert(tile.moved(col * dx, row * dy))
+
+    if overlapping:
+        region.merge()
+
+    return region_to_component(region, layer=layer, name=name)
+
+
+class LazyBoolean:
+    """
+    Deferred boolean expression on a single layer.
+
+    Combining nodes with |, &, - and ^ only builds a DAG; nothing is computed until
+    region() / to_component() is called. On evaluation nested ORs/ANDs are folded
+    into one n-ary operation, (a - b) - c becomes a - (b | c), and identical
+    sub-expressions (same cells, same transforms) are evaluated only once. No
+    intermediate gf.Component is created. symmetric() declares a mirror axis: only
+    the half is built and booleaned, the other half is its transformed copy.
+
+    Leaves snapshot the instance transform when they are created, so moving a
+    reference afterwards does not change the expression (same as gf.boolean).
+    """
+
+    def __init__(self, op, operands=(), layer=(1, 0), trans=None, leaf=None):
+        self.op = op
+        self.operands = tuple(operands)
+        self.layer = layer
+        self.trans = trans
+        self._leaf = leaf
+        self._key = None
+
+    @classmethod
+    def from_geometry(cls, obj, layer=(1, 0)):
+        if isinstance(obj, LazyBoolean):
+            return obj
+        if isinstance(obj, (list, tuple, set)):
+            return cls("or", [cls.from_geometry(o, layer) for o in iter_geometry(obj)], layer=layer)
+        if not is_instance(obj):
+            return cls("leaf", layer=layer, leaf=(obj, None))
+        if (getattr(obj, "na", 1) or 1) > 1 or (getattr(obj, "nb", 1) or 1) > 1:
+            # Regular arrays are expanded right away; they are rare in boolean chains
+            return cls("leaf", layer=layer, leaf=(get_region(obj, layer), None))
+        return cls("leaf", layer=layer, leaf=(obj.cell, kf.kdb.ICplxTrans(obj.cplx_trans)))
+
+    # --- expression building ---
+    def _combine(self, op, other):
+        other = LazyBoolean.from_geometry(other, self.layer)
+        if op in ("or", "and"):
+            operands = []
+            for node in (self, other):
+                operands.extend(node.operands if node.op == op else (node,))
+            return LazyBoolean(op, operands, layer=self.layer)
+        if op == "not" and self.op == "not":
+            minuend, subtrahend = self.operands
+            return LazyBoolean("not", (minuend, subtrahend | other), layer=self.layer)
+        return LazyBoolean(op, (self, other), layer=self.layer)
+
+    def __or__(self, other):
+        return self._combine("or", other)
+
+    def __and__(self, other):
+        return self._combine("and", other)
+
+    def __sub__(self, other):
+        return self._combine("not", other)
+
+    def __xor__(self, other):
+        return self._combine("xor", other)
+
+    def transformed(self, trans):
+        """Applies a kdb.ICplxTrans / kdb.Trans to the whole expression."""
+        return LazyBoolean("trans", (self,), layer=self.layer, trans=kf.kdb.ICplxTrans(trans))
+
+    def mirror_y(self):
+        """Mirrors the expression across the x axis (y -> -y), like Instance.mirror_y()."""
+        return self.transformed(kf.kdb.Trans.M0)
+
+    def symmetric(self, axis="x", position=0.0):
+        """
+        self | mirror(self), with the mirrored half produced by transform and only
+        the polygons meeting their mirror image merged (see mirror_union_region).
+        """
+        return LazyBoolean("mirror", (self,), layer=self.layer, trans=mirror_trans(axis, position))
+
+    # --- evaluation ---
+    @property
+    def key(self):
+        """Structural key used for common-subexpression elimination."""
+        if self._key is None:
+            if self.op == "leaf":
+                obj, trans = self._leaf
+                ident = id(obj) if isinstance(obj, kf.kdb.Region) else obj.cell_index()
+                self._key = ("leaf", ident, str(trans))
+            elif self.op in ("or", "and"):
+                self._key = (self.op, tuple(sorted((o.key for o in self.operands), key=repr)))
+            elif self.op in ("trans", "mirror"):
+                self._key = (self.op, str(self.trans), self.operands[0].key)
+            else:
+                self._key = (self.op, tuple(o.key for o in self.operands))
+        return self._key
+
+    def _leaf_region(self):
+        obj, trans = self._leaf
+        if isinstance(obj, kf.kdb.Region):
+            return obj
+        region = kf.kdb.Region(obj.begin_shapes_rec(gf.get_layer(self.layer)))
+        if trans is not None:
+            region.transform(trans)
+        return region
+
+    def _digest(self, memo):
+        """Content hash of the expression: leaf geometry fingerprints + structure."""
+        key = self.key
+        if key not in memo:
+            if self.op == "leaf":
+                memo[key] = fingerprint_region(self._leaf_region())
+            else:
+                digests = [o._digest(memo) for o in self.operands]
+                if self.op in ("or", "and"):
+                    digests.sort()
+                memo[key] = hashlib.sha1(repr((self.op, str(self.trans), digests)).encode()).hexdigest()
+        return memo[key]
+
+    def _evaluate(self, memo):
+        key = self.key
+        if key in memo:
+            return memo[key]
+
+        if self.op == "leaf":
+            region = self._leaf_region()
+        else:
+            regions = [o._evaluate(memo) for o in self.operands]
+            if self.op == "or":
+                region = kf.kdb.Region()
+                for r in regions:
+                    region.insert(r)
+                region.merge()
+            elif self.op == "and":
+                region = regions[0]
+                for r in regions[1:]:
+                    region = region & r
+            elif self.op == "not":
+                region = regions[0] - regions[1]
+            elif self.op == "xor":
+                region = regions[0] ^ regions[1]
+            elif self.op == "trans":
+                region = regions[0].transformed(self.trans)
+            elif self.op == "mirror":
+                region = mirror_union_region(regions[0], self.trans)
+            else:
+                raise ValueError(f"Unknown boolean operation {self.op}")
+
+        memo[key] = region
+        return region
+
+    def region(self, cache=None):
+        """
+        Evaluates the expression and returns the resulting kdb.Region.
+        With a BooleanCache the whole expression is looked up by content first.
+        """
+        if cache is None:
+            return self._evaluate({})
+        key = cache.key(self._digest({}), self.layer)
+        region = cache.get(key)
+        if region is None:
+            region = self._evaluate({})
+            cache.put(key, region)
+        return region
+
+    def to_component(self, name=None, cache=None):
+        """Evaluates the expression into a single new Component on its layer."""
+        return region_to_component(self.region(cache=cache), layer=self.layer, name=name)
+
+
+def lazy(obj, layer=(1, 0)):
+    """Wraps a Component / Instance (or list of them) into a LazyBoolean leaf."""
+    return LazyBoolean.from_geometry(obj, layer)
+
+
+def region_to_gds(region):
+    """`region` serialised as GDS bytes: one cell, layer 1/0, no timestamps or context info."""
+    layout = kf.kdb.Layout()
+    layout.dbu = kf.kcl.dbu
+    cell = layout.create_cell("REGION")
+    cell.shapes(layout.layer(1, 0)).insert(region)
+    options = kf.kdb.SaveLayoutOptions()
+    options.format = "GDS2"
+    options.gds2_write_timestamps = False
+    options.write_context_info = False
+    return layout.write_bytes(options)
+
+
+def region_from_gds(data):
+    """The region serialised by region_to_gds()."""
+    layout = kf.kdb.Layout()
+    layout.read_bytes(data)
+    # Region(Shapes) copies the polygons; a shape iterator would still point into `layout`
+    return kf.kdb.Region(layout.top_cells()[0].shapes(layout.layer(1, 0)))
+
+
+def fingerprint_region(region):
+    """
+    Content hash of a kdb.Region (order-independent, in database units): sha1 over
+    KLayout's own hash of each polygon, sorted, which is far cheaper than
+    formatting and sorting the polygons as text.
+    """
+    hashes = sorted(p.hash() & 0xFFFFFFFFFFFFFFFF for p in region.each())
+    return hashlib.sha1(struct.pack(f">{len(hashes)}Q", *hashes)).hexdigest()
+
+
+class BooleanCache:
+    """
+    Disk-backed, content-addressed cache of boolean results.
+
+    Entries are keyed by a fingerprint of the operand geometry plus operation and
+    layer, so a rerun only recomputes booleans whose inputs actually changed.
+    Results are stored as GDS bytes (see region_to_gds), read back by KLayout.
+    The directory is kept under `max_bytes` by evicting least recently used
+    entries (file mtime is refreshed on every hit).
+    """
+
+    def __init__(self, directory=os.path.join("build", "boolean_cache"), max_bytes=512 * 1024 ** 2):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, *parts):
+        return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return self.directory / f"{key}.gds"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            region = region_from_gds(path.read_bytes())
+            os.utime(path)  # an eviction or another process may remove the entry meanwhile
+        except (OSError, RuntimeError, IndexError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return region
+
+    def put(self, key, region):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(key).with_suffix(".tmp")
+        tmp.write_bytes(region_to_gds(region))
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        entries = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.directory.glob("*.gds")]
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.directory.glob("*.gds"):
+            path.unlink(missing_ok=True)
+        self.hits = self.misses = 0
+
+    def stats(self):
+        entries = list(self.directory.glob("*.gds")) if self.directory.exists() else []
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(p.stat().st_size for p in entries),
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"Boolean cache: {s['hits']} hits, {s['misses']} misses ({s['hit_rate']:.0%}), "
+              f"{s['entries']} entries, {s['bytes'] / 1024:.0f} kB in {self.directory}")
+
+
+boolean_cache = BooleanCache()
+
+
+def cached_boolean(A, B, operation, layer=(1, 0), cache=None):
+    """
+    Drop-in replacement for gf.boolean backed by a BooleanCache.
+
+    Args:
+        A, B: Component/Instance operands.
+        operation (str): Any operation accepted by gf.boolean.
+        layer (tuple): Layer to read from and to write the result on.
+        cache (BooleanCache): Cache to use (default: the module-wide boolean_cache).
+
+    Returns:
+        gf.Component: A new component with the boolean result on `layer`.
+    """
+    cache = cache or boolean_cache
+    ar, br = get_region(A, layer), get_region(B, layer)
+    key = cache.key(fingerprint_region(ar), fingerprint_region(br), operation, layer)
+    region = cache.get(key)
+    if region is None:
+        region = boolean_operations[operation](ar, br)
+        cache.put(key, region)
+    return region_to_component(region, layer=layer)
+
+
+# Per tile: merge everything that reaches into the tile (+ border). Merged polygons
+# clear of the tile edges and inside the tile are final; for the ones crossing an
+# edge the original shapes go to the seam, so the stitching merge computes exactly
+# the vertices a plain merge would (re-merging merged pieces would snap new ones).
+_MERGE_TILE_SCRIPT = """
+    a.merged_semantics = false;
+    var m = a.merged();
+    var e = _tile.edges();
+    _output(final, m.not_interacting(e).interacting(_tile), false);
+    _output(seam, a.interacting(m.interacting(e)), false);
+"""
+
+
+def merge_region_tiled(region, tile_size=500, halo=1, threads=None, min_polygons=200000, min_threads=4):
+    """
+    Merges a kdb.Region tile by tile with KLayout's TilingProcessor.
+
+    The tiles run on `threads` native threads (the tile script is KLayout's
+    expression language, so no Python and no serialisation is involved). Each tile
+    merges every shape reaching into the tile grown by `halo`; merged polygons clear
+    of the tile edges are final, the original shapes of the ones crossing an edge are
+    merged once more at the end. Nothing is clipped, and the result is the same as
+    region.merged().
+
+    A single-threaded tiled merge costs ~3.5x a plain merge (60k polygons: 3.8 s vs
+    1.1 s), so the tiles only pay off with several cores and a large input. Below
+    `min_threads` threads, `min_polygons` polygons or for a single tile the region is
+    merged directly.
+
+    Args:
+        region (kdb.Region): Polygons to merge.
+        tile_size (float): Tile edge length in um.
+        halo (float): Extra margin in um around each tile.
+        threads (int): Number of worker threads (default: all cores).
+        min_polygons (int): Below this polygon count the merge runs directly.
+        min_threads (int): Below this thread count the merge runs directly.
+
+    Returns:
+        kdb.Region: The merged region.
+    """
+    threads = threads or os.cpu_count() or 1
+    box = region.bbox()
+    dbu = kf.kcl.dbu
+    single_tile = max(box.width(), box.height()) * dbu <= tile_size
+    if single_tile or threads < min_threads or region.count() < min_polygons:
+        return region.merged()
+
+    final = kf.kdb.Region()
+    seam = kf.kdb.Region()
+    tp = kf.kdb.TilingProcessor()
+    tp.dbu = dbu
+    tp.input("a", region)
+    tp.output("final", final)
+    tp.output("seam", seam)
+    tp.tile_size(tile_size, tile_size)
+    tp.tile_border(halo, halo)
+    tp.threads = threads
+    tp.queue(_MERGE_TILE_SCRIPT)
+    tp.execute("Tiled merge")
+
+    final.insert(seam.merged())
+    return final
+
+
+def merge_layer_tiled(component, layer=(1, 0), tile_size=500, halo=1, threads=None):
+    """
+    Flattens `layer` of `component` and merges it with merge_region_tiled.
+
+    Returns:
+        gf.Component: A new component with the merged shapes on `layer`.
+    """
+    region = get_region(component, layer)
+    return region_to_component(merge_region_tiled(region, tile_size=tile_size, halo=halo, threads=threads),
+                               layer=layer)
+
+
+def get_regions(component, layers):
+    """
+    Flattens several layers of `component` in a single walk of the hierarchy.
+
+    Returns:
+        dict: layer -> kdb.Region, in the order of `layers`.
+    """
+    layers = list(layers.values()) if isinstance(layers, dict) else list(layers)
+    index_to_layer = {gf.get_layer(layer): layer for layer in layers}
+    regions = {layer: kf.kdb.Region() for layer in layers}
+    if not regions:
+        return {}
+
+    base = component.begin_shapes_rec(next(iter(index_to_layer)))
+    it = kf.kdb.RecursiveShapeIterator(base.layout(), base.top_cell(), list(index_to_layer))
+    it.shape_flags = kf.kdb.Shapes.SPolygons | kf.kdb.Shapes.SBoxes | kf.kdb.Shapes.SPaths
+    while not it.at_end():
+        shape = it.shape()
+        regions[index_to_layer[it.layer()]].insert(shape.polygon.transformed(it.trans()))
+        it.next()
+    return regions
+
+
+def merge_layers(component, layers, tile_size=None, threads=None, name=None):
+    """
+    Merges several layers of `component` into one new component.
+
+    The hierarchy is walked once for all layers (see get_regions), then the layers
+    are merged one after another: Region.merged() holds the GIL, so Python threads
+    would not overlap, and with tile_size each layer already uses all threads.
+    Layers without shapes are skipped with a warning.
+
+    Args:
+        component (gf.Component): The component to flatten and merge.
+        layers: A list of layers or a layers dict such as the one built in main().
+        tile_size (float): If set, each layer is merged with merge_region_tiled.
+        threads (int): Worker threads for the tiled merge (default: all cores).
+        name (str): Optional name of the returned component.
+
+    Returns:
+        gf.Component: A new component with every layer merged.
+    """
+    regions = get_regions(component, layers)
+    for layer, region in list(regions.items()):
+        if region.is_empty():
+            print(f"⚠️ Warning: No shapes found in layer {layer}. Skipping merge operation.")
+            del regions[layer]
+
+    c = gf.Component(name=name) if name else gf.Component()
+    for layer, region in regions.items():
+        if tile_size:
+            region = merge_region_tiled(region, tile_size=tile_size, threads=threads)
+        else:
+            region = region.merged()
+        c.shapes(gf.get_layer(layer)).insert(region)
+    return c
+
+
+class BBoxGrid:
+    """
+    Uniform-grid spatial index over polygon bounding boxes (database units).
+
+    Boxes are bucketed into square grid cells (default: twice the median box size);
+    query() returns the ids of the boxes that overlap or touch a given box. Boxes
+    spanning more than `max_cells` grid cells (one long polygon among many small
+    ones) are kept in an oversize list that every query checks, and a query box
+    that large is tested against all boxes at once, so neither walks the grid.
+    """
+
+    def __init__(self, boxes, cell_size=None, max_cells=64):
+        self.boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        if cell_size is None:
+            sizes = np.maximum(self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1])
+            cell_size = 2 * int(np.median(sizes)) if len(sizes) else 1
+        self.cell_size = max(1, cell_size)
+        self.max_cells = max_cells
+
+        self.cells = defaultdict(list)
+        lo = self.boxes[:, :2] // self.cell_size
+        hi = self.boxes[:, 2:] // self.cell_size
+        spans = (hi[:, 0] - lo[:, 0] + 1) * (hi[:, 1] - lo[:, 1] + 1)
+        self.oversize = np.flatnonzero(spans > max_cells)
+        for i in np.flatnonzero(spans <= max_cells).tolist():
+            x0, y0 = lo[i].tolist()
+            x1, y1 = hi[i].tolist()
+            for ix in range(x0, x1 + 1):
+                for iy in range(y0, y1 + 1):
+                    self.cells[ix, iy].append(i)
+
+    def _overlapping(self, box, ids=None):
+        left, bottom, right, top = box
+        b = self.boxes if ids is None else self.boxes[ids]
+        hit = (b[:, 0] <= right) & (b[:, 2] >= left) & (b[:, 1] <= top) & (b[:, 3] >= bottom)
+        return np.flatnonzero(hit) if ids is None else ids[hit]
+
+    def query(self, box):
+        left, bottom, right, top = box
+        x0, x1 = left // self.cell_size, right // self.cell_size
+        y0, y1 = bottom // self.cell_size, top // self.cell_size
+        # Past this many grid cells one vectorised pass over all boxes is cheaper than the walk
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > max(self.max_cells, len(self.boxes) // 16):
+            return self._overlapping(box)
+
+        candidates = set(self.oversize.tolist())
+        for ix in range(x0, x1 + 1):
+            for iy in range(y0, y1 + 1):
+                candidates.update(self.cells.get((ix, iy), ()))
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        return self._overlapping(box, np.fromiter(candidates, dtype=np.int64))
+
+
+def _box_tuple(box):
+    return box.left, box.bottom, box.right, box.top
+
+
+def mirror_trans(axis="x", position=0.0):
+    """
+    kdb.ICplxTrans reflecting across the line y = position (axis="x", like
+    Instance.mirror_y()) or x = position (axis="y", like Instance.mirror_x()).
+    """
+    d = 2 * round(position / kf.kcl.dbu)
+    if axis == "x":
+        return kf.kdb.ICplxTrans(kf.kdb.Trans(kf.kdb.Trans.M0, 0, d))
+    if axis == "y":
+        return kf.kdb.ICplxTrans(kf.kdb.Trans(kf.kdb.Trans.M90, d, 0))
+    raise ValueError(f"axis must be 'x' or 'y', got {axis!r}")
+
+
+def mirror_union_region(half, trans):
+    """
+    half | half.transformed(trans) for a reflection `trans`, merging only the seam.
+
+    Polygons whose bbox meets no mirrored polygon are emitted together with their
+    mirror image as-is; the others (the polygons on or near the axis) are merged
+    with their mirror images in one small boolean. Since the reflection is its own
+    inverse, p meets q' exactly when q meets p', so the two sets never interact.
+    """
+    half = half.merged()
+    pairs = [(p, p.transformed(trans)) for p in half.each()]
+    if not pairs:
+        return kf.kdb.Region()
+    grid = BBoxGrid([_box_tuple(q.bbox()) for _, q in pairs])
+
+    result = kf.kdb.Region()
+    seam = kf.kdb.Region()
+    for p, q in pairs:
+        target = seam if len(grid.query(_box_tuple(p.bbox()))) else result
+        target.insert(p)
+        target.insert(q)
+    result.insert(seam.merged())
+    return result
+
+
+def mirror_union(obj, axis="x", position=0.0, layer=(1, 0), name=None):
+    """
+    Drop-in for OR-ing a Component / Instance with its mirrored copy
+    (add_ref(obj).mirror_y() + gf.boolean(..., operation="or")).
+
+    Args:
+        obj: Component/Instance (or list of them) holding one half of the geometry.
+        axis (str): "x" mirrors across y = position, "y" across x = position.
+        position (float): Position of the mirror axis in µm.
+        layer (tuple): Layer to read from and to write the result on.
+        name (str): Optional name of the returned component.
+
+    Returns:
+        gf.Component: A new component with both halves on `layer`.
+    """
+    return lazy(obj, layer).symmetric(axis, position).to_component(name=name)
+
+
+def _disk(distance, tolerance):
+    """Polygon approximating a disk of `distance` µm (in dbu), sagitta <= `tolerance`."""
+    radius = round(distance / kf.kcl.dbu)
+    n = max(8, math.ceil(math.pi / math.acos(max(-1.0, 1 - tolerance / distance))))
+    n = 8 * math.ceil(n / 8)
+    return kf.kdb.Polygon([
+        kf.kdb.Point(round(radius * math.cos(2 * math.pi * k / n)), round(radius * math.sin(2 * math.pi * k / n)))
+        for k in range(n)
+    ])
+
+
+def offset_region(region, distance, tolerance=0.005):
+    """
+    Round-joined Minkowski buffer of `region` by `distance` µm.
+
+    Every point of the result lies within `distance` of the input and every point
+    within `distance - tolerance` is covered, at straight edges, bends and path ends
+    alike (the disk is approximated by a polygon with sagitta <= `tolerance`, with a
+    multiple of 8 vertices so that axis-aligned and 45° edges are offset exactly).
+    """
+    if round(distance / kf.kcl.dbu) <= 0:
+        return region.merged()
+    return region.merged().minkowski_sum(_disk(distance, tolerance)).merged()
+
+
+def offset_path(points, distance, tolerance=0.005):
+    """
+    Round-capped buffer of the polyline through `points` (µm) by `distance` µm.
+
+    Use it where the clearance is measured from a centre line rather than from an
+    outline, e.g. along a taper: buffering the taper outline by a fixed amount
+    makes the trench grow with the taper width.
+
+    Args:
+        points (list): (x, y) vertices of the centre line in µm.
+        distance (float): Buffer distance in µm.
+        tolerance (float): Maximum deviation of the round caps in µm.
+
+    Returns:
+        kdb.Region: The buffered centre line.
+    """
+    dbu = kf.kcl.dbu
+    disk = _disk(distance, tolerance)
+    vertices = [kf.kdb.Point(round(x / dbu), round(y / dbu)) for x, y in points]
+    region = kf.kdb.Region()
+    for p1, p2 in zip(vertices, vertices[1:]):
+        region.insert(disk.minkowski_sum(kf.kdb.Edge(p1, p2), False))
+    return region.merged()
+
+
+def clearance_trench(features, clearance=None, device=None, layer=(1, 0), clip=None, tolerance=0.005, name=None):
+    """
+    Trench = offset of the device outline by its clearance, minus the device.
+
+    Replaces the "extrude a second, wider path and subtract the device" pattern:
+    the clearance follows the outline exactly, so it stays constant around bends
+    and tapers. Features sharing a clearance are collected into one region and
+    buffered in a single Minkowski sum, and the device is subtracted once.
+
+    Args:
+        features: Geometry to buffer (Component/Instance/kdb.Region or list) when
+            `clearance` is given, otherwise a list of (geometry, clearance) pairs
+            for per-feature clearance.
+        clearance (float): Clearance in µm applied to all `features`.
+        device: Geometry kept in the trench (e.g. waveguide with supports).
+            Defaults to the buffered features themselves.
+        layer (tuple): Layer to read from and to write the trench on.
+        clip: Optional kdb.DBox / geometry the buffered outline is clipped to
+            (e.g. to keep round caps out of a neighbouring grating coupler).
+        tolerance (float): Maximum deviation of the round joins in µm.
+        name (str): Optional name of the returned component.
+
+    Returns:
+        gf.Component: A new component with the trench on `layer`.
+    """
+    def as_region(geometry):
+        if isinstance(geometry, kf.kdb.Region):
+            return geometry.dup()
+        region = kf.kdb.Region()
+        for obj in iter_geometry(geometry):
+            region.insert(get_region(obj, layer))
+        return region
+
+    if clearance is not None:
+        features = [(features, clearance)]
+
+    by_clearance = defaultdict(kf.kdb.Region)
+    outline = kf.kdb.Region()
+    for geometry, distance in features:
+        region = as_region(geometry)
+        by_clearance[distance].insert(region)
+        outline.insert(region)
+
+    trench = kf.kdb.Region()
+    for distance, region in by_clearance.items():
+        trench.insert(offset_region(region, distance, tolerance=tolerance))
+    trench.merge()
+
+    if clip is not None:
+        if isinstance(clip, kf.kdb.DBox):
+            clip = kf.kdb.Region(clip.to_itype(kf.kcl.dbu))
+        trench &= as_region(clip)
+
+    device = outline if device is None else as_region(device)
+    return region_to_component(trench - device, layer=layer, name=name)
@@ -0,0 +1,182 @@
+import hashlib
+import inspect
+import json
+import os
+import sys
+import types
+from datetime import datetime
+from pathlib import Path
+
+from gds_library import file_sha1
+
+
+# Module-level values hashed by their repr when a generator reads them
+_CONSTANT_TYPES = (bool, int, float, complex, str, bytes, tuple, list, dict, set, frozenset, type(None))
+
+
+def _code_names(code):
+    """Global names referenced by `code` and the functions nested in it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+def _module_of(value):
+    """Module that defines `value` (a module itself, a function/class, or the type of an instance)."""
+    if isinstance(value, types.ModuleType):
+        return value
+    name = getattr(value, "__module__", None)
+    if not isinstance(name, str):
+        name = type(value).__module__
+    return sys.modules.get(name)
+
+
+def _sha1(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def generator_sources(functions):
+    """
+    Source hashes of everything the functions in `functions` depend on.
+
+    Within the generating script only what is reached is hashed: each function
+    or class reached through global names (per function, so editing an unrelated
+    part of the script leaves the hash alone) and the repr of each module
+    constant read. Helper modules of the repo the script code reaches (boolean_ops,
+    gds_library, ... and, through module-level instances such as gds_cache or
+    viewer, the module of their class) are hashed as whole files, following
+    their globals transitively. Code outside the repo (gdsfactory, numpy, ...)
+    is not hashed.
+
+    Returns:
+        dict: {"script.qualname" or "script.CONSTANT" or helper file name: sha1}
+    """
+    functions = [inspect.unwrap(f) for f in functions]
+    if not functions:
+        return {}
+    root = Path(inspect.getsourcefile(functions[0])).resolve().parent
+    script_name = functions[0].__globals__.get("__name__")
+    namespace = functions[0].__globals__
+    hashes = {}
+    helpers = []
+
+    def in_repo(module):
+        source_file = getattr(module, "__file__", None)
+        return source_file and Path(source_file).resolve().parent == root
+
+    stack = list(functions)
+    while stack:
+        obj = stack.pop()
+        key = f"{script_name}.{obj.__qualname__}"
+        if key in hashes:
+            continue
+        try:
+            hashes[key] = _sha1(inspect.getsource(obj))
+        except (OSError, TypeError):
+            continue
+        members = [obj] if inspect.isfunction(obj) else [v for v in vars(obj).values() if inspect.isfunction(v)]
+        for member in members:
+            for name in _code_names(member.__code__):
+                if name not in namespace:
+                    continue
+                ref = namespace[name]
+                target = inspect.unwrap(ref) if inspect.isfunction(ref) else ref
+                if inspect.isfunction(target) and target.__globals__ is namespace:
+                    stack.append(target)
+                elif inspect.isclass(target) and target.__module__ == script_name:
+                    stack.append(target)
+                elif isinstance(ref, _CONSTANT_TYPES):
+                    hashes[f"{script_name}.{name}"] = _sha1(repr(ref))
+                elif type(ref).__module__ == script_name:
+                    stack.append(type(ref))
+                else:
+                    module = _module_of(ref)
+                    if module is not None and in_repo(module):
+                        helpers.append(module)
+
+    while helpers:
+        module = helpers.pop()
+        source_file = Path(module.__file__).resolve()
+        if source_file.name in hashes:
+            continue
+        hashes[source_file.name] = hashlib.sha1(source_file.read_bytes()).hexdigest()
+        for value in list(vars(module).values()):
+            module = _module_of(value)
+            if module is not None and in_repo(module):
+                helpers.append(module)
+    return hashes
+
+
+def _script_source(functions):
+    """(path, source) of the script defining the first function in `functions`, or (None, None)."""
+    if not functions:
+        return None, None
+    script_file = inspect.unwrap(list(functions)[0]).__globals__.get("__file__")
+    if not script_file:
+        return None, None
+    return script_file, Path(script_file).read_text()
+
+
+def _normalise(params):
+    """`params` as plain JSON values (tuples become lists, unknown objects their repr)."""
+    return json.loads(json.dumps(params, sort_keys=True, default=repr))
+
+
+class BuildManifest:
+    """
+    Record of what each output file of a build was made from.
+
+    Outputs are grouped in units (the coupon and its rotations, one label sheet,
+    ...). Per unit the manifest keeps the parameters, the source hashes of the
+    code the generator functions reach (see generator_sources), the sha1 of every
+    file read while building it (GDS files and their port sidecars) and the sha1
+    of each output. A unit whose inputs and outputs are unchanged is skipped on
+    the next run. The manifest also stores the source of the generating script
+    once per version, so it doubles as the provenance record of the output
+    directory.
+    """
+
+    def __init__(self, directory, name="build_manifest.json"):
+        self.path = Path(directory) / name
+        if self.path.exists():
+            self.data = json.loads(self.path.read_text())
+        else:
+            self.data = {"units": {}, "sources": {}}
+
+    def is_current(self, unit, outputs, params=None, functions=()):
+        """True if `unit` was built from the same inputs and its outputs are untouched."""
+        entry = self.data["units"].get(unit)
+        if entry is None:
+            return False
+        if entry["params"] != _normalise(params) or entry["functions"] != generator_sources(functions):
+            return False
+        if sorted(entry["outputs"]) != sorted(str(Path(p)) for p in outputs):
+            return False
+        for path, sha1 in list(entry["files"].items()) + list(entry["outputs"].items()):
+            if not os.path.exists(path) or file_sha1(path) != sha1:
+                return False
+        return True
+
+    def record(self, unit, outputs, params=None, functions=(), files=()):
+        """Stores the inputs and output hashes of a freshly built `unit` and saves the manifest."""
+        script = None
+        script_file, source = _script_source(functions)
+        if source is not None:
+            script = hashlib.sha1(source.encode()).hexdigest()
+            self.data["sources"].setdefault(script, {"file": os.path.abspath(script_file), "source": source})
+
+        self.data["units"][unit] = {
+            "built": datetime.now().isoformat(timespec="seconds"),
+            "script": script,
+            "params": _normalise(params),
+            "functions": generator_sources(functions),
+            "files": {str(Path(p).resolve()): file_sha1(p) for p in sorted(set(map(str, files)))},
+            "outputs": {str(Path(p)): file_sha1(p) for p in outputs},
+        }
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.data, indent=1))
@@ -4,7 +4,51 @@ high NA objective 0.95 (2wo=0.7um) coupling at the angle of 16.5deg
 """
 
 import gdsfactory as gf
+import kfactory as kf
+import numpy as np
 
+from hierarchy import kdb_cell_of
+from viewer import show, viewer
+
+
+def grating_teeth(x0, n_periods, period, fill_factor, width):
+    """
+    Etched gaps of the grating, all periods at once.
+
+    The gap width (1 - fill_factor) * period is rounded to 1 nm as before, and
+    the n-th gap starts at x0 + n * period.
+
+    Args:
+        x0 (float): Left edge of the first gap (um).
+        n_periods (int): Number of gaps.
+        period (float): Grating period (um).
+        fill_factor (float): Fill factor of the grating.
+        width (float): Width of the grating across the waveguide (um).
+
+    Returns:
+        np.ndarray: (n_periods, 4, 2) rectangle corners (um).
+    """
+    gap = round((1 - fill_factor) * period * 1E3) / 1E3
+    x = x0 + np.arange(n_periods) * period
+    y = np.full(n_periods, width / 2)
+    return np.stack([np.column_stack([x, -y]), np.column_stack([x + gap, -y]),
+                     np.column_stack([x + gap, y]), np.column_stack([x, y])], axis=1)
+
+
+def slab_rectangles(x0, x1, y_min, y_max):
+    """The two slabs either side of the grating, as (2, 4, 2) corners (um)."""
+    top = [(x0, y_min), (x0, y_max), (x1, y_max), (x1, y_min)]
+    return np.array([top, [(x, -y) for x, y in top]], dtype=float)
+
+
+def add_polygons(component, corners, layer):
+    """Inserts a (N, M, 2) array of polygon corners (um) into `component` in one pass."""
+    shapes = kdb_cell_of(component).shapes(gf.get_layer(layer))
+    for polygon in corners.tolist():
+        shapes.insert(kf.kdb.DPolygon([kf.kdb.DPoint(x, y) for x, y in polygon]))
+
+
+@gf.cell
 def gcR_alld_highNA_red (
         xin: float = 0,
         yin: float = 0,
@@ -32,7 +76,10 @@ def gcR_alld_highNA_red (
         #layer_strp=(1, 0),
         layer_excite=(10,0), # excitation layer
         ):
-    
+    """
+    Grating coupler cell, cached by @gf.cell on its full parameter set: repeated
+    calls with the same parameters return the same cell.
+    """
     c = gf.Component()
 
     
@@ -44,37 +91,10 @@ def gcR_alld_highNA_red (
     y_rect_slab_min = gc_width_grating/2 + width_brdg_sprt
     y_rect_slab_max = width_slb
     brdg_dx = 0
-    rect_post_tpr_top = c.add_polygon ( [(xin_rect_slab, y_rect_slab_min), 
-                             (xin_rect_slab, y_rect_slab_max),
-                             (xout_rect_slab, y_rect_slab_max ),
-                             (xout_rect_slab,y_rect_slab_min) ], layer=layer_rdg)
-    
-    rect_post_tpr_btm = c.add_polygon ( [(xin_rect_slab, -y_rect_slab_min), 
-                             (xin_rect_slab, -y_rect_slab_max),
-                             (xout_rect_slab,-y_rect_slab_max ),
-                             (xout_rect_slab,-y_rect_slab_min) ], layer=layer_rdg)
-    
-    comb_gc_ref = []
-    
-    for i in range(gc_n_periods):
-        # print(i)
-
-        gc_xin = xin_rect_slab+gc_excitaion_x_lft + i*gc_period
-        gc_gap_width = round((1-gc_fill_factor)*gc_period*1E3)/1E3
-
-        if (i==0):
-            gc_clad_in_x=gc_xin
-        if (i==gc_n_periods-1):
-            gc_clad_out_x=gc_xin+gc_gap_width
-
-
-
-        comb_gc_ref.append(c.add_polygon ( [(gc_xin, -gc_width_grating/2), 
-                             (gc_xin+gc_gap_width, -gc_width_grating/2),
-                             (gc_xin+gc_gap_width, gc_width_grating/2 ),
-                             (gc_xin,gc_width_grating/2) ], layer=layer_rdg)
-        )
-    
+    add_polygons(c, np.concatenate([
+        slab_rectangles(xin_rect_slab, xout_rect_slab, y_rect_slab_min, y_rect_slab_max),
+        grating_teeth(xin_rect_slab + gc_excitaion_x_lft, gc_n_periods, gc_period, gc_fill_factor, gc_width_grating),
+    ]), layer=layer_rdg)
 
     # excitation
     x_excite = gc_excitaion_x_lft + gc_excitaion_x_offgc
@@ -134,7 +154,9 @@ if __name__ == "__main__":
     gcR_alld_primitive_ref = c << gcR_alld_highNA_red()
     
 
-    c.show()  # show it in klayout
+    show(c)  # show it in klayout
     #c.show(show_ports=True)
+    viewer.flush()
+    viewer.print_stats()
     
 
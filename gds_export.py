@@ -0,0 +1,295 @@
+import hashlib
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+import kfactory as kf
+from gdsfactory.component import save_layout_options
+
+from viewer import viewer
+
+# GDSII record types used when streaming cells into a GDS file (GdsStreamWriter)
+GDS_BGNSTR = 0x0502
+GDS_STRNAME = 0x0606
+GDS_ENDSTR = 0x0700
+GDS_UNITS = 0x0305
+GDS_ENDLIB_TYPE = 0x0400
+GDS_SREF = 0x0A00
+GDS_XY = 0x1003
+GDS_ENDEL = 0x1100
+GDS_SNAME = 0x1206
+GDS_STRANS = 0x1A01
+GDS_ANGLE = 0x1C05
+GDS_ENDLIB = struct.pack(">HH", 4, GDS_ENDLIB_TYPE)
+
+
+def oas_save_options(compression_level=2, cblocks=True):
+    """
+    gdsfactory's save options switched to OASIS.
+
+    Args:
+        compression_level (int): Repetition search of the OASIS writer: 0 writes
+            every shape, 1 finds regular arrays of identical shapes (support
+            rows, comb teeth, PhC holes, GC teeth), 2+ also irregular ones.
+            Levels above 2 gave no smaller coupons and only cost time.
+        cblocks (bool): Deflate-compress each cell in a CBLOCK.
+
+    Returns:
+        kdb.SaveLayoutOptions
+    """
+    options = save_layout_options()
+    options.format = "OASIS"
+    options.oasis_compression_level = compression_level
+    options.oasis_write_cblocks = cblocks
+    options.oasis_strict_mode = True
+    return options
+
+
+def write_oas(component, oas_path, compression_level=2, cblocks=True):
+    """
+    Writes `component` as OASIS with repetitions and CBLOCK compression
+    (a merged coupon comes out about 20x smaller than its GDS).
+
+    Returns:
+        Path: oas_path.
+    """
+    oas_path = Path(oas_path)
+    component.write_gds(oas_path, save_options=oas_save_options(compression_level, cblocks))
+    print(f"OASIS saved to {oas_path}")
+    return oas_path
+
+
+def gds_record(record_type, data=b""):
+    """One GDSII record: 2-byte length, 2-byte type, payload."""
+    return struct.pack(">HH", len(data) + 4, record_type) + data
+
+
+def gds_string(text):
+    """GDSII ASCII string, NUL-padded to an even length."""
+    data = text.encode("ascii")
+    return data + b"\0" if len(data) % 2 else data
+
+
+def gds_real8(value):
+    """GDSII 8-byte real: sign bit, excess-64 base-16 exponent, 56-bit mantissa."""
+    if value == 0:
+        return bytes(8)
+    sign = 0x80 if value < 0 else 0
+    value = abs(value)
+    exponent = 64
+    while value >= 1:
+        value /= 16
+        exponent += 1
+    while value < 1 / 16:
+        value *= 16
+        exponent -= 1
+    mantissa = round(value * 2 ** 56)
+    if mantissa == 2 ** 56:
+        mantissa //= 16
+        exponent += 1
+    return bytes([sign | exponent]) + mantissa.to_bytes(7, "big")
+
+
+def reference_structure(top_name, placements):
+    """
+    GDSII structure `top_name` holding one reference per placement, encoded as
+    KLayout writes it without timestamps (gdsfactory's default).
+
+    Args:
+        top_name (str): Name of the new structure.
+        placements (list): (cell_name, angle, x, y) per reference; angle in degrees
+            about the cell origin, x/y in database units.
+    """
+    records = [
+        gds_record(GDS_BGNSTR, bytes(24)),
+        gds_record(GDS_STRNAME, gds_string(top_name)),
+    ]
+    for cell_name, angle, x, y in placements:
+        angle %= 360
+        records += [gds_record(GDS_SREF), gds_record(GDS_SNAME, gds_string(cell_name))]
+        if angle:
+            records += [gds_record(GDS_STRANS, bytes(2)), gds_record(GDS_ANGLE, gds_real8(angle))]
+        records += [gds_record(GDS_XY, struct.pack(">ii", round(x), round(y))), gds_record(GDS_ENDEL)]
+    records.append(gds_record(GDS_ENDSTR))
+    return b"".join(records)
+
+
+def gds_records(data):
+    """Yields (offset, record_type, payload) for every record of a GDSII stream."""
+    offset = 0
+    while offset < len(data):
+        length, record_type = struct.unpack_from(">HH", data, offset)
+        if length < 4:
+            raise ValueError(f"Corrupt GDSII record at byte {offset}")
+        yield offset, record_type, data[offset + 4:offset + length]
+        offset += length
+
+
+def save_rotated_variants(component, variants, base_gds=None, show=True):
+    """
+    Writes rotated copies of `component`, each as a top cell f"rotated_{name}" holding
+    one reference to the shared component (not a flattened copy).
+
+    The component is serialised once (or not at all when `base_gds` already holds
+    it) and read back once; every rotated top cell is added to that one layout and
+    each file is written with only its own top cell (and the base below it) selected.
+
+    Args:
+        component (gf.Component): The coupon to rotate.
+        variants (list): (angle, name, gds_path) per output; angles must be multiples of 90.
+        base_gds (str | Path): GDS `component` was just written to with write_gds.
+        show (bool): Send each written file to the viewer (see viewer.py).
+
+    Returns:
+        list: The written paths, in the order of `variants`.
+    """
+    if not variants:
+        return []
+    if any(angle % 90 for angle, _, _ in variants):
+        raise ValueError("save_rotated_variants only handles multiples of 90 degrees")
+
+    layout = kf.kdb.Layout()
+    if base_gds is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            layout.read(str(component.write_gds(os.path.join(tmp_dir, "base.gds"))))
+    else:
+        layout.read(str(base_gds))
+    base = layout.cell(component.name)
+    if base is None:
+        raise ValueError(f"{base_gds or 'The written GDS'} has no cell named {component.name}")
+
+    tops = []
+    for angle, name, _ in variants:
+        top_name = f"rotated_{name}"
+        if layout.has_cell(top_name):
+            raise ValueError(f"Cell {top_name} already exists next to {component.name}")
+        top = layout.create_cell(top_name)
+        top.insert(kf.kdb.CellInstArray(base.cell_index(), kf.kdb.Trans(int(angle % 360) // 90, False, 0, 0)))
+        tops.append(top)
+
+    paths = []
+    for top, (_, _, gds_path) in zip(tops, variants):
+        options = save_layout_options()
+        options.select_cell(top.cell_index())
+        layout.write(str(gds_path), options)
+        paths.append(str(gds_path))
+        print(f"GDS saved to {gds_path}")
+        if show:
+            viewer.show(Path(gds_path))
+    return paths
+
+
+class GdsStreamWriter:
+    """
+    Writes a GDS sheet cell by cell instead of assembling it in memory first.
+
+    Each add() serialises a finished component (with its sub-cells) and appends
+    its structures to the open file; with free=True the component is deleted
+    afterwards, so only the block being built is held in memory. The top cell,
+    written by close(), only holds references to the added blocks. Sub-cells
+    shared between blocks (texts and other cached cells) are written once; a
+    different cell under a name that was already written raises ValueError.
+    If the block raises, the partial file is removed.
+
+    Usage:
+        with GdsStreamWriter(path, top_name="labels") as sheet:
+            sheet.add(frame, name="frame", free=True)
+            sheet.add(labels, origin=(300, 200), free=True)
+    """
+
+    def __init__(self, gds_path, top_name):
+        self.gds_path = Path(gds_path)
+        self.top_name = top_name
+        self.placements = []
+        self.written = {}
+        self.header = None
+        self.units = None
+        # Each chunk would carry its own $$$CONTEXT_INFO$$$ structure; streamed sheets hold geometry only
+        self.save_options = save_layout_options()
+        self.save_options.write_context_info = False
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._file = open(self.gds_path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            self._tmp_dir.cleanup()
+            self.gds_path.unlink(missing_ok=True)
+
+    def add(self, component, origin=(0, 0), name=None, free=False):
+        """
+        Streams `component` into the file and places it at `origin` (um) in the top cell.
+
+        Args:
+            component (gf.Component): A finished block.
+            origin (tuple): Position of the reference in the top cell.
+            name (str): Cell name to write the block under (default: its own name).
+                Locked components (cached by @gf.cell) keep their own name.
+            free (bool): Delete `component` once it is written, unless it is locked.
+        """
+        locked = getattr(component, "locked", False)
+        own_name = component.name
+        if name and not locked:
+            component.name = name
+        try:
+            cell_name = component.name
+            chunk = Path(component.write_gds(os.path.join(self._tmp_dir.name, "cell.gds"),
+                                             save_options=self.save_options)).read_bytes()
+        finally:
+            if component.name != own_name:
+                component.name = own_name
+        self._append(chunk)
+        dbu = component.kcl.dbu
+        self.placements.append((cell_name, 0, origin[0] / dbu, origin[1] / dbu))
+        if free and not locked:
+            component.delete()
+
+    def _append(self, chunk):
+        """
+        Appends the structures of a serialised layout that are not in the file yet.
+
+        Raises:
+            ValueError: If a structure differs from the one already written under its name.
+        """
+        in_header = True
+        start = cell_name = None
+        for offset, record_type, payload in gds_records(chunk):
+            if in_header:
+                if record_type == GDS_UNITS:
+                    in_header = False
+                    if self.header is None:
+                        self.header, self.units = chunk[:offset + 4 + len(payload)], payload
+                        self._file.write(self.header)
+                    elif payload != self.units:
+                        raise ValueError("All streamed cells must use the same database units")
+            elif record_type == GDS_BGNSTR:
+                start = offset
+            elif record_type == GDS_STRNAME:
+                cell_name = payload.rstrip(b"\0").decode("ascii")
+            elif record_type == GDS_ENDSTR:
+                structure = chunk[start:offset + 4]
+                digest = hashlib.sha1(structure).hexdigest()
+                if cell_name not in self.written:
+                    self._file.write(structure)
+                    self.written[cell_name] = digest
+                elif self.written[cell_name] != digest:
+                    raise ValueError(f"A different cell named {cell_name} was already written to {self.gds_path}")
+
+    def close(self):
+        """Writes the top cell and ENDLIB and closes the file."""
+        if self._file.closed:
+            return
+        if self.header is None:
+            raise ValueError(f"Nothing was added to {self.gds_path}")
+        if self.top_name in self.written:
+            raise ValueError(f"Top cell name {self.top_name} is already used by a streamed cell")
+        self._file.write(reference_structure(self.top_name, self.placements))
+        self._file.write(GDS_ENDLIB)
+        self._file.close()
+        self._tmp_dir.cleanup()
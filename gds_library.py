@@ -0,0 +1,634 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import gdsfactory as gf
+import kfactory as kf
+import numpy as np
+
+from boolean_ops import union_all
+
+RESONATOR_FOLDER = "Selected Resonators to FAB"
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def ports_sidecar(gds_path):
+    """Sidecar file holding the inferred ports of `gds_path` (QT10.gds -> QT10.ports.json)."""
+    return Path(gds_path).with_suffix(".ports.json")
+
+
+# Nominal (o1, o2) waveguide widths in um of the resonator exports, at the inset
+# infer_ports() measures them at. A <stem>_dil<bias> export is expected to be
+# 2 * bias wider.
+RESONATOR_WIDTHS = {
+    "QT10": (0.54, 0.55),
+    "QT14": (0.42, 0.95),
+    "QT14_v1": (0.42, 0.97),
+    "QT14s": (0.42, 0.92),
+    "QT14s1": (0.25, 0.25),
+    "QT17": (0.54, 0.57),
+    "QT18": (0.45, 0.57),
+    "QT20": (0.50, 0.53),
+}
+
+
+def expected_widths(gds_path):
+    """(o1, o2) widths in um `gds_path` should have by RESONATOR_WIDTHS, or None if it is not listed."""
+    stem = Path(gds_path).stem
+    base, _, bias = stem.rpartition("_dil")
+    if base in RESONATOR_WIDTHS:
+        try:
+            return tuple(w + 2 * float(bias) * 1e-3 for w in RESONATOR_WIDTHS[base])
+        except ValueError:
+            pass
+    return RESONATOR_WIDTHS.get(stem)
+
+
+def infer_ports(gds_path, layer=(1, 0), widths=None, inset=0.05, tolerance=0.02, snap=0.01):
+    """
+    Finds the waveguide ends of a resonator from its geometry.
+
+    o1 (facing left) and o2 (facing right) sit on the left and right edge of
+    the merged `layer` bbox, on its symmetry axis (the bbox centre snapped to
+    `snap` um, so the few nm of asymmetry of the dilated exports do not move the
+    ports). The width is that of the layer `inset` um inside each end, past the
+    10 nm stubs and rounded corners at the very ends, rounded to an even number
+    of database units.
+
+    Args:
+        gds_path (str | Path): Resonator GDS.
+        layer (tuple): Waveguide layer.
+        widths (tuple): Expected (o1, o2) widths in um; a measured width further
+            than `tolerance` from it raises ValueError.
+        inset (float): Distance from the ends the width is measured at, in um.
+        tolerance (float): Allowed deviation from `widths`, in um.
+        snap (float): Grid the port centres are snapped to, in um.
+
+    Returns:
+        dict: {"o1": {"center": [x, y], "width": w, "orientation": 180}, "o2": {...}} in um.
+    """
+    layout = kf.kdb.Layout()
+    options = kf.kdb.LoadLayoutOptions()
+    options.warn_level = 0
+    layout.read(str(gds_path), options)
+    top = layout.top_cells()[0]
+    region = kf.kdb.Region(top.begin_shapes_rec(layout.layer(*layer))).merged()
+    if region.is_empty():
+        raise ValueError(f"{gds_path} has no shapes on layer {layer}")
+
+    dbu = layout.dbu
+    box = region.bbox()
+    y = round(box.center().y * dbu / snap) * snap
+    d = round(inset / dbu)
+    ports = {}
+    for i, (name, x, probe_x, orientation) in enumerate((("o1", box.left, box.left + d, 180),
+                                                         ("o2", box.right, box.right - d, 0))):
+        cut = (region & kf.kdb.Region(kf.kdb.Box(probe_x - 1, box.bottom, probe_x + 1, box.top))).bbox()
+        width = round(max(2, 2 * round(cut.height() / 2)) * dbu, 6)
+        if widths is not None and abs(width - widths[i]) > tolerance:
+            raise ValueError(f"{gds_path}: {name} is {width:.3f} um wide {inset} um from the end, "
+                             f"expected {widths[i]:.3f} +- {tolerance} um")
+        ports[name] = {
+            "center": [round(x * dbu, 6), round(y, 6)],
+            "width": width,
+            "orientation": orientation,
+        }
+    return ports
+
+
+def write_ports_sidecar(gds_path, layer=(1, 0), widths=None):
+    """
+    Infers the ports of `gds_path` on `layer` and records them, with the sha1 of
+    the GDS, in its sidecar file (other layers already in the sidecar are kept).
+
+    Args:
+        gds_path (str | Path): Resonator GDS.
+        layer (tuple): Waveguide layer.
+        widths (tuple): Expected (o1, o2) widths in um (default: expected_widths()).
+
+    Returns:
+        dict: The inferred ports.
+    """
+    sidecar = ports_sidecar(gds_path)
+    sha1 = file_sha1(gds_path)
+    data = json.loads(sidecar.read_text()) if sidecar.exists() else {}
+    if data.get("sha1") != sha1:
+        data = {"sha1": sha1, "ports": {}}
+    ports = infer_ports(gds_path, layer=layer, widths=widths or expected_widths(gds_path))
+    data["ports"][f"{layer[0]}/{layer[1]}"] = ports
+    sidecar.write_text(json.dumps(data, indent=1) + "\n")
+    return ports
+
+
+def write_port_sidecars(folder=RESONATOR_FOLDER, pattern="QT*.gds", layer=(1, 0)):
+    """Library-build step: writes the port sidecar of every GDS of `folder` matching `pattern`. Returns the number of files."""
+    paths = sorted(Path(folder).glob(pattern))
+    for gds_path in paths:
+        if expected_widths(gds_path) is None:
+            raise ValueError(f"No nominal widths for {gds_path.name}; add its stem to RESONATOR_WIDTHS")
+        write_ports_sidecar(gds_path, layer=layer)
+    print(f"Port sidecars: {len(paths)} files in {folder}")
+    return len(paths)
+
+
+def resonator_ports(gds_path, layer=(1, 0)):
+    """
+    Ports of `gds_path` on `layer`, read from its sidecar file.
+
+    The sidecar records the sha1 of the GDS it was inferred from. Sidecars are
+    written by the library build (python gds_library.py) and never at run time:
+    a missing sidecar, a missing layer or a changed GDS raises.
+    """
+    sidecar = ports_sidecar(gds_path)
+    if not sidecar.exists():
+        raise FileNotFoundError(f"{sidecar} is missing; generate it with python gds_library.py")
+    data = json.loads(sidecar.read_text())
+    if data.get("sha1") != file_sha1(gds_path):
+        raise ValueError(f"{sidecar} is stale ({gds_path} changed); regenerate it with python gds_library.py")
+    key = f"{layer[0]}/{layer[1]}"
+    if key not in data["ports"]:
+        raise KeyError(f"{sidecar} has no ports on layer {key}; regenerate it with python gds_library.py")
+    return data["ports"][key]
+
+
+class ResonatorStore:
+    """
+    Pre-parsed, memory-mapped store of the resonator GDS files.
+
+    build() flattens the resonator GDS files into two NumPy arrays shared by
+    all files (vertices: int32 (V, 2) in database units, offsets: int64 start of
+    each polygon) plus index.json with, per file (keyed by its path relative to
+    the store directory), the cell name, bbox, inferred ports, sha1/size/mtime of
+    the source and the polygon range of each layer. Loading memory-maps the arrays
+    and builds a resonator only when it is asked for, passing each polygon's
+    vertex rows to kdb.Polygon as they are; a source file that changed since the build is reported as stale and
+    imported from GDS instead.
+    """
+
+    def __init__(self, directory=os.path.join("build", "resonator_library")):
+        self.directory = Path(directory)
+        self._index = None
+        self._vertices = None
+        self._offsets = None
+
+    # --- building ---
+    def build(self, folder=RESONATOR_FOLDER, pattern="QT*.gds"):
+        """Converts the GDS files of `folder` matching `pattern` into the store. Returns the number of files."""
+        vertices = []
+        offsets = [0]
+        entries = {}
+        for gds_path in sorted(Path(folder).glob(pattern)):
+            layout = kf.kdb.Layout()
+            layout.read(str(gds_path))
+            top = layout.top_cells()[0]
+            layers = {}
+            for layer_index in layout.layer_indexes():
+                info = layout.get_info(layer_index)
+                first = len(offsets) - 1
+                for polygon in kf.kdb.Region(top.begin_shapes_rec(layer_index)).each():
+                    if polygon.holes():
+                        polygon = polygon.resolved_holes()
+                    points = np.array([(p.x, p.y) for p in polygon.each_point_hull()], dtype=np.int32)
+                    vertices.append(points)
+                    offsets.append(offsets[-1] + len(points))
+                if len(offsets) - 1 > first:
+                    layers[f"{info.layer}/{info.datatype}"] = [first, len(offsets) - 1]
+
+            box = top.dbbox()
+            stat = gds_path.stat()
+            entries[self.key(gds_path)] = {
+                "name": gds_path.stem,
+                "cell": top.name,
+                "dbu": layout.dbu,
+                "sha1": file_sha1(gds_path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "bbox": [box.left, box.bottom, box.right, box.top],
+                "ports": resonator_ports(gds_path),
+                "layers": layers,
+            }
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        np.save(self.directory / "vertices.npy", np.concatenate(vertices) if vertices else np.zeros((0, 2), np.int32))
+        np.save(self.directory / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+        (self.directory / "index.json").write_text(json.dumps(entries, indent=1))
+        self._index = self._vertices = self._offsets = None
+        return len(entries)
+
+    def key(self, gds_path):
+        """
+        Index key of `gds_path`: its path relative to the store directory, so an index
+        built in one checkout stays valid when the repo is moved or cloned elsewhere.
+        """
+        return Path(os.path.relpath(Path(gds_path).resolve(), self.directory.resolve())).as_posix()
+
+    # --- loading ---
+    @property
+    def index(self):
+        if self._index is None:
+            path = self.directory / "index.json"
+            self._index = json.loads(path.read_text()) if path.exists() else {}
+        return self._index
+
+    def lookup(self, gds_path):
+        """Index entry of `gds_path` if it is in the store and the file did not change, else None."""
+        path = Path(gds_path).resolve()
+        entry = self.index.get(self.key(path))
+        if entry is None:
+            return None
+        stat = path.stat()
+        if stat.st_size != entry["size"] or (stat.st_mtime_ns != entry["mtime_ns"] and file_sha1(path) != entry["sha1"]):
+            print(f"⚠️ Resonator library entry for {path.name} is stale, importing the GDS (rebuild with gds_library.py)")
+            return None
+        return entry
+
+    def load(self, gds_path):
+        """Component with the stored polygons of `gds_path` (flat), or None if not in the store / stale."""
+        entry = self.lookup(gds_path)
+        if entry is None:
+            return None
+        if self._vertices is None:
+            self._vertices = np.load(self.directory / "vertices.npy", mmap_mode="r")
+            self._offsets = np.load(self.directory / "offsets.npy", mmap_mode="r")
+
+        scale = entry["dbu"] / kf.kcl.dbu
+        c = gf.Component()
+        for layer, (first, last) in entry["layers"].items():
+            region = kf.kdb.Region()
+            starts = self._offsets[first:last + 1].tolist()
+            for start, end in zip(starts[:-1], starts[1:]):
+                region.insert(kf.kdb.Polygon(self._vertices[start:end].tolist(), True))
+            if scale != 1:
+                region.transform(kf.kdb.ICplxTrans(scale))
+            c.shapes(gf.get_layer(tuple(int(v) for v in layer.split("/")))).insert(region)
+        return c
+
+
+def build_resonator_library(folder=RESONATOR_FOLDER, directory=os.path.join("build", "resonator_library"), pattern="QT*.gds"):
+    """Library-build step: pre-parses the resonators of `folder` into a ResonatorStore under `directory`."""
+    n = ResonatorStore(directory).build(folder, pattern=pattern)
+    print(f"Resonator library: {n} files from {folder} stored in {directory}")
+    return n
+
+
+class GdsImportCache:
+    """
+    Process-wide cache of imported GDS files.
+
+    Entries are keyed by resolved path plus file mtime and size, so an edited or
+    regenerated file is re-imported while unchanged ones are read once per process.
+    Ported wrappers (ports at the waveguide ends, from the sidecar) are cached per port
+    spec as well, so callers never add ports to a shared cell twice. Files found
+    (and up to date) in the ResonatorStore are loaded from it instead of parsed.
+    `used` collects the path of every file asked for (hit or miss) and of the
+    port sidecars read for it, so a build step can record which files it
+    depended on.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._imports = {}
+        self._ported = {}
+        self._prefixed = {}
+        self._prefixed_names = set()
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self.store_loads = 0
+        self.import_seconds = 0.0
+
+    def key(self, gds_path):
+        path = Path(gds_path).resolve()
+        stat = path.stat()
+        return str(path), stat.st_mtime_ns, stat.st_size
+
+    def import_gds(self, gds_path):
+        """gf.import_gds(gds_path), imported once per file version. Do not modify the result."""
+        key = self.key(gds_path)
+        self.used.add(key[0])
+        if key in self._imports:
+            self.hits += 1
+            return self._imports[key]
+
+        t0 = time.perf_counter()
+        component = self.store.load(gds_path) if self.store is not None else None
+        if component is not None:
+            self.store_loads += 1
+        else:
+            component = gf.import_gds(Path(gds_path))
+        self.import_seconds += time.perf_counter() - t0
+        self.misses += 1
+        self._imports[key] = component
+        return component
+
+    def import_ported(self, gds_path, width=None, layer=(1, 0), merged=False, name=None):
+        """
+        Imported GDS wrapped in a cell with ports o1 (facing left) and o2 (facing
+        right) at the waveguide ends found by infer_ports(), read from the
+        resonator's sidecar file.
+
+        Args:
+            gds_path (str | Path): GDS file to import.
+            width (float): Port width (default: the inferred width).
+            layer (tuple): Port layer (and the layer kept when `merged`).
+            merged (bool): Keep only `layer`, merged into plain polygons
+                (what gf.boolean(A=raw, B=raw, operation="or") gave before).
+            name (str): Optional name of the wrapper cell.
+
+        Returns:
+            gf.Component: The cached wrapper. Do not modify it.
+        """
+        key = (self.key(gds_path), width, tuple(layer), merged, name)
+        self.used.add(key[0][0])
+        if key in self._ported:
+            self.hits += 1
+            self.used.add(str(ports_sidecar(key[0][0])))
+            return self._ported[key]
+
+        imported = self.import_gds(gds_path)
+        if merged:
+            wrapper = union_all(imported, layer=layer, name=name)
+        else:
+            wrapper = gf.Component(name=name) if name else gf.Component()
+            wrapper.add_ref(imported)
+        for port_name, port in resonator_ports(gds_path, layer=layer).items():
+            wrapper.add_port(
+                name=port_name,
+                center=tuple(port["center"]),
+                width=width or port["width"],
+                orientation=port["orientation"],
+                layer=layer,
+            )
+        self.used.add(str(ports_sidecar(key[0][0])))
+        self._ported[key] = wrapper
+        return wrapper
+
+    def import_prefixed(self, gds_path, prefix):
+        """
+        Imports `gds_path` with every cell renamed to f"{prefix}__{name}" (deduplicated
+        with a __2, __3, ... suffix against the cells of the file, the cells already in
+        kf.kcl and the names given by earlier prefixed imports) so it cannot collide with
+        cells already in the layout (e.g. several files with a TOP cell). Renaming happens in memory on a
+        scratch layout; nothing is written to disk. Cached per (file, prefix).
+
+        Returns:
+            gf.Component: The cached component. Do not modify it.
+        """
+        key = (self.key(gds_path), prefix)
+        self.used.add(key[0][0])
+        if key in self._prefixed:
+            self.hits += 1
+            return self._prefixed[key]
+
+        t0 = time.perf_counter()
+        layout = kf.kdb.Layout()
+        options = kf.kdb.LoadLayoutOptions()
+        options.warn_level = 0
+        layout.read(str(Path(gds_path)), options)
+        used = set()
+        for cell in layout.each_cell():
+            base = f"{prefix}__{cell.name}"
+            name = base
+            i = 1
+            while name in used or name in self._prefixed_names or kf.kcl.has_cell(name):
+                i += 1
+                name = f"{base}__{i}"
+            used.add(name)
+            cell.name = name
+        self._prefixed_names |= used
+
+        top = layout.top_cells()[0]
+        component = gf.Component()
+        kdb_cell = component.kdb_cell if hasattr(component, "kdb_cell") else component._kdb_cell
+        kdb_cell.copy_tree(top)
+        component.name = top.name
+
+        self.import_seconds += time.perf_counter() - t0
+        self.misses += 1
+        self._prefixed[key] = component
+        return component
+
+    def clear(self):
+        self._imports.clear()
+        self._ported.clear()
+        self._prefixed.clear()
+        self.used.clear()
+        self.hits = self.misses = self.store_loads = 0
+        self.import_seconds = 0.0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        per_import = self.import_seconds / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "files": len(set(self._imports) | {key for key, _ in self._prefixed}),
+            "store_loads": self.store_loads,
+            "import_seconds": self.import_seconds,
+            "saved_seconds": self.hits * per_import,
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"GDS import cache: {s['hits']} hits, {s['misses']} misses ({s['hit_rate']:.0%}), "
+              f"{s['files']} files ({s['store_loads']} from the resonator library), "
+              f"{s['import_seconds']:.2f} s importing, ~{s['saved_seconds']:.2f} s saved")
+
+
+gds_cache = GdsImportCache(store=ResonatorStore())
+
+
+def import_gds_cached(gds_path):
+    """Shortcut for gds_cache.import_gds()."""
+    return gds_cache.import_gds(gds_path)
+
+
+def import_ported(gds_path, width=None, layer=(1, 0), merged=False, name=None):
+    """Shortcut for gds_cache.import_ported()."""
+    return gds_cache.import_ported(gds_path, width=width, layer=layer, merged=merged, name=name)
+
+
+def import_prefixed(gds_path, prefix):
+    """Shortcut for gds_cache.import_prefixed()."""
+    return gds_cache.import_prefixed(gds_path, prefix)
+
+
+def _dilate_task(task):
+    """
+    Worker: writes `gds_path` with `layer` sized by `bias_nm` to `out_path`, and
+    the port sidecar of `out_path` (widths checked against the base ones + 2 * bias).
+
+    Args:
+        task (tuple): (gds_path, bias_nm, layer, mode, out_path) with plain types
+            so it pickles into a worker process.
+
+    Returns:
+        str: out_path.
+    """
+    gds_path, bias_nm, layer, mode, out_path = task
+    layout = kf.kdb.Layout()
+    options = kf.kdb.LoadLayoutOptions()
+    options.warn_level = 0
+    layout.read(str(gds_path), options)
+    top = layout.top_cells()[0]
+
+    out = kf.kdb.Layout()
+    out.dbu = layout.dbu
+    cell = out.create_cell(Path(out_path).stem)
+    d = round(bias_nm * 1e-3 / layout.dbu)
+    for layer_index in layout.layer_indexes():
+        info = layout.get_info(layer_index)
+        region = kf.kdb.Region(top.begin_shapes_rec(layer_index))
+        if (info.layer, info.datatype) == tuple(layer):
+            region = region.sized(d, d, mode)
+        cell.shapes(out.layer(info.layer, info.datatype)).insert(region)
+
+    # Write to a temp name first so an interrupted run never leaves a truncated cache entry
+    tmp_path = f"{out_path}.{os.getpid()}.tmp.gds"
+    out.write(tmp_path)
+    os.replace(tmp_path, out_path)
+
+    base_ports = resonator_ports(gds_path, layer=layer)
+    widths = tuple(base_ports[name]["width"] + 2 * bias_nm * 1e-3 for name in ("o1", "o2"))
+    write_ports_sidecar(out_path, layer=layer, widths=widths)
+    return str(out_path)
+
+
+class DilationCache:
+    """
+    On-demand dilated (or eroded) resonators for biases that were never hand-exported.
+
+    A reviewed export <stem>_dil<bias>.gds next to the base GDS is always used
+    as is (the QT10/17/18/20 exports are not pure offsets of the current base
+    files, so regenerating them would change fabricated geometry), unless the
+    cache is created with use_exported=False.
+
+    For any other bias dilate() sizes `layer` of the base GDS with KLayout's
+    default corner handling (mode 2: acute corners are cut off at the offset
+    distance, which is what the QT14_dil5/dil10 exports were made with) and
+    writes the result once to
+    `directory`/<sha1 of the base>_<layer>_m<mode>/<stem>_dil<bias>.gds,
+    together with its port sidecar. The file name keeps the <stem>_dil<bias> form, so chip labels derived from
+    it do not change; a changed base file gets a new sha1 and is re-dilated.
+    Negative biases erode.
+    """
+
+    def __init__(self, directory=os.path.join("build", "dilation_cache"), mode=2, use_exported=True):
+        self.directory = Path(directory)
+        self.mode = mode
+        self.use_exported = use_exported
+        self._sha1 = {}
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, gds_path, bias_nm, layer=(1, 0)):
+        """Cache file of `gds_path` dilated by `bias_nm` on `layer` (may not exist yet)."""
+        path = Path(gds_path).resolve()
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        if key not in self._sha1:
+            self._sha1[key] = file_sha1(path)
+        folder = f"{self._sha1[key][:12]}_{layer[0]}-{layer[1]}_m{self.mode}"
+        return self.directory / folder / f"{path.stem}_dil{bias_nm:g}.gds"
+
+    def exported(self, gds_path, bias_nm):
+        """The hand-exported <stem>_dil<bias>.gds next to `gds_path`, or None if there is none (or use_exported is off)."""
+        if not self.use_exported:
+            return None
+        path = Path(gds_path)
+        exported = path.with_name(f"{path.stem}_dil{bias_nm:g}{path.suffix}")
+        return str(exported) if exported.exists() else None
+
+    def dilate(self, gds_path, bias_nm, layer=(1, 0)):
+        """
+        Path of `gds_path` with `layer` grown by `bias_nm` (shrunk if negative).
+
+        Args:
+            gds_path (str | Path): Base resonator GDS.
+            bias_nm (float): Bias in nm, rounded to the database unit of the file.
+            layer (tuple): Layer to size; other layers are copied unchanged.
+
+        Returns:
+            str: The base path for a zero bias, the exported GDS if there is one,
+                else the cached dilated GDS.
+        """
+        if bias_nm == 0:
+            return str(gds_path)
+        exported = self.exported(gds_path, bias_nm)
+        if exported is not None:
+            return exported
+        out_path = self.path(gds_path, bias_nm, layer)
+        if out_path.exists() and ports_sidecar(out_path).exists():
+            self.hits += 1
+            return str(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        self.misses += 1
+        return _dilate_task((str(gds_path), bias_nm, tuple(layer), self.mode, str(out_path)))
+
+    def series(self, gds_path, biases, layer=(1, 0), processes=None):
+        """
+        Dilates `gds_path` by every bias of `biases`, computing the missing ones in a process pool.
+
+        Args:
+            gds_path (str | Path): Base resonator GDS.
+            biases (iterable): Biases in nm.
+            layer (tuple): Layer to size.
+            processes (int): Number of worker processes (default: all cores).
+
+        Returns:
+            dict: {bias_nm: path}, as dilate() would return them.
+        """
+        paths = {}
+        tasks = []
+        for bias_nm in biases:
+            if bias_nm == 0:
+                paths[bias_nm] = str(gds_path)
+                continue
+            exported = self.exported(gds_path, bias_nm)
+            if exported is not None:
+                paths[bias_nm] = exported
+                continue
+            out_path = self.path(gds_path, bias_nm, layer)
+            paths[bias_nm] = str(out_path)
+            if out_path.exists() and ports_sidecar(out_path).exists():
+                self.hits += 1
+            else:
+                out_path.parent.mkdir(parents=True, exist_ok=True)
+                tasks.append((str(gds_path), bias_nm, tuple(layer), self.mode, str(out_path)))
+
+        self.misses += len(tasks)
+        if len(tasks) == 1:
+            _dilate_task(tasks[0])
+        elif tasks:
+            with ProcessPoolExecutor(max_workers=min(len(tasks), processes or os.cpu_count() or 1)) as pool:
+                list(pool.map(_dilate_task, tasks))
+        return paths
+
+
+dilation_cache = DilationCache()
+
+
+def dilated_gds(gds_path, bias_nm, layer=(1, 0)):
+    """Shortcut for dilation_cache.dilate()."""
+    return dilation_cache.dilate(gds_path, bias_nm, layer=layer)
+
+
+def dilate_series(gds_path, biases, layer=(1, 0), processes=None):
+    """Shortcut for dilation_cache.series()."""
+    return dilation_cache.series(gds_path, biases, layer=layer, processes=processes)
+
+
+if __name__ == "__main__":
+    write_port_sidecars()
+    build_resonator_library()
@@ -0,0 +1,88 @@
+import hashlib
+
+import kfactory as kf
+
+from boolean_ops import fingerprint_region
+
+
+def kdb_cell_of(component):
+    """The underlying kdb.Cell (`kdb_cell` in gdsfactory 9, `_kdb_cell` before)."""
+    return component.kdb_cell if hasattr(component, "kdb_cell") else component._kdb_cell
+
+
+def geometry_fingerprint(component):
+    """
+    Content hash of the flattened geometry of `component` on every layer, taken
+    relative to the lower-left corner of its bounding box, so that copies which
+    only differ by a translation hash alike.
+
+    Returns:
+        tuple: (sha1 hex digest, lower-left corner as kdb.Vector in database units).
+    """
+    kdb_cell = kdb_cell_of(component)
+    layout = kdb_cell.layout()
+    box = kdb_cell.bbox()
+    to_origin = kf.kdb.Trans(-box.left, -box.bottom)
+    h = hashlib.sha1()
+    for layer_index in sorted(layout.layer_indexes()):
+        region = kf.kdb.Region(kdb_cell.begin_shapes_rec(layer_index))
+        if region.is_empty():
+            continue
+        info = layout.get_info(layer_index)
+        h.update(f"{info.layer}/{info.datatype}:{fingerprint_region(region.transformed(to_origin))};".encode())
+    return h.hexdigest(), kf.kdb.Vector(box.left, box.bottom)
+
+
+class CellDeduper:
+    """
+    Places components into `parent` as references, sharing one cell between all
+    components with the same geometry (see geometry_fingerprint).
+
+    A second row built from the same resonator file at another y offset is
+    therefore stored once and referenced twice, instead of being flattened into
+    the coupon as a full copy of its polygons. Duplicates that are not locked
+    (not cached by @gf.cell) are deleted once they are placed. With flatten=True
+    every placed reference is flattened as before, for callers that need plain
+    shapes in `parent`.
+    """
+
+    def __init__(self, parent, flatten=False):
+        self.parent = parent
+        self.flatten = flatten
+        self.cells = {}
+        self.placed = 0
+        self.shared = 0
+
+    def add(self, component, dx=0, dy=0):
+        """
+        Adds `component` to the parent, moved by (dx, dy) um.
+
+        Returns:
+            The reference, at the position a reference to `component` itself would
+            have (or None when flattened).
+        """
+        key, origin = geometry_fingerprint(component)
+        self.placed += 1
+        if key in self.cells:
+            cell, cell_origin = self.cells[key]
+            self.shared += 1
+            if not getattr(component, "locked", False):
+                component.delete()
+        else:
+            cell, cell_origin = self.cells[key] = (component, origin)
+
+        dbu = kdb_cell_of(self.parent).layout().dbu
+        shift = origin - cell_origin
+        ref = self.parent.add_ref(cell)
+        ref.dmove((shift.x * dbu + dx, shift.y * dbu + dy))
+        if self.flatten:
+            ref.flatten()
+            return None
+        return ref
+
+    def stats(self):
+        return {"placed": self.placed, "cells": len(self.cells), "shared": self.shared}
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"Hierarchy: {s['placed']} rows placed as {s['cells']} cells ({s['shared']} shared references)")
@@ -0,0 +1,145 @@
+import csv
+import importlib.util
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import gdsfactory as gf
+import kfactory as kf
+
+from hierarchy import kdb_cell_of
+
+# Generator scripts loaded by the current (worker) process, keyed by path
+_modules = {}
+
+
+def parameter_grid(grid):
+    """
+    Every combination of the values in `grid`.
+
+    Args:
+        grid (dict): parameter name -> list of values. List-valued parameters
+            (taper_factors) are given as a list of lists.
+
+    Returns:
+        list: One parameter dict per variant, the last parameter varying fastest.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def load_generator(source, function):
+    """
+    `function` from the script at `source`, loaded once per process. Scripts such
+    as 1D_PhC.py cannot be imported by name, so they are loaded from their path.
+    """
+    source = os.path.abspath(source)
+    module = _modules.get(source)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(f"sweep_{Path(source).stem}", source)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[source] = module
+    return getattr(module, function)
+
+
+def _build_variant(task):
+    """
+    Worker: builds one variant and returns its flattened geometry.
+
+    Each worker process keeps its own gdsfactory cell cache, so the hole, taper and
+    support cells are built once per process and reused by all its variants.
+
+    Args:
+        task (tuple): (source, function, params).
+
+    Returns:
+        dict: {(layer, datatype): [polygon strings]} in database units.
+    """
+    source, function, params = task
+    component = load_generator(source, function)(**params)
+    kdb_cell = kdb_cell_of(component)
+    layout = kdb_cell.layout()
+    geometry = {}
+    for layer_index in layout.layer_indexes():
+        region = kf.kdb.Region(kdb_cell.begin_shapes_rec(layer_index))
+        if not region.is_empty():
+            info = layout.get_info(layer_index)
+            geometry[(info.layer, info.datatype)] = [p.to_s() for p in region.each()]
+    return geometry
+
+
+def label_text(index, params, varied):
+    """Label of a variant: its index and the values of the swept parameters."""
+    values = " ".join(f"{name}={params[name]}" for name in varied if not isinstance(params[name], (list, tuple)))
+    return f"{index} {values}".strip()
+
+
+def run_sweep(source, function, grid, gds_path, csv_path=None, columns=None, spacing=10, label_size=2,
+              label_layer=(1, 0), processes=None, name="sweep"):
+    """
+    Builds every variant of a generator over a parameter grid in a process pool and
+    writes them as a labelled matrix into one GDS, with a CSV index.
+
+    Args:
+        source (str): Path of the script defining the generator.
+        function (str): Name of the generator; called with each parameter dict.
+        grid (dict | list): Parameter grid (see parameter_grid) or a list of parameter dicts.
+        gds_path (str): Output GDS.
+        csv_path (str): CSV index of variant -> cell and position (default: next to gds_path).
+        columns (int): Variants per matrix row (default: about square).
+        spacing (float): Gap between matrix cells (um).
+        label_size (float): Text size of the variant labels (um); 0 disables them.
+        label_layer (tuple): Layer of the labels.
+        processes (int): Worker processes (default: all cores).
+        name (str): Name of the top cell; variant cells are f"{name}_{index:03d}".
+
+    Returns:
+        gf.Component: The sweep matrix.
+    """
+    variants = grid if isinstance(grid, list) else parameter_grid(grid)
+    varied = [key for key, values in grid.items() if len(values) > 1] if isinstance(grid, dict) else []
+    csv_path = csv_path or os.path.splitext(gds_path)[0] + ".csv"
+
+    tasks = [(source, function, params) for params in variants]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        geometries = list(pool.map(_build_variant, tasks))
+
+    top = gf.Component(name=name)
+    layout = kdb_cell_of(top).layout()
+    dbu = layout.dbu
+    cells = []
+    for index, geometry in enumerate(geometries):
+        cell = layout.create_cell(f"{name}_{index:03d}")
+        for (layer, datatype), polygons in geometry.items():
+            cell.shapes(layout.layer(layer, datatype)).insert(kf.kdb.Region([kf.kdb.Polygon.from_s(p) for p in polygons]))
+        cells.append(cell)
+
+    columns = columns or math.ceil(math.sqrt(len(cells)))
+    pitch_x = round(max(cell.bbox().width() for cell in cells) * dbu + spacing, 3)
+    pitch_y = round(max(cell.bbox().height() for cell in cells) * dbu + spacing + 2 * label_size, 3)
+
+    rows = []
+    for index, (cell, params) in enumerate(zip(cells, variants)):
+        x = round((index % columns) * pitch_x, 3)
+        y = round(-(index // columns) * pitch_y, 3)
+        box = cell.bbox()
+        disp = kf.kdb.Vector(round(x / dbu) - box.left, round(y / dbu) - box.bottom)
+        kdb_cell_of(top).insert(kf.kdb.CellInstArray(cell.cell_index(), kf.kdb.Trans(disp)))
+        if label_size:
+            label = top.add_ref(gf.components.text(text=label_text(index, params, varied), size=label_size, layer=label_layer))
+            label.dmove((x, y - 1.5 * label_size))
+        rows.append({"index": index, "cell": cell.name, "x": x, "y": y,
+                     **{key: json.dumps(value) if isinstance(value, (list, tuple)) else value for key, value in params.items()}})
+
+    top.write_gds(gds_path)
+    print(f"GDS saved to {gds_path}")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Sweep index saved to {csv_path} ({len(rows)} variants)")
+    return top
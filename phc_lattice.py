@@ -0,0 +1,82 @@
+import gdsfactory as gf
+import kfactory as kf
+import numpy as np
+
+from hierarchy import kdb_cell_of
+
+
+def triangular_lattice_centres(a, nx, ny, shifts=(), skip_rows=(0,)):
+    """
+    Hole centres of a triangular lattice with columns i in [-nx, nx] and rows j in [-ny, ny].
+
+    Args:
+        a (float): Lattice constant (um).
+        nx, ny (int): Half extent of the lattice in columns and rows.
+        shifts (sequence): Outward shift of columns |i| = 1, 2, ... (um), the
+            cavity of a line-defect L3-type design.
+        skip_rows (sequence): Rows left empty (the line defect).
+
+    Returns:
+        np.ndarray: (N, 2) array of centres (um), row by row as the loops used to place them.
+    """
+    i = np.arange(-nx, nx + 1)
+    j = np.setdiff1d(np.arange(-ny, ny + 1), skip_rows)
+    x = i * float(a)
+    shifts = np.asarray(shifts, dtype=float)
+    shifted = (np.abs(i) >= 1) & (np.abs(i) <= len(shifts))
+    x[shifted] += shifts[np.abs(i[shifted]) - 1] * np.sign(i[shifted])
+    y = j * a * np.sqrt(3) / 2
+    xx, yy = np.meshgrid(x, y, indexing="ij")
+    return np.column_stack([xx.ravel(), yy.ravel()])
+
+
+def chain_centres(periods, x0=0.0):
+    """
+    Centres of holes placed one per period along x, each in the middle of its period
+    (the mirror/taper sections of a nanobeam given by its a_list).
+
+    Returns:
+        np.ndarray: (N, 2) array of centres (um).
+    """
+    periods = np.asarray(periods, dtype=float)
+    edges = x0 + np.concatenate([[0.0], np.cumsum(periods)])
+    return np.column_stack([edges[:-1] + periods / 2, np.zeros(len(periods))])
+
+
+def add_holes(component, centres, radius, layer=(1, 0), offset=(0, 0), as_instances=True):
+    """
+    Places one circle per centre into `component`.
+
+    A single circle cell is built and either referenced once per centre
+    (as_instances=True, cell instances inserted directly in KLayout) or copied
+    as a translated polygon (as_instances=False). Both avoid building and moving
+    one gdsfactory reference per hole, so 1e5-hole lattices take well under a
+    second. Centres are snapped to the database grid, rounding halves away from
+    zero as KLayout does for a moved reference.
+
+    Args:
+        component (gf.Component): Component to add the holes to.
+        centres (np.ndarray): (N, 2) hole centres (um).
+        radius (float): Hole radius (um).
+        layer (tuple): Layer of the holes.
+        offset (tuple): Added to every centre (um).
+        as_instances (bool): Reference the circle cell instead of copying its polygon.
+
+    Returns:
+        gf.Component: The circle cell.
+    """
+    hole = gf.components.circle(radius=radius, layer=layer)
+    kdb_cell = kdb_cell_of(component)
+    dbu = kdb_cell.layout().dbu
+    centres = (np.asarray(centres, dtype=float).reshape(-1, 2) + offset) * (1 / dbu)
+    centres = (np.sign(centres) * np.floor(np.abs(centres) + 0.5)).astype(np.int64)
+
+    if as_instances:
+        hole_index = kdb_cell_of(hole).cell_index()
+        for x, y in centres.tolist():
+            kdb_cell.insert(kf.kdb.CellInstArray(hole_index, kf.kdb.Trans(x, y)))
+    else:
+        layer_index = gf.get_layer(layer)
+        shape = next(iter(kf.kdb.Region(kdb_cell_of(hole).begin_shapes_rec(layer_index)).each()))
+        kdb_cell.shapes(layer_index).insert(kf.kdb.Region([shape.moved(x, y) for x, y in centres.tolist()]))
+    return hole
@@ -6,6 +6,8 @@ import gdstk
 import gdsfactory as gf
 
 from MDM3_23_Nov_2025_GC import gcR_alld_highNA_red
+from boolean_ops import clearance_trench
+from gds_library import import_prefixed
 
 
 # =========================
@@ -22,22 +24,6 @@ LAYER = (1, 0)
 def _uid(tag: str) -> str:
     return f"{tag}_{uuid.uuid4().hex[:8]}"
 
-def sanitize_gds_cellnames(input_gds: Path, output_gds: Path, prefix: str) -> Path:
-    """Prefix all cell names to avoid TOP collisions in kfactory."""
-    lib = gdstk.read_gds(str(input_gds))
-    used = set()
-    for cell in lib.cells:
-        base = f"{prefix}__{cell.name}"
-        name = base
-        i = 1
-        while name in used:
-            i += 1
-            name = f"{base}__{i}"
-        used.add(name)
-        cell.name = name
-    lib.write_gds(str(output_gds))
-    return output_gds
-
 def extend_gc_clearance_in_tmp(c_tmp: gf.Component, gc_ref) -> gf.Component | object:
     """
     GC already has clearance, but may be missing extent to reach TARGET_CLEAR.
@@ -141,11 +127,8 @@ def build_clearance_row_qt(qt_gds: Path, prefix: str) -> gf.Component:
     row = gf.Component(_uid(f"ROW_{prefix}"))
     c_tmp = gf.Component(_uid(f"TMP_{prefix}"))
 
-    # import QT with safe cellnames
-    qt_s = qt_gds.with_name(f"_san_{qt_gds.stem}_{uuid.uuid4().hex[:6]}.gds")
-    sanitize_gds_cellnames(qt_gds, qt_s, prefix=prefix)
-
-    dev = gf.import_gds(qt_s)
+    # import QT with safe cellnames (prefixed in memory, no temp file)
+    dev = import_prefixed(qt_gds, prefix=prefix)
     dev_ref = c_tmp.add_ref(dev)
 
     # device bbox
@@ -249,64 +232,29 @@ def build_clearance_row_90deg_down(R=20.0) -> gf.Component:
         mat_comp.add_polygon(p.points, layer=LAYER)
     mat_ref = c_tmp.add_ref(mat_comp)
 
-    # =========================
-    # Clearance path (FlexPath)
-    # =========================
-    clr_comp = gf.Component(_uid("CLR_FP"))
-    clr_fp = gdstk.FlexPath(pts, TARGET_CLEAR, bend_radius=R)
-    for p in clr_fp.to_polygons():
-        clr_comp.add_polygon(p.points, layer=LAYER)
-    clr_ref = c_tmp.add_ref(clr_comp)
-
     # =========================
     # Stem into right GC (material)
     # =========================
     end_x = x0 + Lx + R
     end_y = y0 - R - Ly
 
+    material = [mat_ref]
     if STEM_LEN > 0:
         stem_mat = gf.components.rectangle(size=(WG_WIDTH, STEM_LEN))
         stem_mat_ref = c_tmp.add_ref(stem_mat)
         stem_mat_ref.move((end_x - WG_WIDTH / 2, end_y))
+        material.append(stem_mat_ref)
 
-        mat_u = gf.boolean(
-            A=mat_ref,
-            B=stem_mat_ref,
-            operation="or",
-            layer=LAYER,
-        )
-
-        # =========================
-        # Stem into right GC (clearance)
-        # =========================
-
-        stem_clr = gf.components.rectangle(size=(TARGET_CLEAR, STEM_LEN))
-        stem_clr_ref = c_tmp.add_ref(stem_clr)
-        stem_clr_ref.move((end_x - TARGET_CLEAR / 2, end_y))
-
-        clr_u = gf.boolean(
-            A=clr_ref,
-            B=stem_clr_ref,
-            operation="or",
-            layer=LAYER,
-        )
-
-        # =========================
-        # Trench = clearance - material
-        # =========================
-        trench = gf.boolean(
-            A=clr_u,
-            B=mat_u,
-            operation="A-B",
-            layer=LAYER,
-        )
-    else:
-        trench = gf.boolean(
-            A=clr_ref,
-            B=mat_ref,
-            operation="A-B",
-            layer=LAYER,
-        )
+    # =========================
+    # Trench = offset(material) - material
+    # clipped at the two ports so the round caps stay out of the GCs
+    # =========================
+    trench = clearance_trench(
+        material,
+        clearance=(TARGET_CLEAR - WG_WIDTH) / 2,
+        layer=LAYER,
+        clip=gf.kdb.DBox(x0, end_y, end_x + TARGET_CLEAR / 2, y0 + TARGET_CLEAR / 2),
+    )
 
     # =========================
     # Right GC (rotated DOWN)
@@ -0,0 +1,90 @@
+import gdsfactory as gf
+import kfactory as kf
+import numpy as np
+
+from hierarchy import kdb_cell_of
+
+
+def path_samples(points, spacing, margin=0.0):
+    """
+    Evenly spaced stations along a polyline, by path length.
+
+    The stations are `spacing` apart and centred on the path, none closer than
+    `margin` to either end, so the pattern is symmetric whatever the length.
+
+    Args:
+        points (np.ndarray): (N, 2) polyline, e.g. gf.Path.points (um).
+        spacing (float): Path length between stations (um).
+        margin (float): Minimum path length between the ends and the first/last station (um).
+
+    Returns:
+        tuple: (M, 2) positions (um) and (M,) tangent angles (degrees).
+    """
+    points = np.asarray(points, dtype=float)
+    steps = np.diff(points, axis=0)
+    keep = np.hypot(steps[:, 0], steps[:, 1]) > 0
+    steps = steps[keep]
+    points = np.vstack([points[:1], points[1:][keep]])
+    s = np.concatenate([[0.0], np.cumsum(np.hypot(steps[:, 0], steps[:, 1]))])
+
+    usable = s[-1] - 2 * margin
+    if usable < 0:
+        return np.empty((0, 2)), np.empty(0)
+    count = int(np.floor(usable / spacing + 1e-9)) + 1
+    stations = (s[-1] - (count - 1) * spacing) / 2 + spacing * np.arange(count)
+
+    positions = np.column_stack([np.interp(stations, s, points[:, 0]), np.interp(stations, s, points[:, 1])])
+    segment = np.clip(np.searchsorted(s, stations, side="right") - 1, 0, len(steps) - 1)
+    angles = np.degrees(np.arctan2(steps[segment, 1], steps[segment, 0]))
+    return positions, angles
+
+
+@gf.cell
+def cross_support(width=0.5, support_width=0.6, support_length=3, layer=(1, 0)) -> gf.Component:
+    """
+    The four support tapers around one support point, merged into a single cell.
+
+    The waveguide runs along x through the origin. Along the waveguide the tapers
+    narrow from `width` at +-support_length to `support_width` at the origin;
+    across it they start at +-width and narrow to `support_width` over `support_length`.
+    """
+    c = gf.Component()
+    taper = gf.components.taper(length=support_length, width1=width, width2=support_width, layer=layer)
+    layer_index = gf.get_layer(layer)
+    dbu = kdb_cell_of(c).layout().dbu
+    shape = kf.kdb.Region(kdb_cell_of(taper).begin_shapes_rec(layer_index))
+
+    region = kf.kdb.Region()
+    for angle, x, y in ((90, 0, width), (270, 0, -width), (0, -support_length, 0), (180, support_length, 0)):
+        region.insert(shape.transformed(kf.kdb.ICplxTrans(1, angle, False, round(x / dbu), round(y / dbu))))
+    c.shapes(layer_index).insert(region.merged())
+    return c
+
+
+def place_supports(component, support, positions, angles):
+    """
+    References `support` once per position, rotated to the local tangent.
+
+    Args:
+        component (gf.Component): Component to add the references to.
+        support (gf.Component): The support cell, e.g. cross_support().
+        positions (np.ndarray): (M, 2) positions (um).
+        angles (np.ndarray): (M,) rotations (degrees).
+    """
+    kdb_cell = kdb_cell_of(component)
+    support_index = kdb_cell_of(support).cell_index()
+    for (x, y), angle in zip(np.asarray(positions).tolist(), np.asarray(angles).tolist()):
+        kdb_cell.insert(kf.kdb.DCellInstArray(support_index, kf.kdb.DCplxTrans(1, angle, False, x, y)))
+
+
+def add_supports_along_path(component, points, spacing, support, margin=0.0, offset=(0, 0)):
+    """
+    Samples `points` every `spacing` um of path length (see path_samples) and places
+    `support` at each station.
+
+    Returns:
+        int: Number of supports placed.
+    """
+    positions, angles = path_samples(points, spacing, margin=margin)
+    place_supports(component, support, positions + np.asarray(offset, dtype=float), angles)
+    return len(positions)
@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import gdsfactory as gf
+
+VIEWER_ENV = "PYLAYOUT_VIEWER"
+VIEWER_MODES = ("show", "defer", "off")
+
+
+def default_mode():
+    """
+    Viewer mode from $PYLAYOUT_VIEWER ("show", "defer" or "off"). Without it, Linux
+    sessions with no display (the build box) run with "off", everything else "show".
+    """
+    mode = os.environ.get(VIEWER_ENV, "").strip().lower()
+    if mode:
+        if mode not in VIEWER_MODES:
+            print(f"⚠️ Warning: unknown {VIEWER_ENV}={mode!r}, expected one of {VIEWER_MODES}; using 'show'")
+            return "show"
+        return mode
+    if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        return "off"
+    return "show"
+
+
+class Viewer:
+    """
+    Single entry point for sending layouts to KLayout.
+
+    Every show() serialises the whole layout and ships it to klive. In "show"
+    mode calls go through as before and their time is recorded; in "defer" mode
+    only the last call is kept and flush() shows it once at the end; in "off"
+    mode (headless batch builds) calls are dropped. The seconds a skipped call
+    would have cost are estimated from the mean show time of earlier interactive
+    runs, kept in `stats_path`.
+    """
+
+    def __init__(self, mode=None, stats_path=os.path.join("build", "viewer_stats.json")):
+        self.mode = mode or default_mode()
+        self.stats_path = Path(stats_path)
+        self._pending = None
+        self.shown = 0
+        self.skipped = 0
+        self.show_seconds = 0.0
+
+    def show(self, layout):
+        """Shows a gf.Component (or a GDS/OASIS path) according to the mode."""
+        if self.mode == "show":
+            self._send(layout)
+        elif self.mode == "defer":
+            if self._pending is not None:
+                self.skipped += 1
+            self._pending = layout
+        else:
+            self.skipped += 1
+
+    def flush(self):
+        """Shows the last deferred layout, if any."""
+        if self._pending is not None:
+            layout, self._pending = self._pending, None
+            self._send(layout, record=False)
+
+    def _send(self, layout, record=True):
+        t0 = time.perf_counter()
+        if isinstance(layout, (str, Path)):
+            gf.show(Path(layout))
+        else:
+            layout.show()
+        dt = time.perf_counter() - t0
+        self.shown += 1
+        self.show_seconds += dt
+        if record:
+            self._record(dt)
+
+    def _record(self, seconds):
+        stats = self._load_stats()
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        try:
+            self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+            self.stats_path.write_text(json.dumps(stats))
+        except OSError:
+            pass
+
+    def _load_stats(self):
+        try:
+            stats = json.loads(self.stats_path.read_text())
+            return {"calls": int(stats["calls"]), "seconds": float(stats["seconds"])}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {"calls": 0, "seconds": 0.0}
+
+    def stats(self):
+        history = self._load_stats()
+        per_show = history["seconds"] / history["calls"] if history["calls"] else None
+        return {
+            "mode": self.mode,
+            "shown": self.shown,
+            "skipped": self.skipped,
+            "show_seconds": self.show_seconds,
+            "saved_seconds": self.skipped * per_show if per_show is not None else None,
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        saved = f"~{s['saved_seconds']:.2f} s saved" if s["saved_seconds"] is not None else "no interactive timing yet to estimate the time saved"
+        print(f"Viewer ({s['mode']}): {s['shown']} shown in {s['show_seconds']:.2f} s, {s['skipped']} skipped, {saved}")
+
+
+viewer = Viewer()
+
+
+def show(layout):
+    """Shortcut for viewer.show()."""
+    viewer.show(layout)